@@ -0,0 +1,112 @@
+import argparse
+import asyncio
+import json
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+
+def _usar_mongomock(banco):
+    # precisa acontecer antes de importar as rotas, que fazem "from config import db"
+    from mongomock_motor import AsyncMongoMockClient
+    import config
+
+    config.client = AsyncMongoMockClient()
+    config.db = config.db_consultas = config.db_lote = config.client[banco]
+
+
+def _usar_banco(banco):
+    # mesmas opções de leitura/escrita da aplicação, mas na base do benchmark
+    import config
+
+    config.db = config.client.get_database(banco, write_concern=config.db.write_concern)
+    config.db_consultas = config.client.get_database(banco, read_preference=config.db_consultas.read_preference)
+    config.db_lote = config.client.get_database(banco, write_concern=config.db_lote.write_concern)
+
+
+async def _semear(argumentos):
+    from config import db
+    from bench.semente import semear
+
+    quantidades = await semear(db, argumentos.escala, argumentos.tamanho_lote, limpar=argumentos.limpar)
+    print(json.dumps(quantidades))
+
+
+async def _carga(argumentos):
+    import httpx
+    from config import db
+    from bench.carga import executar_carga, salvar_resultado
+
+    if argumentos.semear:
+        from bench.semente import semear
+        await semear(db, argumentos.escala, argumentos.tamanho_lote, limpar=argumentos.limpar)
+
+    if argumentos.url:
+        transporte, url_base = None, argumentos.url
+    else:
+        from main import app
+        # exceções da app viram 500 e contam como erro do endpoint, como num servidor de verdade
+        transporte, url_base = httpx.ASGITransport(app=app, raise_app_exceptions=False), "http://bench"
+
+    resultado = await executar_carga(db, transporte, url_base, argumentos.requisicoes, argumentos.concorrencia,
+                                     argumentos.endpoint, argumentos.escala)
+    print(f"resultado salvo em {salvar_resultado(resultado, argumentos.saida)}")
+
+
+def _comparar(argumentos):
+    from bench.carga import comparar
+
+    anterior = json.loads(Path(argumentos.anterior).read_text())
+    atual = json.loads(Path(argumentos.atual).read_text())
+    print(f"{anterior['commit']} -> {atual['commit']}")
+    for nome, metrica, antes, depois, variacao in comparar(anterior, atual):
+        print(f"{nome:32} {metrica:15} {antes:>10} -> {depois:>10} ({variacao:+}%)")
+
+
+def main():
+    from config import BENCH_BANCO
+
+    parser = argparse.ArgumentParser(prog="python -m bench", description="Benchmark da API de gestão de roupas")
+    parser.add_argument("--mongomock", action="store_true", help="usa mongomock-motor em vez do MONGO_URI")
+    parser.add_argument("--banco", default=BENCH_BANCO, help="base usada pelo benchmark (padrão: BENCH_BANCO)")
+    comandos = parser.add_subparsers(dest="comando", required=True)
+
+    semear = comandos.add_parser("semear", help="popula a base com dados sintéticos")
+    semear.add_argument("--escala", type=int, default=10000, help="número de pedidos (10k a 10M)")
+    semear.add_argument("--tamanho-lote", type=int, default=10000)
+    semear.add_argument("--limpar", action="store_true", help="apaga as coleções da base antes de semear")
+
+    carga = comandos.add_parser("carga", help="mede latência e throughput de cada endpoint")
+    carga.add_argument("--url", help="URL de um servidor em execução (apontando para a mesma --banco); "
+                                     "sem ela a app roda em processo")
+    carga.add_argument("--requisicoes", type=int, default=200, help="requisições por endpoint")
+    carga.add_argument("--concorrencia", type=int, default=20)
+    carga.add_argument("--endpoint", help="mede só os endpoints cujo nome contém este texto")
+    carga.add_argument("--semear", action="store_true", help="popula a base antes de medir")
+    carga.add_argument("--escala", type=int, default=10000)
+    carga.add_argument("--tamanho-lote", type=int, default=10000)
+    carga.add_argument("--limpar", action="store_true", help="com --semear, apaga as coleções da base antes")
+    carga.add_argument("--saida", help="arquivo JSON de saída (padrão: bench/resultados/)")
+
+    comparar = comandos.add_parser("comparar", help="compara dois resultados salvos")
+    comparar.add_argument("anterior")
+    comparar.add_argument("atual")
+
+    argumentos = parser.parse_args()
+
+    if argumentos.mongomock:
+        _usar_mongomock(argumentos.banco)
+    else:
+        _usar_banco(argumentos.banco)
+
+    if argumentos.comando == "semear":
+        asyncio.run(_semear(argumentos))
+    elif argumentos.comando == "carga":
+        asyncio.run(_carga(argumentos))
+    else:
+        _comparar(argumentos)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+import asyncio
+import json
+import subprocess
+import time
+from datetime import datetime
+from pathlib import Path
+
+import httpx
+
+DIRETORIO_RESULTADOS = Path(__file__).parent / "resultados"
+
+CLIENTE = {
+    "nome": "Cliente Bench", "cpf": "99999999999", "telefone": "11900000000", "email": "bench@exemplo.com",
+    "endereco": {"rua": "Rua A", "numero": 1, "cep": "00000-000", "cidade": "São Paulo", "estado": "SP"},
+}
+PEDIDO = {"data": "2024-06-01T12:00:00", "status": "pendente", "valor_total": 100.0, "cliente_id": "{cliente_id}"}
+
+# (nome, método, caminho, corpo); {cliente_id}, {roupa_id}, ... são trocados por ids reais da base, também no corpo.
+# As escritas ficam por último para as leituras medirem a base recém-semeada
+ENDPOINTS = [
+    ("listar_clientes", "GET", "/clientes/?limit=10", None),
+    ("listar_clientes_cursor", "GET", "/clientes/?paginacao=cursor&limit=10&contar_total=false", None),
+    ("obter_cliente", "GET", "/clientes/cliente/{cliente_id}", None),
+    ("filtrar_clientes", "GET", "/clientes/filter?nome=cliente 1", None),
+    ("contar_clientes", "GET", "/clientes/count", None),
+    ("listar_fornecedores", "GET", "/fornecedores/?limit=10", None),
+    ("obter_fornecedor", "GET", "/fornecedores/fornecedor/{fornecedor_id}", None),
+    ("filtrar_fornecedores", "GET", "/fornecedores/filter?cidade=sao", None),
+    ("listar_roupas", "GET", "/roupas/?limit=10", None),
+    ("obter_roupa", "GET", "/roupas/roupa/{roupa_id}", None),
+    ("filtrar_roupas", "GET", "/roupas/filter?nome=camisa", None),
+    ("contar_roupas", "GET", "/roupas/count", None),
+    ("listar_pedidos", "GET", "/pedidos/?limit=10", None),
+    ("listar_pedidos_cursor", "GET", "/pedidos/?paginacao=cursor&limit=10&contar_total=false", None),
+    ("obter_pedido", "GET", "/pedidos/pedido/{pedido_id}", None),
+    ("filtrar_pedidos", "GET", "/pedidos/filter?status=pago", None),
+    ("listar_itens_pedidos", "GET", "/itensPedidos/?limit=10", None),
+    ("obter_item_pedido", "GET", "/itensPedidos/item/{item_id}", None),
+    ("itens_por_pedido", "GET", "/consultas/itensPedidoPorPedido/{pedido_id}", None),
+    ("buscar_roupas_por_nome", "GET", "/consultas/search/roupas?nome=cal", None),
+    ("pedidos_por_ano", "GET", "/consultas/pedidosPorAno?ano=2023", None),
+    ("contagem_pedidos_por_status", "GET", "/consultas/contagemPedidosPorStatus", None),
+    ("contar_pedidos_por_cliente", "GET", "/consultas/contarPedidosPorCliente", None),
+    ("total_pedidos_por_cliente", "GET", "/consultas/totalPedidosPorCliente", None),
+    ("roupas_ordenadas_por_preco", "GET", "/consultas/roupasOrdenadasPorPreco", None),
+    ("pedidos_com_itens", "GET", "/consultas/pedidosComItens?limit=20", None),
+    ("roupas_por_fornecedor", "GET", "/consultas/listarRoupasPorFornecedor/{fornecedor_id}", None),
+    ("itens_vendidos_por_roupa", "GET", "/consultas/itens_vendidos_por_roupa", None),
+    ("criar_cliente", "POST", "/clientes/", CLIENTE),
+    ("atualizar_cliente", "PATCH", "/clientes/{cliente_id}", {"telefone": "11999999999"}),
+    ("criar_clientes_em_lote", "POST", "/clientes/bulk", [CLIENTE] * 10),
+    ("criar_pedido", "POST", "/pedidos/", PEDIDO),
+    ("atualizar_pedido", "PATCH", "/pedidos/{pedido_id}", {"status": "enviado"}),
+    ("criar_pedido_completo", "POST", "/pedidos/completo", {
+        "data": PEDIDO["data"], "status": "pendente", "cliente_id": "{cliente_id}",
+        "itens": [{"roupa_id": "{roupa_id}", "quantidade": 2}],
+    }),
+    ("criar_item_pedido", "POST", "/itensPedidos/", {
+        "pedido_id": "{pedido_id}", "roupa_id": "{roupa_id}", "quantidade": 1, "preco_unitario": 50.0, "subtotal": 50.0,
+    }),
+]
+
+
+async def ids_de_exemplo(db):
+    ids = {}
+    for chave, colecao in [("cliente_id", "clientes"), ("fornecedor_id", "fornecedores"), ("roupa_id", "roupas"),
+                           ("pedido_id", "pedidos"), ("item_id", "itens_pedidos")]:
+        documento = await db[colecao].find_one({}, {"_id": 1})
+        ids[chave] = str(documento["_id"]) if documento else "000000000000000000000000"
+    return ids
+
+
+def _preencher(corpo, ids):
+    if isinstance(corpo, str):
+        return corpo.format(**ids)
+    if isinstance(corpo, list):
+        return [_preencher(valor, ids) for valor in corpo]
+    if isinstance(corpo, dict):
+        return {campo: _preencher(valor, ids) for campo, valor in corpo.items()}
+    return corpo
+
+
+def _percentil(ordenadas, percentil):
+    if not ordenadas:
+        return None
+    posicao = min(len(ordenadas) - 1, max(0, round(percentil / 100 * len(ordenadas)) - 1))
+    return round(ordenadas[posicao] * 1000, 3)
+
+
+async def medir(cliente, metodo, caminho, requisicoes, concorrencia, corpo=None):
+    latencias, erros = [], 0
+    restantes = iter(range(requisicoes))
+
+    async def trabalhador():
+        nonlocal erros
+        for _ in restantes:
+            inicio = time.perf_counter()
+            try:
+                resposta = await cliente.request(metodo, caminho, json=corpo)
+                if resposta.status_code >= 400:
+                    erros += 1
+            except httpx.HTTPError:
+                erros += 1
+            latencias.append(time.perf_counter() - inicio)
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(trabalhador() for _ in range(concorrencia)))
+    duracao = time.perf_counter() - inicio
+
+    latencias.sort()
+    return {
+        "requisicoes": requisicoes,
+        "erros": erros,
+        "p50_ms": _percentil(latencias, 50),
+        "p95_ms": _percentil(latencias, 95),
+        "p99_ms": _percentil(latencias, 99),
+        "media_ms": round(sum(latencias) / len(latencias) * 1000, 3) if latencias else None,
+        "throughput_rps": round(requisicoes / duracao, 2) if duracao else None,
+    }
+
+
+def _commit_atual():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+
+async def executar_carga(db, transporte, url_base, requisicoes, concorrencia, filtro=None, escala=None):
+    ids = await ids_de_exemplo(db)
+    resultados = {}
+
+    async with httpx.AsyncClient(transport=transporte, base_url=url_base, timeout=60) as cliente:
+        for nome, metodo, caminho, corpo in ENDPOINTS:
+            if filtro and filtro not in nome:
+                continue
+            resultados[nome] = await medir(
+                cliente, metodo, caminho.format(**ids), requisicoes, concorrencia, _preencher(corpo, ids)
+            )
+            print(f"{nome:32} p50={resultados[nome]['p50_ms']}ms p95={resultados[nome]['p95_ms']}ms "
+                  f"p99={resultados[nome]['p99_ms']}ms {resultados[nome]['throughput_rps']} req/s "
+                  f"erros={resultados[nome]['erros']}")
+
+    return {
+        "commit": _commit_atual(),
+        "data": datetime.now().isoformat(timespec="seconds"),
+        "escala": escala,
+        "requisicoes": requisicoes,
+        "concorrencia": concorrencia,
+        "endpoints": resultados,
+    }
+
+
+def salvar_resultado(resultado, caminho=None):
+    if caminho is None:
+        DIRETORIO_RESULTADOS.mkdir(parents=True, exist_ok=True)
+        carimbo = resultado["data"].replace(":", "").replace("-", "")
+        caminho = DIRETORIO_RESULTADOS / f"{carimbo}_{resultado['commit'] or 'sem-commit'}.json"
+
+    Path(caminho).write_text(json.dumps(resultado, indent=2, ensure_ascii=False))
+    return caminho
+
+
+def comparar(anterior, atual):
+    linhas = []
+    for nome, metricas in atual["endpoints"].items():
+        base = anterior["endpoints"].get(nome)
+        if not base:
+            continue
+        for metrica in ("p50_ms", "p95_ms", "p99_ms", "throughput_rps"):
+            if base[metrica] and metricas[metrica] is not None:
+                variacao = (metricas[metrica] - base[metrica]) / base[metrica] * 100
+                linhas.append((nome, metrica, base[metrica], metricas[metrica], round(variacao, 1)))
+    return linhas
@@ -0,0 +1,104 @@
+import random
+from datetime import datetime, timedelta
+from bson import ObjectId
+from services.agregados import reconstruir_agregados
+from services.busca import campos_busca
+from services.indices import criar_indices
+
+STATUS = ["pendente", "pago", "enviado", "entregue", "cancelado"]
+TAMANHOS = ["PP", "P", "M", "G", "GG"]
+CORES = ["azul", "preto", "branco", "vermelho", "verde", "cinza", "bege"]
+PECAS = ["Camisa", "Camiseta", "Calça", "Bermuda", "Vestido", "Saia", "Jaqueta", "Moletom", "Blusa"]
+CIDADES = [("São Paulo", "SP"), ("Rio de Janeiro", "RJ"), ("Belo Horizonte", "MG"), ("Curitiba", "PR"), ("Recife", "PE")]
+
+
+def _proporcoes(escala):
+    # a escala é o número de pedidos; o resto do catálogo cresce junto
+    return {
+        "fornecedores": max(1, escala // 1000),
+        "roupas": max(1, escala // 100),
+        "clientes": max(1, escala // 10),
+        "pedidos": escala,
+    }
+
+
+async def _inserir(colecao, documentos):
+    if documentos:
+        await colecao.insert_many(documentos, ordered=False)
+
+
+async def semear(db, escala, tamanho_lote=10000, semente=42, limpar=False):
+    aleatorio = random.Random(semente)
+    quantidades = _proporcoes(escala)
+
+    if limpar:
+        for colecao in ("fornecedores", "roupas", "clientes", "pedidos", "itens_pedidos"):
+            await db[colecao].delete_many({})
+
+    fornecedores = []
+    for i in range(quantidades["fornecedores"]):
+        cidade, _ = aleatorio.choice(CIDADES)
+        fornecedor = {"_id": ObjectId(), "nome": f"Fornecedor {i}", "telefone": f"11{i:08d}",
+                      "email": f"fornecedor{i}@exemplo.com", "cidade": cidade, "frete": round(aleatorio.uniform(5, 50), 2)}
+        fornecedor["busca"] = campos_busca("fornecedores", fornecedor)
+        fornecedores.append(fornecedor)
+    await _inserir(db.fornecedores, fornecedores)
+    ids_fornecedores = [str(fornecedor["_id"]) for fornecedor in fornecedores]
+
+    roupas, precos = [], {}
+    for i in range(quantidades["roupas"]):
+        roupa = {"_id": ObjectId(), "nome": f"{aleatorio.choice(PECAS)} {i}", "tamanho": aleatorio.choice(TAMANHOS),
+                 "cor": aleatorio.choice(CORES), "preco": round(aleatorio.uniform(20, 400), 2),
+                 "fornecedor_id": aleatorio.choice(ids_fornecedores)}
+        roupa["busca"] = campos_busca("roupas", roupa)
+        precos[str(roupa["_id"])] = roupa["preco"]
+        roupas.append(roupa)
+        if len(roupas) >= tamanho_lote:
+            await _inserir(db.roupas, roupas)
+            roupas = []
+    await _inserir(db.roupas, roupas)
+    ids_roupas = list(precos)
+
+    clientes, ids_clientes = [], []
+    for i in range(quantidades["clientes"]):
+        cidade, estado = aleatorio.choice(CIDADES)
+        cliente = {"_id": ObjectId(), "nome": f"Cliente {i}", "cpf": f"{i:011d}", "telefone": f"21{i:08d}",
+                   "email": f"cliente{i}@exemplo.com",
+                   "endereco": {"rua": "Rua A", "numero": i % 1000, "cep": "00000-000", "cidade": cidade, "estado": estado}}
+        cliente["busca"] = campos_busca("clientes", cliente)
+        ids_clientes.append(str(cliente["_id"]))
+        clientes.append(cliente)
+        if len(clientes) >= tamanho_lote:
+            await _inserir(db.clientes, clientes)
+            clientes = []
+    await _inserir(db.clientes, clientes)
+
+    inicio = datetime(2020, 1, 1)
+    pedidos, itens = [], []
+    for _ in range(quantidades["pedidos"]):
+        pedido_id = ObjectId()
+        linhas = []
+        for _ in range(aleatorio.randint(1, 5)):
+            roupa_id = aleatorio.choice(ids_roupas)
+            quantidade = aleatorio.randint(1, 3)
+            linhas.append({"_id": ObjectId(), "pedido_id": str(pedido_id), "roupa_id": roupa_id, "quantidade": quantidade,
+                           "preco_unitario": precos[roupa_id], "subtotal": round(precos[roupa_id] * quantidade, 2)})
+
+        pedido = {"_id": pedido_id, "data": inicio + timedelta(minutes=aleatorio.randint(0, 6 * 365 * 24 * 60)),
+                  "status": aleatorio.choice(STATUS), "valor_total": round(sum(linha["subtotal"] for linha in linhas), 2),
+                  "cliente_id": aleatorio.choice(ids_clientes)}
+        pedido["busca"] = campos_busca("pedidos", pedido)
+        pedidos.append(pedido)
+        itens.extend(linhas)
+
+        if len(pedidos) >= tamanho_lote:
+            await _inserir(db.pedidos, pedidos)
+            await _inserir(db.itens_pedidos, itens)
+            pedidos, itens = [], []
+    await _inserir(db.pedidos, pedidos)
+    await _inserir(db.itens_pedidos, itens)
+
+    await criar_indices(db)
+    await reconstruir_agregados(db)
+
+    return quantidades
@@ -1,11 +1,113 @@
 from motor.motor_asyncio import AsyncIOMotorClient
 import os
 from dotenv import load_dotenv
+from pymongo import ReadPreference
+from pymongo.write_concern import WriteConcern
+from services.metricas import OuvinteComandos, OuvintePool
 
 load_dotenv("db.env")
 
 MONGO_URI = os.getenv("MONGO_URI")
+NOME_BANCO = "gestao_roupas"
+# o benchmark semeia e escreve numa base própria, nunca na da aplicação
+BENCH_BANCO = os.getenv("BENCH_BANCO", "gestao_roupas_bench")
 
-client = AsyncIOMotorClient(MONGO_URI)
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", "100"))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", "0")) or None  # 0 = sem limite
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", "30000"))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "20000"))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", "0")) or None
+# zstd exige o pacote "zstandard" e snappy o "python-snappy"; compressores ausentes são ignorados pelo driver
+MONGO_COMPRESSORS = os.getenv("MONGO_COMPRESSORS", "")
 
-db = client["gestao_roupas"]
\ No newline at end of file
+# primary | primaryPreferred | secondary | secondaryPreferred | nearest
+READ_PREFERENCE_CONSULTAS = os.getenv("READ_PREFERENCE_CONSULTAS", "primary")
+
+WRITE_CONCERN_W = os.getenv("WRITE_CONCERN_W", "1")
+WRITE_CONCERN_J = os.getenv("WRITE_CONCERN_J", "false").lower() == "true"
+WRITE_CONCERN_WTIMEOUT_MS = int(os.getenv("WRITE_CONCERN_WTIMEOUT_MS", "0")) or None
+WRITE_CONCERN_LOTE_W = os.getenv("WRITE_CONCERN_LOTE_W", WRITE_CONCERN_W)
+
+BULK_TAMANHO_LOTE = int(os.getenv("BULK_TAMANHO_LOTE", "1000"))
+
+MODO_ITENS = os.getenv("MODO_ITENS", "colecao")  # colecao | embutido
+ITENS_POR_PEDIDO_MAXIMO = int(os.getenv("ITENS_POR_PEDIDO_MAXIMO", "200"))
+
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memoria")  # memoria | redis
+CACHE_TTL = int(os.getenv("CACHE_TTL", "60"))
+CACHE_CAPACIDADE = int(os.getenv("CACHE_CAPACIDADE", "1024"))
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "100"))
+
+# feed de eventos via change streams: exige replica set (um nó basta: mongod --replSet rs0 e rs.initiate())
+EVENTOS_ATIVOS = os.getenv("EVENTOS_ATIVOS", "false").lower() == "true"
+EVENTOS_FILA_MAXIMA = int(os.getenv("EVENTOS_FILA_MAXIMA", "1000"))
+EVENTOS_HEARTBEAT_S = float(os.getenv("EVENTOS_HEARTBEAT_S", "15"))
+
+# orçamento por requisição: maxTimeMS (via pymongo.timeout), teto de skip/limit e consultas pesadas simultâneas
+ORCAMENTO_CRUD_MS = int(os.getenv("ORCAMENTO_CRUD_MS", "2000"))
+ORCAMENTO_CONSULTA_MS = int(os.getenv("ORCAMENTO_CONSULTA_MS", "10000"))
+ORCAMENTO_LIMIT_MAXIMO = int(os.getenv("ORCAMENTO_LIMIT_MAXIMO", "100"))
+ORCAMENTO_SKIP_MAXIMO = int(os.getenv("ORCAMENTO_SKIP_MAXIMO", "10000"))
+CONSULTAS_CONCORRENTES = int(os.getenv("CONSULTAS_CONCORRENTES", "8"))
+CONSULTAS_ESPERA_S = float(os.getenv("CONSULTAS_ESPERA_S", "2"))
+
+# jobs de consultas pesadas: workers asyncio no processo da API, resultados em blocos com TTL
+JOBS_WORKERS = int(os.getenv("JOBS_WORKERS", "2"))
+JOBS_TAMANHO_BLOCO = int(os.getenv("JOBS_TAMANHO_BLOCO", "100"))
+JOBS_TTL_S = int(os.getenv("JOBS_TTL_S", "3600"))
+JOBS_JANELA_REUSO_S = int(os.getenv("JOBS_JANELA_REUSO_S", "300"))
+JOBS_LEASE_S = int(os.getenv("JOBS_LEASE_S", "60"))
+
+# arquivamento: pedidos mais antigos que a idade e em status final saem da coleção quente
+ARQUIVO_IDADE_DIAS = int(os.getenv("ARQUIVO_IDADE_DIAS", "365"))
+ARQUIVO_STATUS = tuple(status.strip() for status in os.getenv("ARQUIVO_STATUS", "entregue,cancelado").split(","))
+
+# "comprados juntos": vizinhos guardados por roupa em roupas_relacionadas
+RELACIONADAS_TOP_K = int(os.getenv("RELACIONADAS_TOP_K", "20"))
+
+# métricas RFM/LTV por cliente: pedidos lidos por lote e horizonte da projeção de LTV
+RFM_TAMANHO_LOTE = int(os.getenv("RFM_TAMANHO_LOTE", "50000"))
+RFM_HORIZONTE_ANOS = float(os.getenv("RFM_HORIZONTE_ANOS", "3"))
+
+# "true" volta a passar as respostas do CRUD pelo response_model (útil em desenvolvimento)
+VALIDAR_RESPOSTAS = os.getenv("VALIDAR_RESPOSTAS", "false").lower() == "true"
+
+READ_PREFERENCES = {
+    "primary": ReadPreference.PRIMARY,
+    "primaryPreferred": ReadPreference.PRIMARY_PREFERRED,
+    "secondary": ReadPreference.SECONDARY,
+    "secondaryPreferred": ReadPreference.SECONDARY_PREFERRED,
+    "nearest": ReadPreference.NEAREST,
+}
+
+
+def write_concern(w, j=WRITE_CONCERN_J):
+    return WriteConcern(w=int(w) if w.isdigit() else w, j=j or None, wtimeout=WRITE_CONCERN_WTIMEOUT_MS)
+
+
+def _opcoes_cliente():
+    opcoes = {
+        "maxPoolSize": MONGO_MAX_POOL_SIZE,
+        "minPoolSize": MONGO_MIN_POOL_SIZE,
+        "maxIdleTimeMS": MONGO_MAX_IDLE_TIME_MS,
+        "serverSelectionTimeoutMS": MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        "connectTimeoutMS": MONGO_CONNECT_TIMEOUT_MS,
+        "waitQueueTimeoutMS": MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        "event_listeners": [OuvinteComandos(SLOW_QUERY_MS), OuvintePool()],
+    }
+    if MONGO_COMPRESSORS:
+        opcoes["compressors"] = MONGO_COMPRESSORS
+    return opcoes
+
+
+# o Motor só abre conexões na primeira operação; o lifespan do main.py aquece e fecha o pool
+client = AsyncIOMotorClient(MONGO_URI, **_opcoes_cliente())
+
+db = client.get_database(NOME_BANCO, write_concern=write_concern(WRITE_CONCERN_W))
+# consultas analíticas podem ler de secundários; CRUD continua lendo do primário
+db_consultas = client.get_database(NOME_BANCO, read_preference=READ_PREFERENCES[READ_PREFERENCE_CONSULTAS])
+# cargas em lote podem trocar durabilidade por vazão (ex.: WRITE_CONCERN_LOTE_W=1 com WRITE_CONCERN_W=majority)
+db_lote = client.get_database(NOME_BANCO, write_concern=write_concern(WRITE_CONCERN_LOTE_W))
@@ -1,10 +1,44 @@
-from fastapi import FastAPI
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Response
 
+from config import EVENTOS_ATIVOS, JOBS_WORKERS, MONGO_MIN_POOL_SIZE, client, db, db_consultas
 from routes import (
-    fornecedor_routes,cliente_routes, roupa_routes,pedido_routes,itensPedido_routes,consulta_routes
+    fornecedor_routes,cliente_routes, roupa_routes,pedido_routes,itensPedido_routes,consulta_routes,admin_routes,
+    eventos_routes
 )
+from services.indices import criar_indices
+from services.busca import preencher_campos_busca
+from services.metricas import exportar_metricas, medir_requisicao
+from services.cache import cache
+from services.serializacao import RespostaBSON
+from services.eventos import consumir
+from services.jobs import trabalhar
 
-app = FastAPI()
+
+async def aquecer_conexoes():
+    # pings concorrentes abrem minPoolSize conexões antes da primeira requisição
+    await asyncio.gather(*(client.admin.command("ping") for _ in range(max(MONGO_MIN_POOL_SIZE, 1))))
+
+
+@asynccontextmanager
+async def ciclo_de_vida(app):
+    await aquecer_conexoes()
+    await criar_indices(db)
+    await preencher_campos_busca(db)
+    consumidor = asyncio.create_task(consumir(db)) if EVENTOS_ATIVOS else None
+    trabalhadores = [asyncio.create_task(trabalhar(db, db_consultas, numero)) for numero in range(JOBS_WORKERS)]
+    yield
+    if consumidor:
+        consumidor.cancel()
+    for trabalhador in trabalhadores:
+        trabalhador.cancel()
+    await cache.fechar()
+    client.close()
+
+app = FastAPI(lifespan=ciclo_de_vida, default_response_class=RespostaBSON)
+
+app.middleware("http")(medir_requisicao)
 
 app.include_router(fornecedor_routes.router, prefix="/fornecedores", tags=["Fornecedores"])
 app.include_router(cliente_routes.router, prefix="/clientes", tags=["Clientes"])
@@ -12,7 +46,14 @@ app.include_router(roupa_routes.router, prefix="/roupas", tags=["Roupas"])
 app.include_router(pedido_routes.router, prefix="/pedidos", tags=["Pedidos"])
 app.include_router(itensPedido_routes.router, prefix="/itensPedidos", tags=["Itens Pedidos"])
 app.include_router(consulta_routes.router, prefix="/consultas", tags= ["Consultas"])
+app.include_router(admin_routes.router, prefix="/admin", tags=["Admin"])
+app.include_router(eventos_routes.router, prefix="/eventos", tags=["Eventos"])
 
 @app.get("/")
 def home():
     return {"message": "API de Gestão de loja de roupas com FastAPI e MongoDB"}
+
+@app.get("/metrics", include_in_schema=False)
+def metricas():
+    conteudo, tipo = exportar_metricas()
+    return Response(content=conteudo, media_type=tipo)
@@ -0,0 +1,64 @@
+from fastapi import APIRouter
+from config import ARQUIVO_IDADE_DIAS, BULK_TAMANHO_LOTE, MODO_ITENS, db
+from services.indices import criar_indices, explicar_consultas, uso_indices
+from services.agregados import reconstruir_agregados
+from services.itens import migrar_para_embutido
+from services.arquivo import arquivar_pedidos
+from services.recomendacoes import reconstruir_relacionadas
+from services.segmentacao import calcular_metricas
+from services.busca import preencher_campos_busca
+from services.cache import invalidar
+
+router = APIRouter()
+
+@router.post("/indices")
+async def aplicar_indices():
+    criados = await criar_indices(db)
+    return {"data": criados}
+
+@router.get("/indices")
+async def listar_uso_indices():
+    uso = await uso_indices(db)
+    return {"data": uso}
+
+@router.get("/indices/explain")
+async def explicar_consultas_rotas():
+    relatorio = await explicar_consultas(db)
+    collscans = [item for item in relatorio if item["collscan"]]
+    return {"data": relatorio, "collscan": len(collscans)}
+
+@router.post("/busca/preencher")
+async def preencher_busca():
+    # documentos gravados por fora da API (mongoimport, scripts) não têm os campos "busca"
+    await preencher_campos_busca(db, forcar=True)
+    await invalidar("clientes", "roupas", "fornecedores", "pedidos")
+    return {"message": "Campos de busca preenchidos com sucesso"}
+
+@router.post("/agregados/reconstruir")
+async def reconstruir_agregados_vendas():
+    await reconstruir_agregados(db, MODO_ITENS)
+    await invalidar("pedidos", "itens_pedidos")
+    return {"message": "Agregados reconstruídos com sucesso"}
+
+@router.post("/itens/migrar")
+async def migrar_itens_para_embutido(tamanho_lote: int = BULK_TAMANHO_LOTE):
+    resultado = await migrar_para_embutido(db, tamanho_lote)
+    await invalidar("pedidos", "itens_pedidos")
+    return {"data": resultado}
+
+@router.post("/pedidos/arquivar")
+async def arquivar_pedidos_antigos(idade_dias: int = ARQUIVO_IDADE_DIAS, tamanho_lote: int = BULK_TAMANHO_LOTE):
+    resultado = await arquivar_pedidos(db, idade_dias, tamanho_lote=tamanho_lote, modo_itens=MODO_ITENS)
+    await invalidar("pedidos", "itens_pedidos")
+    return {"data": resultado}
+
+@router.post("/relacionadas/reconstruir")
+async def reconstruir_roupas_relacionadas():
+    resultado = await reconstruir_relacionadas(db, modo_itens=MODO_ITENS)
+    return {"data": resultado}
+
+@router.post("/clientes/metricas/reconstruir")
+async def reconstruir_metricas_clientes():
+    resultado = await calcular_metricas(db)
+    await invalidar("clientes_metricas")
+    return {"data": resultado}
@@ -1,72 +1,128 @@
-from fastapi import APIRouter, HTTPException
-from config import db
-from schemas import Cliente
+from fastapi import APIRouter, Header, HTTPException, Query, Request, Response
+from config import BULK_TAMANHO_LOTE, db, db_lote
+from schemas import IdsLote, Cliente, ClienteParcial
 from bson import ObjectId
+from pymongo import ReturnDocument
+from typing import List, Optional
+from services.paginacao import listar_paginado
+from services.busca import MODOS_BUSCA, buscar, campos_busca, filtro_busca
+from services.lote import gravar_em_lote
+from services.carregador import buscar_por_ids, resultado_lote, validar_ids
+from services.orcamento import orcamento
+from services.cache import cache_resposta, invalidar
+from services.escrita import prefere_minimo, resposta_minima
+from services.concorrencia import (
+    CAMPO_VERSAO, atualizar_versionado, caminhos, campos_enviados, com_etag, versao_esperada
+)
+from services.serializacao import projecao_modelo, responder
+from services.exportacao import BATCH_SIZE_PADRAO, exportar_colecao
+from services.segmentacao import metricas_cliente, ranking
 
 router = APIRouter()
 
+PROJECAO_CLIENTE = projecao_modelo(Cliente)
+
 @router.post("/", response_model=Cliente)
-async def criar_cliente(cliente: Cliente):
+async def criar_cliente(cliente: Cliente, prefer: Optional[str] = Header(None)):
     cliente_dict = cliente.dict(by_alias=True, exclude={"id"})
+    cliente_dict["busca"] = campos_busca("clientes", cliente_dict)
     novo_cliente = await db.clientes.insert_one(cliente_dict)
+    await invalidar("clientes")
 
-    cliente_criado = await db.clientes.find_one({"_id": novo_cliente.inserted_id})
-
-    if not cliente_criado:
-        raise HTTPException(status_code=400, detail="Erro ao criar cliente")
+    # a resposta sai do próprio payload validado: não é preciso ler o documento de volta
+    cliente_dict["_id"] = str(novo_cliente.inserted_id)
 
-    cliente_criado["_id"] = str(cliente_criado["_id"])
+    if prefere_minimo(prefer):
+        return resposta_minima(201, f"/clientes/cliente/{cliente_dict['_id']}")
 
-    return cliente_criado
+    del cliente_dict["busca"]
+    return responder(cliente_dict)
 
 
 @router.get("/", response_model=dict)
-async def listar_clientes(skip: int = 0, limit: int = 10):
-    total_clientes = await db.clientes.count_documents({})
-    clientes = await db.clientes.find().skip(skip).limit(limit).to_list(100)
-
-    for cliente in clientes:
-        cliente["_id"] = str(cliente["_id"])
-        
-    metadados = {
-        "total": total_clientes,
-        "skip": skip,
-        "limit": limit,
-        "page": (skip // limit) + 1 if limit else 0
-    }
-
-    return {"data": clientes, "metadados": metadados}
+@orcamento("crud")
+async def listar_clientes(skip: int = 0, limit: int = 10, paginacao: str = "offset", cursor: Optional[str] = None,
+                          contar_total: bool = True):
+    return responder(await listar_paginado(
+        db.clientes, skip, limit, paginacao=paginacao, cursor=cursor, contar_total=contar_total,
+        projecao=PROJECAO_CLIENTE
+    ))
 
 
 @router.get("/cliente/{cliente_id}", response_model=Cliente)
-async def obter_cliente(cliente_id: str):
+async def obter_cliente(cliente_id: str, response: Response):
     if not ObjectId.is_valid(cliente_id):
         raise HTTPException(status_code=400, detail="ID inválido")
 
-    cliente = await db.clientes.find_one({"_id": ObjectId(cliente_id)})
+    cliente = await db.clientes.find_one({"_id": ObjectId(cliente_id)}, {**PROJECAO_CLIENTE, CAMPO_VERSAO: 1})
 
     if not cliente:
         raise HTTPException(status_code=404, detail="Cliente não encontrado")
 
-    cliente["_id"] = str(cliente["_id"])
+    return responder(com_etag(cliente, response), response)
+
+@router.get("/batch", response_model=dict)
+async def obter_clientes_em_lote(ids: List[str] = Query(...)):
+    return await _clientes_em_lote(ids)
+
+
+@router.post("/batch", response_model=dict)
+async def obter_clientes_em_lote_corpo(lote: IdsLote):
+    return await _clientes_em_lote(lote.ids)
+
+
+async def _clientes_em_lote(ids):
+    ids = validar_ids(ids)
+    encontrados = await buscar_por_ids(db.clientes, ids, PROJECAO_CLIENTE)
+    return responder(resultado_lote(ids, encontrados))
 
-    return cliente
 
 @router.put("/{cliente_id}", response_model=Cliente)
-async def atualizar_cliente(cliente_id: str, cliente: Cliente):
+async def atualizar_cliente(cliente_id: str, cliente: Cliente, response: Response,
+                            prefer: Optional[str] = Header(None), if_match: Optional[str] = Header(None)):
     if not ObjectId.is_valid(cliente_id):
         raise HTTPException(status_code=400, detail="ID inválido")
 
+    versao = versao_esperada(if_match)
     cliente_dict = cliente.dict(by_alias=True, exclude={"id"})
-    resultado = await db.clientes.update_one({"_id": ObjectId(cliente_id)}, {"$set": cliente_dict})
+    cliente_dict["busca"] = campos_busca("clientes", cliente_dict)
+
+    return await _gravar_cliente(cliente_id, {"$set": cliente_dict}, versao, response, prefer)
+
+
+@router.patch("/{cliente_id}", response_model=Cliente)
+async def atualizar_cliente_parcial(cliente_id: str, cliente: ClienteParcial, response: Response,
+                                    prefer: Optional[str] = Header(None), if_match: Optional[str] = Header(None)):
+    if not ObjectId.is_valid(cliente_id):
+        raise HTTPException(status_code=400, detail="ID inválido")
 
-    if resultado.matched_count == 0:
+    versao = versao_esperada(if_match)
+    campos = campos_enviados(cliente)
+
+    # só os campos enviados são gravados; a busca normalizada acompanha os campos alterados
+    alteracoes = caminhos(campos)
+    alteracoes.update(caminhos(campos_busca("clientes", campos), "busca."))
+
+    return await _gravar_cliente(cliente_id, {"$set": alteracoes}, versao, response, prefer)
+
+
+async def _gravar_cliente(cliente_id, atualizacao, versao, response, prefer):
+    projecao = {CAMPO_VERSAO: 1} if prefere_minimo(prefer) else {**PROJECAO_CLIENTE, CAMPO_VERSAO: 1}
+    cliente_atualizado = await atualizar_versionado(
+        db.clientes, {"_id": ObjectId(cliente_id)}, atualizacao, versao, projection=projecao,
+        return_document=ReturnDocument.AFTER
+    )
+
+    if not cliente_atualizado:
         raise HTTPException(status_code=404, detail="Cliente não encontrado")
 
-    cliente_atualizado = await db.clientes.find_one({"_id": ObjectId(cliente_id)})
-    cliente_atualizado["_id"] = str(cliente_atualizado["_id"])
+    await invalidar("clientes")
+    com_etag(cliente_atualizado, response)
+
+    if prefere_minimo(prefer):
+        return resposta_minima(204, f"/clientes/cliente/{cliente_id}", response)
 
-    return cliente_atualizado
+    return responder(cliente_atualizado, response)
 
 
 @router.delete("/{cliente_id}")
@@ -79,29 +135,54 @@ async def deletar_cliente(cliente_id: str):
     if resultado.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Cliente não encontrado")
 
+    await invalidar("clientes")
+
     return {"message": "Cliente deletado com sucesso"}
 
 @router.get("/count")
+@cache_resposta("clientes")
+@orcamento("crud")
 async def contar_clientes():
     total_clientes = await db.clientes.count_documents({})
     return {"quantidade de entidades": total_clientes}
 
 @router.get("/filter", response_model=dict)
-async def filtrar_clientes(nome: str = None, cpf: str = None, email: str = None, cidade: str = None):
-    filtro = {}
+@orcamento("crud")
+async def filtrar_clientes(nome: str = None, cpf: str = None, email: str = None, cidade: str = None,
+                           modo: str = "prefixo"):
+    if modo not in MODOS_BUSCA:
+        raise HTTPException(status_code=400, detail="Modo de busca inválido")
+
+    filtro = filtro_busca("clientes", {"nome": nome, "cpf": cpf, "email": email, "cidade": cidade}, modo)
+
+    clientes = await buscar(db.clientes, filtro, modo, projecao=PROJECAO_CLIENTE)
+
+    return responder({"data": clientes})
+
+@router.get("/metricas/top", response_model=dict)
+@cache_resposta("clientes_metricas")
+@orcamento("crud")
+async def listar_top_clientes(ordenar: str = "ltv", segmento: Optional[str] = None, skip: int = 0, limit: int = 10):
+    clientes = await ranking(db, ordenar, segmento, skip, limit)
+    return {"data": clientes, "skip": skip, "limit": limit}
+
+@router.get("/{cliente_id}/metricas", response_model=dict)
+async def obter_metricas_cliente(cliente_id: str):
+    if not ObjectId.is_valid(cliente_id):
+        raise HTTPException(status_code=400, detail="ID inválido")
+
+    return responder(await metricas_cliente(db, cliente_id))
 
-    if nome:
-        filtro["nome"] = {"$regex": nome, "$options": "i"}
-    if cpf:
-        filtro["cpf"] = {"$regex": cpf, "$options": "i"}    
-    if email:
-        filtro["email"] = {"$regex": email, "$options": "i"}
-    if cidade:
-        filtro["endereco.cidade"] = {"$regex": cidade, "$options": "i"}
+@router.post("/bulk", response_model=dict)
+async def criar_clientes_em_lote(request: Request, tamanho_lote: int = BULK_TAMANHO_LOTE, upsert: bool = True):
+    def preparar(cliente_dict):
+        cliente_dict["busca"] = campos_busca("clientes", cliente_dict)
 
-    clientes = await db.clientes.find(filtro).to_list(100)
+    resultado = await gravar_em_lote(db_lote.clientes, Cliente, request, tamanho_lote, upsert, preparar)
+    await invalidar("clientes")
 
-    for cliente in clientes:
-        cliente["_id"] = str(cliente["_id"])
+    return resultado
 
-    return {"data": clientes}
+@router.get("/export")
+async def exportar_clientes(formato: str = "ndjson", campos: str = None, batch_size: int = BATCH_SIZE_PADRAO):
+    return exportar_colecao(db.clientes, Cliente, formato, campos, batch_size)
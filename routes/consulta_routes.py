@@ -1,143 +1,229 @@
 from fastapi import APIRouter, HTTPException
-from config import db
+from config import db, db_consultas
 from bson import ObjectId
 from datetime import datetime
+from typing import Optional
+from services.busca import MODOS_BUSCA, PROJECAO_PUBLICA, buscar, filtro_busca, indice_roupas
+from services.agregados import AGREGADO_CLIENTE, AGREGADO_ROUPA, AGREGADO_STATUS
+from services.arquivo import itens_arquivados, pedidos_com_arquivo, precisa_arquivo
+from services.exportacao import BATCH_SIZE_PADRAO, colunas, exportar, projecao, validar_exportacao
+from schemas import JobConsulta, Pedido
+from services.cache import cache_resposta
+from services.orcamento import orcamento
+from services.coalescencia import coalescer
+from services.juncoes import resolver_referencias
+from services.itens import repositorio_itens
+from services.jobs import enfileirar, obter, resumo
+from services.series import escolher_fonte, intervalo, lista_status, serie_por_agregado, serie_por_pedidos
+from services.serializacao import RespostaBSON, projecao_modelo
 
 router = APIRouter()
 
+PROJECAO_PEDIDO = projecao_modelo(Pedido)
+ORDENACAO_ANO = [("data", -1), ("_id", -1)]  # índice data_id, o mesmo nas coleções quente e de arquivo
+
+itens = repositorio_itens(db_consultas)
+
 @router.get("/itensPedidoPorPedido/{pedido_id}", response_model=dict)
+@cache_resposta("itens_pedidos")
+@orcamento("consulta")
 async def itens_por_pedido(pedido_id: str, skip: int = 0, limit: int = 10):
     if not ObjectId.is_valid(pedido_id):
         raise HTTPException(status_code=400, detail="ID inválido")
 
-    itens_pedido = await db.itens_pedidos.find({"pedido_id": pedido_id}).skip(skip).limit(limit).to_list(100)
-
-    for item in itens_pedido:
-        item["_id"] = str(item["_id"])
+    itens_pedido = await itens.por_pedido(pedido_id, skip, limit, PROJECAO_PUBLICA)
+    if not itens_pedido:
+        itens_pedido = await itens_arquivados(db_consultas, pedido_id, skip, limit, PROJECAO_PUBLICA)
 
     return {"data": itens_pedido}
 
 @router.get("/search/roupas", response_model=dict)
-async def buscar_roupas_por_nome(nome: str, skip: int = 0, limit: int = 10):
-    filtro = {"nome": {"$regex": nome, "$options": "i"}}  # 'i' é para case-insensitive
-    
-    roupas = await db.roupas.find(filtro).skip(skip).limit(limit).to_list(100)
-    
-    for roupa in roupas:
-        roupa["_id"] = str(roupa["_id"])
-    
+@cache_resposta("roupas")
+@orcamento("consulta")
+async def buscar_roupas_por_nome(nome: str, skip: int = 0, limit: int = 10, modo: str = "prefixo"):
+    if modo == "ngram":
+        # índice de n-gramas em memória: tolera erros de digitação e trechos no meio do nome
+        await indice_roupas.carregar(db_consultas.roupas)
+        encontrados = indice_roupas.buscar(nome)[skip:skip + limit]
+        scores = dict(encontrados)
+
+        roupas = await db_consultas.roupas.find(
+            {"_id": {"$in": [ObjectId(roupa_id) for roupa_id, _ in encontrados]}}, PROJECAO_PUBLICA
+        ).to_list(100)
+
+        for roupa in roupas:
+            roupa["score"] = scores[str(roupa["_id"])]
+
+        roupas.sort(key=lambda roupa: roupa["score"], reverse=True)
+
+        return {"data": roupas}
+
+    if modo not in MODOS_BUSCA:
+        raise HTTPException(status_code=400, detail="Modo de busca inválido")
+
+    filtro = filtro_busca("roupas", {"nome": nome}, modo)
+
+    roupas = await buscar(db_consultas.roupas, filtro, modo, skip, limit)
+
     return {"data": roupas}
 
 @router.get("/pedidosPorAno", response_model=dict)
+@cache_resposta("pedidos")
+@orcamento("consulta")
 async def pedidos_por_ano(ano: int, skip: int = 0, limit: int = 10):
     data_inicial = datetime(ano, 1, 1)
     data_final = datetime(ano + 1, 1, 1)
 
-    pedidos = await db.pedidos.find({
-        "data": {"$gte": data_inicial, "$lt": data_final}
-    }).skip(skip).limit(limit).to_list(100)
+    filtro = {"data": {"$gte": data_inicial, "$lt": data_final}}
 
-    for pedido in pedidos:
-        pedido["_id"] = str(pedido["_id"])
+    # anos que terminam depois do último pedido arquivado só existem na coleção quente
+    if await precisa_arquivo(db_consultas, data_inicial):
+        pedidos = await pedidos_com_arquivo(
+            db_consultas, filtro, PROJECAO_PEDIDO, ORDENACAO_ANO, skip, limit
+        ).to_list(None)
+    else:
+        pedidos = await db_consultas.pedidos.find(
+            filtro, PROJECAO_PEDIDO
+        ).sort(ORDENACAO_ANO).skip(skip).limit(limit).to_list(100)
 
     return {"data": pedidos}
 
 @router.get("/contagemPedidosPorStatus")
+@cache_resposta("pedidos")
+@coalescer
+@orcamento("crud")
 async def contar_pedidos_por_status():
-    pipeline = [
-        {"$group": {"_id": "$status", "total": {"$sum": 1}}}
-    ]
-    resultado = await db.pedidos.aggregate(pipeline).to_list(100)
+    resultado = await db_consultas[AGREGADO_STATUS].find({"total": {"$gt": 0}}, {"total": 1}).to_list(None)
 
     return {"data": resultado}
 
 @router.get("/contarPedidosPorCliente", response_model=dict)
+@cache_resposta("pedidos")
+@orcamento("crud")
 async def contar_pedidos_por_cliente():
-    pipeline = [
-        {"$group": {"_id": "$cliente_id", "quantidade_pedidos": {"$sum": 1}}}
-    ]
-    resultados = await db.pedidos.aggregate(pipeline).to_list(100)
+    resultados = await db_consultas[AGREGADO_CLIENTE].find(
+        {"quantidade_pedidos": {"$gt": 0}}, {"quantidade_pedidos": 1}
+    ).to_list(None)
     
     return {"data": resultados}
 
 @router.get("/totalPedidosPorCliente", response_model=dict)
+@cache_resposta("pedidos")
+@orcamento("crud")
 async def total_pedidos_por_cliente():
-    pipeline = [
-        {"$group": {"_id": "$cliente_id", "valor_total": {"$sum": "$valor_total"}}}
-    ]
-    resultados = await db.pedidos.aggregate(pipeline).to_list(100)
+    resultados = await db_consultas[AGREGADO_CLIENTE].find(
+        {"quantidade_pedidos": {"$gt": 0}}, {"valor_total": 1}
+    ).to_list(None)
     
     return {"data": resultados}
 
 
 @router.get("/roupasOrdenadasPorPreco", response_model=dict)
+@cache_resposta("roupas")
+@coalescer
+@orcamento("consulta")
 async def listar_roupas_ordenadas(ordem: str = "asc"):
     if ordem == "asc":
-        roupas = await db.roupas.find().sort("preco", 1).to_list(100)
+        roupas = await db_consultas.roupas.find({}, PROJECAO_PUBLICA).sort("preco", 1).to_list(100)
     else:
-        roupas = await db.roupas.find().sort("preco", -1).to_list(100)
-
-    for roupa in roupas:
-        roupa["_id"] = str(roupa["_id"])
+        roupas = await db_consultas.roupas.find({}, PROJECAO_PUBLICA).sort("preco", -1).to_list(100)
 
     return {"data": roupas}
 
+@router.get("/vendas/serie", response_model=dict)
+@cache_resposta("pedidos", "itens_pedidos")
+@orcamento("consulta")
+async def serie_vendas(granularidade: str = "dia", inicio: Optional[datetime] = None, fim: Optional[datetime] = None,
+                       status: Optional[str] = None, fonte: str = "auto"):
+    inicio, fim = intervalo(inicio, fim, granularidade)
+    fonte = escolher_fonte(fonte, inicio, fim)
+    status = lista_status(status)
+
+    if fonte == "agregado":
+        serie = await serie_por_agregado(db_consultas, inicio, fim, granularidade, status)
+    else:
+        arquivo = await precisa_arquivo(db_consultas, inicio)
+        serie = await serie_por_pedidos(db_consultas, inicio, fim, granularidade, status, arquivo)
+
+    return {"granularidade": granularidade, "inicio": inicio, "fim": fim, "fonte": fonte, "data": serie}
+
 @router.get("/pedidosComItens")
-async def pedidos_com_itens():
-    pipeline = [
-        {
-            "$lookup": {
-                "from": "itens_pedidos",
-                "localField": "_id",
-                "foreignField": "pedido_id",
-                "as": "itens"
-            }
-        }
-    ]
-    pedidos_com_itens = await db.pedidos.aggregate(pipeline).to_list(100)
-
-    for pedido in pedidos_com_itens:
-        pedido["_id"] = str(pedido["_id"])
-        for item in pedido["itens"]:
-            item["_id"] = str(item["_id"])
+@cache_resposta("pedidos", "itens_pedidos")
+@orcamento("consulta")
+async def pedidos_com_itens(skip: int = 0, limit: int = 100):
+    pedidos = await db_consultas.pedidos.find(
+        {}, {**PROJECAO_PEDIDO, "itens": 1}
+    ).sort("_id", 1).skip(skip).limit(limit).to_list(100)
+    pedidos_com_itens = await itens.juntar(pedidos)
 
     return {"data": pedidos_com_itens}
 
 @router.get("/listarRoupasPorFornecedor/{fornecedor_id}", response_model=dict)
+@cache_resposta("roupas")
+@orcamento("consulta")
 async def listar_roupas_por_fornecedor(fornecedor_id: str, skip: int = 0, limit: int = 10):
-    roupas = await db.roupas.find({"fornecedor_id": fornecedor_id}).skip(skip).limit(limit).to_list(100)
-    
-    for roupa in roupas:
-        roupa["_id"] = str(roupa["_id"])
-    
+    roupas = await db_consultas.roupas.find(
+        {"fornecedor_id": fornecedor_id}, PROJECAO_PUBLICA
+    ).skip(skip).limit(limit).to_list(100)
+
     return {"data": roupas}
 
 @router.get("/itens_vendidos_por_roupa", response_model=dict)
+@cache_resposta("itens_pedidos", "roupas")
+@orcamento("crud")
 async def itens_vendidos_por_roupa():
-    pipeline = [
-        {"$lookup": {
-            "from": "itens_pedidos",
-            "localField": "_id",
-            "foreignField": "pedido_id",
-            "as": "itens_pedido"
-        }},
-        {"$unwind": "$itens_pedido"},
-        {"$group": {
-            "_id": "$itens_pedido.roupa_id",
-            "quantidade_vendida": {"$sum": "$itens_pedido.quantidade"}
-        }},
-        {"$lookup": {
-            "from": "roupas",
-            "localField": "_id",
-            "foreignField": "_id",
-            "as": "roupa"
-        }},
-        {"$unwind": "$roupa"}
-    ]
-    
-    resultados = await db.pedidos.aggregate(pipeline).to_list(100)
-    
+    resultados = await db_consultas[AGREGADO_ROUPA].find(
+        {"quantidade_vendida": {"$gt": 0}}, {"quantidade_vendida": 1}
+    ).to_list(None)
+
+    await resolver_referencias(resultados, db_consultas.roupas, "_id", "roupa")
+
+    vendidos = []
     for resultado in resultados:
-        resultado["_id"] = str(resultado["_id"])
+        if not resultado["roupa"]:
+            continue
+        vendidos.append(resultado)
     
-    return {"data": resultados}
+    return {"data": vendidos}
+
+@router.get("/pedidosPorAno/export")
+async def exportar_pedidos_por_ano(ano: int, formato: str = "ndjson", campos: str = None,
+                                   batch_size: int = BATCH_SIZE_PADRAO):
+    colunas_exportadas = colunas(campos, Pedido)
+    validar_exportacao(formato, batch_size, colunas_exportadas)
+
+    filtro = {"data": {"$gte": datetime(ano, 1, 1), "$lt": datetime(ano + 1, 1, 1)}}
+
+    if await precisa_arquivo(db_consultas, filtro["data"]["$gte"]):
+        cursor = pedidos_com_arquivo(db_consultas, filtro, projecao(colunas_exportadas), batchSize=batch_size)
+    else:
+        cursor = db_consultas.pedidos.find(filtro, projecao(colunas_exportadas), batch_size=batch_size)
+
+    return exportar(cursor, formato, colunas_exportadas, f"pedidos_{ano}")
+
+@router.get("/pedidosComItens/export")
+async def exportar_pedidos_com_itens(formato: str = "ndjson", campos: str = None,
+                                     batch_size: int = BATCH_SIZE_PADRAO):
+    colunas_exportadas = colunas(campos) if campos else colunas(None, Pedido) + ["itens"]
+    validar_exportacao(formato, batch_size, colunas_exportadas)
+
+    # "itens" fica na projeção: no modo embutido o array vem no próprio pedido
+    documentos = db_consultas.pedidos.find({}, projecao(colunas_exportadas), batch_size=batch_size)
+
+    if "itens" in colunas_exportadas:
+        documentos = itens.em_lotes(documentos, batch_size)
+
+    return exportar(documentos, formato, colunas_exportadas, "pedidos_com_itens")
+
+@router.post("/jobs", status_code=202)
+async def criar_job(job: JobConsulta):
+    documento, reutilizado = await enfileirar(db, job.consulta, job.parametros)
+
+    return RespostaBSON(
+        resumo(documento, reutilizado), status_code=200 if reutilizado else 202,
+        headers={"Location": f"/consultas/jobs/{documento['_id']}"}
+    )
+
+@router.get("/jobs/{job_id}")
+async def obter_job(job_id: str, skip: int = 0, limit: int = 100):
+    return RespostaBSON(await obter(db, job_id, skip, limit))
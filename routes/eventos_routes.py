@@ -0,0 +1,78 @@
+import asyncio
+from fastapi import APIRouter, Header, HTTPException
+from fastapi.responses import StreamingResponse
+from pymongo.errors import OperationFailure
+from typing import Optional
+from config import EVENTOS_HEARTBEAT_S, db
+from services.eventos import COLECOES_EVENTOS, TOKEN_INVALIDO, canal, evento, formatar_sse, observar
+
+router = APIRouter()
+
+
+async def _transmitir(fila, fluxo, primeira, colecoes):
+    try:
+        yield b"retry: 3000\n\n"
+
+        # eventos perdidos desde o Last-Event-ID vêm de um change stream próprio, fechado ao alcançar o presente
+        ultimo_id = None
+        if fluxo is not None:
+            mudanca = primeira
+            while mudanca is not None:
+                atual = evento(mudanca)
+                ultimo_id = atual["id"]
+                yield formatar_sse(atual)
+                mudanca = await fluxo.try_next()
+            await fluxo.close()
+            fluxo = None
+
+        while True:
+            try:
+                atual = await asyncio.wait_for(fila.get(), EVENTOS_HEARTBEAT_S)
+            except asyncio.TimeoutError:
+                yield b": ping\n\n"
+                continue
+
+            if atual is None:
+                return
+            # tokens são comparáveis: o que a recuperação já entregou não sai de novo
+            if atual["colecao"] not in colecoes or (ultimo_id and atual["id"] <= ultimo_id):
+                continue
+            yield formatar_sse(atual)
+    finally:
+        canal.cancelar(fila)
+        if fluxo is not None:
+            await fluxo.close()
+
+
+@router.get("/pedidos")
+async def eventos_pedidos(colecoes: str = ",".join(COLECOES_EVENTOS), desde: Optional[str] = None,
+                          last_event_id: Optional[str] = Header(None)):
+    colecoes = tuple(colecao.strip() for colecao in colecoes.split(",") if colecao.strip())
+    if not colecoes or not set(colecoes) <= set(COLECOES_EVENTOS):
+        raise HTTPException(status_code=400, detail=f"Coleções devem estar entre {', '.join(COLECOES_EVENTOS)}")
+
+    if not canal.ativo:
+        raise HTTPException(status_code=503, detail="Feed de eventos indisponível (change streams exigem replica set)")
+
+    # a assinatura vem antes da recuperação: nenhum evento cai entre as duas
+    fila = canal.assinar()
+    fluxo = primeira = None
+
+    token = desde or last_event_id
+    if token:
+        fluxo = observar(db, token, colecoes)
+        try:
+            # a primeira leitura valida o token antes de a resposta começar
+            primeira = await fluxo.try_next()
+        except OperationFailure as erro:
+            canal.cancelar(fila)
+            await fluxo.close()
+            if erro.code in TOKEN_INVALIDO:
+                raise HTTPException(status_code=410, detail="Resume token expirado: reconecte sem Last-Event-ID")
+            raise
+
+    return StreamingResponse(
+        _transmitir(fila, fluxo, primeira, colecoes),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
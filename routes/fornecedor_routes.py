@@ -1,72 +1,129 @@
-from fastapi import APIRouter, HTTPException
-from config import db
-from schemas import Fornecedor
+from fastapi import APIRouter, Header, HTTPException, Query, Request, Response
+from config import BULK_TAMANHO_LOTE, db, db_lote
+from schemas import IdsLote, Fornecedor, FornecedorParcial
 from bson import ObjectId
+from pymongo import ReturnDocument
+from typing import List, Optional
+from services.paginacao import listar_paginado
+from services.busca import MODOS_BUSCA, buscar, campos_busca, filtro_busca
+from services.lote import gravar_em_lote
+from services.carregador import buscar_por_ids, resultado_lote, validar_ids
+from services.orcamento import orcamento
+from services.cache import cache_resposta, invalidar
+from services.escrita import prefere_minimo, resposta_minima
+from services.concorrencia import (
+    CAMPO_VERSAO, atualizar_versionado, caminhos, campos_enviados, com_etag, versao_esperada
+)
+from services.serializacao import projecao_modelo, responder
+from services.exportacao import BATCH_SIZE_PADRAO, exportar_colecao
 
 router = APIRouter()
 
+PROJECAO_FORNECEDOR = projecao_modelo(Fornecedor)
+
 @router.post("/", response_model=Fornecedor)
-async def criar_fornecedor(fornecedor: Fornecedor):
+async def criar_fornecedor(fornecedor: Fornecedor, prefer: Optional[str] = Header(None)):
     fornecedor_dict = fornecedor.dict(by_alias=True, exclude={"id"})
+    fornecedor_dict["busca"] = campos_busca("fornecedores", fornecedor_dict)
     novo_fornecedor = await db.fornecedores.insert_one(fornecedor_dict)
+    await invalidar("fornecedores")
 
-    fornecedor_criado = await db.fornecedores.find_one({"_id": novo_fornecedor.inserted_id})
-
-    if not fornecedor_criado:
-        raise HTTPException(status_code=400, detail="Erro ao criar fornecedor")
+    # a resposta sai do próprio payload validado: não é preciso ler o documento de volta
+    fornecedor_dict["_id"] = str(novo_fornecedor.inserted_id)
 
-    fornecedor_criado["_id"] = str(fornecedor_criado["_id"])
+    if prefere_minimo(prefer):
+        return resposta_minima(201, f"/fornecedores/fornecedor/{fornecedor_dict['_id']}")
 
-    return fornecedor_criado
+    del fornecedor_dict["busca"]
+    return responder(fornecedor_dict)
 
 
 @router.get("/", response_model=dict)
-async def listar_fornecedores(skip: int = 0, limit: int = 10):
-    total_fornecedores = await db.fornecedores.count_documents({})
-    fornecedores = await db.fornecedores.find().skip(skip).limit(limit).to_list(100)
-
-    for fornecedor in fornecedores:
-        fornecedor["_id"] = str(fornecedor["_id"])
-
-    metadados = {
-        "total": total_fornecedores,
-        "skip": skip,
-        "limit": limit,
-        "page": (skip // limit) + 1 if limit else 0
-    }
-
-    return {"data": fornecedores, "metadados": metadados}
+@orcamento("crud")
+async def listar_fornecedores(skip: int = 0, limit: int = 10, paginacao: str = "offset", cursor: Optional[str] = None,
+                              contar_total: bool = True):
+    return responder(await listar_paginado(
+        db.fornecedores, skip, limit, paginacao=paginacao, cursor=cursor, contar_total=contar_total,
+        projecao=PROJECAO_FORNECEDOR
+    ))
 
 
 @router.get("/fornecedor/{fornecedor_id}", response_model=Fornecedor)
-async def obter_fornecedor(fornecedor_id: str):
+async def obter_fornecedor(fornecedor_id: str, response: Response):
     if not ObjectId.is_valid(fornecedor_id):
         raise HTTPException(status_code=400, detail="ID inválido")
 
-    fornecedor = await db.fornecedores.find_one({"_id": ObjectId(fornecedor_id)})
+    fornecedor = await db.fornecedores.find_one(
+        {"_id": ObjectId(fornecedor_id)}, {**PROJECAO_FORNECEDOR, CAMPO_VERSAO: 1}
+    )
 
     if not fornecedor:
         raise HTTPException(status_code=404, detail="Fornecedor não encontrado")
 
-    fornecedor["_id"] = str(fornecedor["_id"])
+    return responder(com_etag(fornecedor, response), response)
+
+@router.get("/batch", response_model=dict)
+async def obter_fornecedores_em_lote(ids: List[str] = Query(...)):
+    return await _fornecedores_em_lote(ids)
+
+
+@router.post("/batch", response_model=dict)
+async def obter_fornecedores_em_lote_corpo(lote: IdsLote):
+    return await _fornecedores_em_lote(lote.ids)
+
+
+async def _fornecedores_em_lote(ids):
+    ids = validar_ids(ids)
+    encontrados = await buscar_por_ids(db.fornecedores, ids, PROJECAO_FORNECEDOR)
+    return responder(resultado_lote(ids, encontrados))
 
-    return fornecedor
 
 @router.put("/{fornecedor_id}", response_model=Fornecedor)
-async def atualizar_fornecedor(fornecedor_id: str, fornecedor: Fornecedor):
+async def atualizar_fornecedor(fornecedor_id: str, fornecedor: Fornecedor, response: Response,
+                               prefer: Optional[str] = Header(None), if_match: Optional[str] = Header(None)):
     if not ObjectId.is_valid(fornecedor_id):
         raise HTTPException(status_code=400, detail="ID inválido")
 
+    versao = versao_esperada(if_match)
     fornecedor_dict = fornecedor.dict(by_alias=True, exclude={"id"})
-    resultado = await db.fornecedores.update_one({"_id": ObjectId(fornecedor_id)}, {"$set": fornecedor_dict})
+    fornecedor_dict["busca"] = campos_busca("fornecedores", fornecedor_dict)
+
+    return await _gravar_fornecedor(fornecedor_id, {"$set": fornecedor_dict}, versao, response, prefer)
+
 
-    if resultado.matched_count == 0:
+@router.patch("/{fornecedor_id}", response_model=Fornecedor)
+async def atualizar_fornecedor_parcial(fornecedor_id: str, fornecedor: FornecedorParcial, response: Response,
+                                       prefer: Optional[str] = Header(None), if_match: Optional[str] = Header(None)):
+    if not ObjectId.is_valid(fornecedor_id):
+        raise HTTPException(status_code=400, detail="ID inválido")
+
+    versao = versao_esperada(if_match)
+    campos = campos_enviados(fornecedor)
+
+    # só os campos enviados são gravados; a busca normalizada acompanha os campos alterados
+    alteracoes = caminhos(campos)
+    alteracoes.update(caminhos(campos_busca("fornecedores", campos), "busca."))
+
+    return await _gravar_fornecedor(fornecedor_id, {"$set": alteracoes}, versao, response, prefer)
+
+
+async def _gravar_fornecedor(fornecedor_id, atualizacao, versao, response, prefer):
+    projecao = {CAMPO_VERSAO: 1} if prefere_minimo(prefer) else {**PROJECAO_FORNECEDOR, CAMPO_VERSAO: 1}
+    fornecedor_atualizado = await atualizar_versionado(
+        db.fornecedores, {"_id": ObjectId(fornecedor_id)}, atualizacao, versao, projection=projecao,
+        return_document=ReturnDocument.AFTER
+    )
+
+    if not fornecedor_atualizado:
         raise HTTPException(status_code=404, detail="Fornecedor não encontrado")
 
-    fornecedor_atualizado = await db.fornecedores.find_one({"_id": ObjectId(fornecedor_id)})
-    fornecedor_atualizado["_id"] = str(fornecedor_atualizado["_id"])
+    await invalidar("fornecedores")
+    com_etag(fornecedor_atualizado, response)
+
+    if prefere_minimo(prefer):
+        return resposta_minima(204, f"/fornecedores/fornecedor/{fornecedor_id}", response)
 
-    return fornecedor_atualizado
+    return responder(fornecedor_atualizado, response)
 
 
 @router.delete("/{fornecedor_id}")
@@ -79,27 +136,39 @@ async def deletar_fornecedor(fornecedor_id: str):
     if resultado.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Fornecedor não encontrado")
 
+    await invalidar("fornecedores")
+
     return {"message": "Fornecedor deletado com sucesso"}
 
 @router.get("/count")
+@cache_resposta("fornecedores")
+@orcamento("crud")
 async def contar_fornecedores():
     total_fornecedores = await db.fornecedores.count_documents({})
     return {"quantidade de entidades": total_fornecedores}
 
 @router.get("/filter", response_model=dict)
-async def filtrar_fornecedores(nome: str = None, telefone: str = None, cidade: str = None):
-    filtro = {}
+@orcamento("crud")
+async def filtrar_fornecedores(nome: str = None, telefone: str = None, cidade: str = None, modo: str = "prefixo"):
+    if modo not in MODOS_BUSCA:
+        raise HTTPException(status_code=400, detail="Modo de busca inválido")
+
+    filtro = filtro_busca("fornecedores", {"nome": nome, "telefone": telefone, "cidade": cidade}, modo)
+
+    fornecedores = await buscar(db.fornecedores, filtro, modo, projecao=PROJECAO_FORNECEDOR)
+
+    return responder({"data": fornecedores})
 
-    if nome:
-        filtro["nome"] = {"$regex": nome, "$options": "i"}  
-    if telefone:
-        filtro["telefone"] = {"$regex": telefone, "$options": "i"}
-    if cidade:
-        filtro["cidade"] = {"$regex": cidade, "$options": "i"}
+@router.post("/bulk", response_model=dict)
+async def criar_fornecedores_em_lote(request: Request, tamanho_lote: int = BULK_TAMANHO_LOTE, upsert: bool = True):
+    def preparar(fornecedor_dict):
+        fornecedor_dict["busca"] = campos_busca("fornecedores", fornecedor_dict)
 
-    fornecedores = await db.fornecedores.find(filtro).to_list(100)
+    resultado = await gravar_em_lote(db_lote.fornecedores, Fornecedor, request, tamanho_lote, upsert, preparar)
+    await invalidar("fornecedores")
 
-    for fornecedor in fornecedores:
-        fornecedor["_id"] = str(fornecedor["_id"])
+    return resultado
 
-    return {"data": fornecedores}
\ No newline at end of file
+@router.get("/export")
+async def exportar_fornecedores(formato: str = "ndjson", campos: str = None, batch_size: int = BATCH_SIZE_PADRAO):
+    return exportar_colecao(db.fornecedores, Fornecedor, formato, campos, batch_size)
@@ -1,74 +1,130 @@
-from fastapi import APIRouter, HTTPException
-from config import db
-from schemas import ItensPedido
+from fastapi import APIRouter, Header, HTTPException, Query, Request, Response
+from config import BULK_TAMANHO_LOTE, db, db_lote
+from schemas import IdsLote, ItensPedido, ItensPedidoParcial
 from bson import ObjectId
+from typing import List, Optional
+from services.agregados import registrar_item, registrar_itens, substituir_item
+from services.itens import TAGS_ITENS, repositorio_itens
+from services.recomendacoes import registrar_coocorrencias_item
+from services.carregador import resultado_lote, validar_ids
+from services.orcamento import orcamento
+from services.cache import cache_resposta, invalidar
+from services.escrita import prefere_minimo, resposta_minima
+from services.concorrencia import CAMPO_VERSAO, campos_enviados, com_etag, etag, versao_esperada
+from services.serializacao import projecao_modelo, responder
+from services.exportacao import BATCH_SIZE_PADRAO, colunas, exportar, projecao, validar_exportacao
 
 router = APIRouter()
 
+PROJECAO_ITEM_PEDIDO = projecao_modelo(ItensPedido)
+
+itens = repositorio_itens(db)
+itens_lote = repositorio_itens(db_lote)
+
 @router.post("/", response_model=ItensPedido)
-async def criar_item_pedido(item_pedido: ItensPedido):
+async def criar_item_pedido(item_pedido: ItensPedido, prefer: Optional[str] = Header(None)):
     item_pedido_dict = item_pedido.dict(by_alias=True, exclude={"id"})
-    novo_item_pedido = await db.itens_pedidos.insert_one(item_pedido_dict)
+    item_id = await itens.criar(item_pedido_dict)
+    # o cache só é derrubado depois do $inc: uma leitura entre os dois guardaria o agregado antigo
+    await registrar_item(db, item_pedido_dict)
+    await invalidar(*TAGS_ITENS)
+    await registrar_coocorrencias_item(db, item_pedido_dict)
 
-    item_pedido_criado = await db.itens_pedidos.find_one({"_id": novo_item_pedido.inserted_id})
+    item_pedido_dict["_id"] = str(item_id)
 
-    if not item_pedido_criado:
-        raise HTTPException(status_code=400, detail="Erro ao criar item do pedido")
+    if prefere_minimo(prefer):
+        return resposta_minima(201, f"/itensPedidos/item/{item_pedido_dict['_id']}")
 
-    item_pedido_criado["_id"] = str(item_pedido_criado["_id"])
-
-    return item_pedido_criado
+    return responder(item_pedido_dict)
 
 
 @router.get("/", response_model=dict)
-async def listar_itens_pedidos(skip: int = 0, limit: int = 10):
-    total_itens_pedidos = await db.itens_pedidos.count_documents({})
-    itens_pedidos = await db.itens_pedidos.find().skip(skip).limit(limit).to_list(100)
-
-    for item in itens_pedidos:
-        item["_id"] = str(item["_id"])
-
-    metadados = {
-        "total": total_itens_pedidos,
-        "skip": skip,
-        "limit": limit,
-        "page": (skip // limit) + 1 if limit else 0
-    }
-
-    return {"data": itens_pedidos, "metadados": metadados}
-
+@orcamento("crud")
+async def listar_itens_pedidos(skip: int = 0, limit: int = 10, paginacao: str = "offset", cursor: Optional[str] = None,
+                               contar_total: bool = True):
+    return responder(await itens.listar(skip, limit, paginacao, cursor, contar_total, PROJECAO_ITEM_PEDIDO))
 
 
 @router.get("/item/{item_id}", response_model=ItensPedido)
-async def obter_item_pedido(item_id: str):
+async def obter_item_pedido(item_id: str, response: Response):
     if not ObjectId.is_valid(item_id):
         raise HTTPException(status_code=400, detail="ID inválido")
 
-    item = await db.itens_pedidos.find_one({"_id": ObjectId(item_id)})
+    item = await itens.obter(item_id, {**PROJECAO_ITEM_PEDIDO, CAMPO_VERSAO: 1})
 
     if not item:
         raise HTTPException(status_code=404, detail="Item do pedido não encontrado")
 
-    item["_id"] = str(item["_id"])
+    return responder(com_etag(item, response), response)
+
 
-    return item
+@router.get("/batch", response_model=dict)
+async def obter_itens_pedidos_em_lote(ids: List[str] = Query(...)):
+    return await _itens_em_lote(ids)
+
+
+@router.post("/batch", response_model=dict)
+async def obter_itens_pedidos_em_lote_corpo(lote: IdsLote):
+    return await _itens_em_lote(lote.ids)
+
+
+async def _itens_em_lote(ids):
+    ids = validar_ids(ids)
+    encontrados = await itens.por_ids(ids, PROJECAO_ITEM_PEDIDO)
+    return responder(resultado_lote(ids, encontrados))
 
 
 @router.put("/{item_id}", response_model=ItensPedido)
-async def atualizar_item_pedido(item_id: str, item_pedido: ItensPedido):
+async def atualizar_item_pedido(item_id: str, item_pedido: ItensPedido, response: Response,
+                                prefer: Optional[str] = Header(None), if_match: Optional[str] = Header(None)):
     if not ObjectId.is_valid(item_id):
         raise HTTPException(status_code=400, detail="ID inválido")
 
+    versao = versao_esperada(if_match)
     item_pedido_dict = item_pedido.dict(by_alias=True, exclude={"id"})
-    resultado = await db.itens_pedidos.update_one({"_id": ObjectId(item_id)}, {"$set": item_pedido_dict})
+    await _gravar_item(item_id, item_pedido_dict, versao, response)
+
+    if prefere_minimo(prefer):
+        return resposta_minima(204, f"/itensPedidos/item/{item_id}", response)
+
+    # o $set grava o documento inteiro: o resultado é o próprio payload
+    item_pedido_dict["_id"] = item_id
+
+    return responder(item_pedido_dict, response)
+
 
-    if resultado.matched_count == 0:
+@router.patch("/{item_id}", response_model=ItensPedido)
+async def atualizar_item_pedido_parcial(item_id: str, item_pedido: ItensPedidoParcial, response: Response,
+                                        prefer: Optional[str] = Header(None), if_match: Optional[str] = Header(None)):
+    if not ObjectId.is_valid(item_id):
+        raise HTTPException(status_code=400, detail="ID inválido")
+
+    versao = versao_esperada(if_match)
+    campos = campos_enviados(item_pedido)
+    item_atualizado = await _gravar_item(item_id, campos, versao, response)
+
+    if prefere_minimo(prefer):
+        return resposta_minima(204, f"/itensPedidos/item/{item_id}", response)
+
+    item_atualizado["_id"] = item_id
+
+    return responder(item_atualizado, response)
+
+
+async def _gravar_item(item_id, campos, versao, response):
+    item_anterior = await itens.atualizar(item_id, campos, versao)
+
+    if not item_anterior:
         raise HTTPException(status_code=404, detail="Item do pedido não encontrado")
 
-    item_pedido_atualizado = await db.itens_pedidos.find_one({"_id": ObjectId(item_id)})
-    item_pedido_atualizado["_id"] = str(item_pedido_atualizado["_id"])
+    response.headers["ETag"] = etag(item_anterior.pop(CAMPO_VERSAO, 0) + 1)
+
+    # o item anterior mais os campos enviados é o item atualizado, sem nova leitura
+    item_atualizado = {**item_anterior, **campos}
+    await substituir_item(db, item_anterior, item_atualizado)
+    await invalidar(*TAGS_ITENS)
 
-    return item_pedido_atualizado
+    return item_atualizado
 
 
 @router.delete("/{item_id}")
@@ -76,19 +132,25 @@ async def deletar_item_pedido(item_id: str):
     if not ObjectId.is_valid(item_id):
         raise HTTPException(status_code=400, detail="ID inválido")
 
-    resultado = await db.itens_pedidos.delete_one({"_id": ObjectId(item_id)})
+    item_removido = await itens.remover(item_id)
 
-    if resultado.deleted_count == 0:
+    if not item_removido:
         raise HTTPException(status_code=404, detail="Item do pedido não encontrado")
 
+    await registrar_item(db, item_removido, -1)
+    await invalidar(*TAGS_ITENS)
+
     return {"message": "Item do pedido deletado com sucesso"}
 
 @router.get("/count")
+@cache_resposta("itens_pedidos")
+@orcamento("crud")
 async def contar_itens_pedidos():
-    total_itens_pedidos = await db.itens_pedidos.count_documents({})
+    total_itens_pedidos = await itens.contar()
     return {"quantidade de entidades": total_itens_pedidos}
 
 @router.get("/filter", response_model=dict)
+@orcamento("crud")
 async def filtrar_itens_pedidos(roupa_id: str = None, pedido_id: str = None):
     filtro = {}
 
@@ -97,9 +159,26 @@ async def filtrar_itens_pedidos(roupa_id: str = None, pedido_id: str = None):
     if pedido_id:
         filtro["pedido_id"] = pedido_id
 
-    itens_pedidos = await db.itens_pedidos.find(filtro).to_list(100)
+    itens_pedidos = await itens.filtrar(filtro, PROJECAO_ITEM_PEDIDO)
+
+    return responder({"data": itens_pedidos})
+
+# Sem upsert: substituir itens existentes exigiria ler cada um para corrigir os agregados
+@router.post("/bulk", response_model=dict)
+async def criar_itens_pedidos_em_lote(request: Request, tamanho_lote: int = BULK_TAMANHO_LOTE):
+    async def apos_gravar(itens):
+        await registrar_itens(db, itens)
+
+    resultado = await itens_lote.gravar_em_lote(request, tamanho_lote, apos_gravar)
+    await invalidar(*TAGS_ITENS)
+
+    return resultado
+
+@router.get("/export")
+async def exportar_itens_pedidos(formato: str = "ndjson", campos: str = None, batch_size: int = BATCH_SIZE_PADRAO):
+    colunas_exportadas = colunas(campos, ItensPedido)
+    validar_exportacao(formato, batch_size, colunas_exportadas)
 
-    for item in itens_pedidos:
-        item["_id"] = str(item["_id"])
+    cursor = itens.cursor(projecao(colunas_exportadas), batch_size)
 
-    return {"data": itens_pedidos}
+    return exportar(cursor, formato, colunas_exportadas, "itens_pedidos")
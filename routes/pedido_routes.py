@@ -1,73 +1,282 @@
-from fastapi import APIRouter, HTTPException
-from config import db
-from schemas import Pedido
+import asyncio
+from fastapi import APIRouter, Header, HTTPException, Query, Request, Response
+from config import BULK_TAMANHO_LOTE, MODO_ITENS, client, db, db_lote
+from schemas import Cliente, IdsLote, Pedido, PedidoCompleto, PedidoParcial, Roupa
 from bson import ObjectId
+from pymongo.errors import OperationFailure
+from pymongo.read_concern import ReadConcern
+from pymongo.write_concern import WriteConcern
+from typing import List, Optional
+from services.paginacao import listar_paginado
+from services.busca import MODOS_BUSCA, buscar, campos_busca, filtro_busca
+from services.arquivo import buscar_arquivados, juntar_itens_arquivados, pedido_arquivado
+from services.agregados import registrar_itens, registrar_pedido, registrar_pedidos, substituir_pedido
+from services.lote import gravar_em_lote
+from services.carregador import Carregadores, buscar_por_ids, resultado_lote, validar_ids
+from services.itens import linha_embutida, repositorio_itens
+from services.recomendacoes import registrar_coocorrencias
+from services.orcamento import orcamento
+from services.cache import cache_resposta, invalidar
+from services.escrita import prefere_minimo, resposta_minima
+from services.concorrencia import (
+    CAMPO_VERSAO, atualizar_versionado, caminhos, campos_enviados, com_etag, etag, versao_esperada
+)
+from services.serializacao import projecao_modelo, responder
+from services.exportacao import BATCH_SIZE_PADRAO, exportar_colecao
 
 router = APIRouter()
 
-@router.post("/", response_model=Pedido)
-async def criar_pedido(pedido: Pedido):
-    pedido_dict = pedido.dict(by_alias=True, exclude={"id"})
+PROJECAO_PEDIDO = projecao_modelo(Pedido)
 
-    novo_pedido = await db.pedidos.insert_one(pedido_dict)
+# referências resolvidas pelo /batch?expandir=
+EXPANSOES = ("cliente", "itens", "roupas")
+PROJECOES_REFERENCIAS = {"clientes": projecao_modelo(Cliente), "roupas": projecao_modelo(Roupa)}
 
-    pedido_criado = await db.pedidos.find_one({"_id": novo_pedido.inserted_id})
+# o que os agregados precisam do pedido anterior a uma atualização
+PROJECAO_ANTERIOR = {**PROJECAO_PEDIDO, "quantidade_itens": 1, CAMPO_VERSAO: 1}
 
-    if not pedido_criado:
-        raise HTTPException(status_code=400, detail="Erro ao criar pedido")
+itens_pedidos = repositorio_itens(db)
 
-    pedido_criado["_id"] = str(pedido_criado["_id"])
+@router.post("/", response_model=Pedido)
+async def criar_pedido(pedido: Pedido, prefer: Optional[str] = Header(None)):
+    pedido_dict = pedido.dict(by_alias=True, exclude={"id"})
+    pedido_dict["busca"] = campos_busca("pedidos", pedido_dict)
 
-    return pedido_criado
+    novo_pedido = await db.pedidos.insert_one(pedido_dict)
+    # o cache só é derrubado depois do $inc: uma leitura entre os dois guardaria o agregado antigo
+    await registrar_pedido(db, pedido_dict)
+    await invalidar("pedidos")
+
+    pedido_dict["_id"] = str(novo_pedido.inserted_id)
+
+    if prefere_minimo(prefer):
+        return resposta_minima(201, f"/pedidos/pedido/{pedido_dict['_id']}")
+
+    del pedido_dict["busca"]
+    return responder(pedido_dict)
+
+
+@router.post("/completo", response_model=dict)
+async def criar_pedido_completo(pedido: PedidoCompleto, prefer: Optional[str] = Header(None)):
+    if not pedido.itens:
+        raise HTTPException(status_code=400, detail="Pedido sem itens")
+
+    roupa_ids = {item.roupa_id for item in pedido.itens}
+    if not all(ObjectId.is_valid(roupa_id) for roupa_id in roupa_ids):
+        raise HTTPException(status_code=400, detail="ID de roupa inválido")
+
+    pedido_id = ObjectId()
+
+    async def gravar(session):
+        # um único $in busca os preços de todas as linhas dentro do snapshot da transação
+        precos, nomes = {}, {}
+        async for roupa in db.roupas.find(
+            {"_id": {"$in": [ObjectId(roupa_id) for roupa_id in roupa_ids]}}, {"preco": 1, "nome": 1}, session=session
+        ):
+            precos[str(roupa["_id"])] = roupa["preco"]
+            nomes[str(roupa["_id"])] = roupa.get("nome")
+
+        faltando = roupa_ids - precos.keys()
+        if faltando:
+            raise HTTPException(status_code=404, detail=f"Roupa não encontrada: {', '.join(sorted(faltando))}")
+
+        itens = [
+            {
+                "pedido_id": str(pedido_id),
+                "roupa_id": item.roupa_id,
+                "quantidade": item.quantidade,
+                "preco_unitario": precos[item.roupa_id],
+                "subtotal": round(precos[item.roupa_id] * item.quantidade, 2),
+            }
+            for item in pedido.itens
+        ]
+        pedido_dict = {
+            "_id": pedido_id,
+            "data": pedido.data,
+            "status": pedido.status,
+            "valor_total": round(sum(item["subtotal"] for item in itens), 2),
+            "cliente_id": pedido.cliente_id,
+        }
+        pedido_dict["busca"] = campos_busca("pedidos", pedido_dict)
+
+        if MODO_ITENS == "embutido":
+            for item in itens:
+                item["_id"] = ObjectId()
+            pedido_dict["itens"] = [linha_embutida(item, nomes[item["roupa_id"]]) for item in itens]
+            await db.pedidos.insert_one(pedido_dict, session=session)
+        else:
+            await db.pedidos.insert_one(pedido_dict, session=session)
+            await db.itens_pedidos.insert_many(itens, session=session)
+
+        return pedido_dict, itens
+
+    try:
+        async with await client.start_session() as session:
+            # with_transaction repete a transação em erros transitórios
+            pedido_dict, itens = await session.with_transaction(
+                gravar, read_concern=ReadConcern("snapshot"), write_concern=WriteConcern("majority")
+            )
+    except OperationFailure as erro:
+        if erro.code == 20:  # IllegalOperation: servidor standalone
+            raise HTTPException(status_code=503, detail="Transações exigem um replica set ou cluster shardado")
+        raise
+
+    # rollups fora da transação: todo pedido incrementa os mesmos documentos de status e de dia, e dentro dela
+    # esses $inc gerariam WriteConflict entre pedidos simultâneos; um desvio é corrigido pela reconstrução
+    await registrar_pedido(db, pedido_dict)
+    await registrar_itens(db, itens)
+    await invalidar("pedidos", "itens_pedidos")
+    await registrar_coocorrencias(db, roupa_ids)
+
+    if prefere_minimo(prefer):
+        return resposta_minima(201, f"/pedidos/pedido/{pedido_id}")
+
+    del pedido_dict["busca"]
+    pedido_dict["itens"] = itens
+    return responder(pedido_dict)
 
 
 @router.get("/", response_model=dict)
-async def listar_pedidos(skip: int = 0, limit: int = 10):
-    total_pedidos = await db.pedidos.count_documents({})
-    pedidos = await db.pedidos.find().skip(skip).limit(limit).to_list(100)
-
-    for pedido in pedidos:
-        pedido["_id"] = str(pedido["_id"])
-        
-    metadados = {
-        "total": total_pedidos,
-        "skip": skip,
-        "limit": limit,
-        "page": (skip // limit) + 1 if limit else 0
-    }
-
-    return {"data": pedidos, "metadados": metadados}
+@orcamento("crud")
+async def listar_pedidos(skip: int = 0, limit: int = 10, paginacao: str = "offset", cursor: Optional[str] = None,
+                         contar_total: bool = True):
+    return responder(await listar_paginado(
+        db.pedidos, skip, limit, paginacao=paginacao, cursor=cursor, contar_total=contar_total,
+        ordenacao=(("data", -1), ("_id", -1)), projecao=PROJECAO_PEDIDO
+    ))
 
 @router.get("/pedido/{pedido_id}", response_model=Pedido)
-async def obter_pedido(pedido_id: str):
+async def obter_pedido(pedido_id: str, response: Response, incluir_itens: bool = False):
     if not ObjectId.is_valid(pedido_id):
         raise HTTPException(status_code=400, detail="ID inválido")
 
-    pedido = await db.pedidos.find_one({"_id": ObjectId(pedido_id)})
+    # no modo embutido o pedido completo sai desta única leitura
+    projecao_pedido = {**PROJECAO_PEDIDO, "itens": 1} if incluir_itens else PROJECAO_PEDIDO
+    pedido = await db.pedidos.find_one({"_id": ObjectId(pedido_id)}, {**projecao_pedido, CAMPO_VERSAO: 1})
+    arquivado = False
+
+    if not pedido:
+        # o arquivo só é lido quando o id não está na coleção quente
+        pedido = await pedido_arquivado(db, ObjectId(pedido_id), {**projecao_pedido, CAMPO_VERSAO: 1})
+        arquivado = True
 
     if not pedido:
         raise HTTPException(status_code=404, detail="Pedido não encontrado")
 
-    pedido["_id"] = str(pedido["_id"])
+    if incluir_itens:
+        await (juntar_itens_arquivados(db, [pedido]) if arquivado else itens_pedidos.juntar([pedido]))
+
+    return responder(com_etag(pedido, response), response)
+
+
+@router.get("/batch", response_model=dict)
+async def obter_pedidos_em_lote(ids: List[str] = Query(...), expandir: Optional[str] = None):
+    return await _pedidos_em_lote(ids, expandir)
+
+
+@router.post("/batch", response_model=dict)
+async def obter_pedidos_em_lote_corpo(lote: IdsLote, expandir: Optional[str] = None):
+    return await _pedidos_em_lote(lote.ids, expandir)
+
+
+async def _pedidos_em_lote(ids, expandir):
+    ids = validar_ids(ids)
+    expandir = {expansao.strip() for expansao in (expandir or "").split(",") if expansao.strip()}
+    if not expandir <= set(EXPANSOES):
+        raise HTTPException(status_code=400, detail=f"expandir aceita {', '.join(EXPANSOES)}")
+    if "roupas" in expandir:
+        expandir.add("itens")
+
+    projecao_pedido = {**PROJECAO_PEDIDO, "itens": 1} if "itens" in expandir else PROJECAO_PEDIDO
+    encontrados = await buscar_por_ids(db.pedidos, ids, projecao_pedido)
+    pedidos = list(encontrados.values())
+
+    faltando = [pedido_id for pedido_id in ids if pedido_id not in encontrados]
+    arquivados = await buscar_arquivados(db, faltando, projecao_pedido) if faltando else {}
+    encontrados.update(arquivados)
+
+    if "itens" in expandir:
+        await itens_pedidos.juntar(pedidos)
+        await juntar_itens_arquivados(db, list(arquivados.values()))
+    pedidos += arquivados.values()
+
+    # os carregadores juntam as referências de todos os pedidos em um $in por coleção
+    carregadores = Carregadores(db, PROJECOES_REFERENCIAS)
+    await asyncio.gather(*(_expandir(pedido, expandir, carregadores) for pedido in pedidos))
+
+    return responder(resultado_lote(ids, encontrados))
 
-    return pedido
+
+async def _expandir(pedido, expandir, carregadores):
+    if "cliente" in expandir:
+        pedido["cliente"] = await carregadores["clientes"].carregar(pedido.get("cliente_id"))
+
+    if "roupas" in expandir:
+        roupas = await carregadores["roupas"].carregar_muitos(item.get("roupa_id") for item in pedido["itens"])
+        for item, roupa in zip(pedido["itens"], roupas):
+            item["roupa"] = roupa
 
 
 @router.put("/{pedido_id}", response_model=Pedido)
-async def atualizar_pedido(pedido_id: str, pedido: Pedido):
+async def atualizar_pedido(pedido_id: str, pedido: Pedido, response: Response,
+                           prefer: Optional[str] = Header(None), if_match: Optional[str] = Header(None)):
     if not ObjectId.is_valid(pedido_id):
         raise HTTPException(status_code=400, detail="ID inválido")
 
+    versao = versao_esperada(if_match)
     pedido_dict = pedido.dict(by_alias=True, exclude={"id"})
-    resultado = await db.pedidos.update_one({"_id": ObjectId(pedido_id)}, {"$set": pedido_dict})
+    pedido_anterior = await _gravar_pedido(pedido_id, pedido_dict, versao, response)
+
+    await substituir_pedido(db, pedido_anterior, pedido_dict)
+    await invalidar("pedidos")
+
+    if prefere_minimo(prefer):
+        return resposta_minima(204, f"/pedidos/pedido/{pedido_id}", response)
+
+    # o $set grava o documento inteiro: o resultado é o próprio payload
+    pedido_dict["_id"] = pedido_id
+
+    return responder(pedido_dict, response)
+
+
+@router.patch("/{pedido_id}", response_model=Pedido)
+async def atualizar_pedido_parcial(pedido_id: str, pedido: PedidoParcial, response: Response,
+                                   prefer: Optional[str] = Header(None), if_match: Optional[str] = Header(None)):
+    if not ObjectId.is_valid(pedido_id):
+        raise HTTPException(status_code=400, detail="ID inválido")
+
+    versao = versao_esperada(if_match)
+    campos = caminhos(campos_enviados(pedido))
+    pedido_anterior = await _gravar_pedido(pedido_id, campos, versao, response)
+
+    # o documento anterior mais os campos enviados é o pedido atualizado, sem nova leitura
+    pedido_atualizado = {**pedido_anterior, **campos}
+    await substituir_pedido(db, pedido_anterior, pedido_atualizado)
+    await invalidar("pedidos")
 
-    if resultado.matched_count == 0:
+    if prefere_minimo(prefer):
+        return resposta_minima(204, f"/pedidos/pedido/{pedido_id}", response)
+
+    pedido_atualizado["_id"] = pedido_id
+    del pedido_atualizado["quantidade_itens"]
+    return responder(pedido_atualizado, response)
+
+
+async def _gravar_pedido(pedido_id, campos, versao, response):
+    alteracoes = {**campos}
+    alteracoes.update(caminhos(campos_busca("pedidos", campos), "busca."))
+
+    pedido_anterior = await atualizar_versionado(
+        db.pedidos, {"_id": ObjectId(pedido_id)}, {"$set": alteracoes}, versao, projection=PROJECAO_ANTERIOR
+    )
+
+    if not pedido_anterior:
         raise HTTPException(status_code=404, detail="Pedido não encontrado")
 
-    pedido_atualizado = await db.pedidos.find_one({"_id": ObjectId(pedido_id)})
-    pedido_atualizado["_id"] = str(pedido_atualizado["_id"])
+    response.headers["ETag"] = etag(pedido_anterior.pop(CAMPO_VERSAO, 0) + 1)
+    pedido_anterior.setdefault("quantidade_itens", 0)
 
-    return pedido_atualizado
+    return pedido_anterior
 
 
 @router.delete("/{pedido_id}")
@@ -75,30 +284,56 @@ async def deletar_pedido(pedido_id: str):
     if not ObjectId.is_valid(pedido_id):
         raise HTTPException(status_code=400, detail="ID inválido")
 
-    resultado = await db.pedidos.delete_one({"_id": ObjectId(pedido_id)})
+    pedido_removido = await db.pedidos.find_one_and_delete({"_id": ObjectId(pedido_id)})
 
-    if resultado.deleted_count == 0:
+    if not pedido_removido:
         raise HTTPException(status_code=404, detail="Pedido não encontrado")
 
+    await registrar_pedido(db, pedido_removido, -1)
+    await invalidar("pedidos")
+
+    if pedido_removido.get("itens"):
+        # itens embutidos saem junto com o pedido
+        await registrar_itens(db, pedido_removido["itens"], -1)
+        await invalidar("itens_pedidos")
+
     return {"message": "Pedido deletado com sucesso"}
 
 @router.get("/count")
+@cache_resposta("pedidos")
+@orcamento("crud")
 async def contar_pedidos():
     total_pedidos = await db.pedidos.count_documents({})
     return {"quantidade de entidades": total_pedidos}
 
 @router.get("/filter", response_model=dict)
-async def filtrar_pedidos(status: str = None, valor_total: float = None):
-    filtro = {}
+@orcamento("crud")
+async def filtrar_pedidos(status: str = None, valor_total: float = None, modo: str = "prefixo"):
+    if modo not in MODOS_BUSCA:
+        raise HTTPException(status_code=400, detail="Modo de busca inválido")
 
-    if status:
-        filtro["status"] = {"$regex": status, "$options": "i"}
+    filtro = filtro_busca("pedidos", {"status": status}, modo)
     if valor_total:
         filtro["valor_total"] = valor_total
 
-    pedidos = await db.pedidos.find(filtro).to_list(100)
+    pedidos = await buscar(db.pedidos, filtro, modo, projecao=PROJECAO_PEDIDO)
+
+    return responder({"data": pedidos})
+
+# Sem upsert: substituir pedidos existentes exigiria ler cada um para corrigir os agregados
+@router.post("/bulk", response_model=dict)
+async def criar_pedidos_em_lote(request: Request, tamanho_lote: int = BULK_TAMANHO_LOTE):
+    def preparar(pedido_dict):
+        pedido_dict["busca"] = campos_busca("pedidos", pedido_dict)
+
+    async def apos_gravar(pedidos):
+        await registrar_pedidos(db, pedidos)
+
+    resultado = await gravar_em_lote(db_lote.pedidos, Pedido, request, tamanho_lote, False, preparar, apos_gravar)
+    await invalidar("pedidos")
 
-    for pedido in pedidos:
-        pedido["_id"] = str(pedido["_id"])
+    return resultado
 
-    return {"data": pedidos}
\ No newline at end of file
+@router.get("/export")
+async def exportar_pedidos(formato: str = "ndjson", campos: str = None, batch_size: int = BATCH_SIZE_PADRAO):
+    return exportar_colecao(db.pedidos, Pedido, formato, campos, batch_size)
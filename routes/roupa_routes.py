@@ -1,72 +1,150 @@
-from fastapi import APIRouter, HTTPException
-from config import db
-from schemas import Roupa
+from fastapi import APIRouter, Header, HTTPException, Query, Request, Response
+from config import BULK_TAMANHO_LOTE, db, db_lote
+from schemas import IdsLote, Roupa, RoupaParcial
 from bson import ObjectId
+from pymongo import ReturnDocument
+from typing import List, Optional
+from services.paginacao import listar_paginado
+from services.busca import MODOS_BUSCA, buscar, campos_busca, filtro_busca, indice_roupas
+from services.lote import gravar_em_lote
+from services.carregador import buscar_por_ids, resultado_lote, validar_ids
+from services.recomendacoes import relacionadas
+from services.orcamento import orcamento
+from services.coalescencia import coalescer
+from services.cache import cache_resposta, invalidar
+from services.escrita import prefere_minimo, resposta_minima
+from services.concorrencia import (
+    CAMPO_VERSAO, atualizar_versionado, caminhos, campos_enviados, com_etag, versao_esperada
+)
+from services.serializacao import projecao_modelo, responder
+from services.exportacao import BATCH_SIZE_PADRAO, exportar_colecao
 
 router = APIRouter()
 
+PROJECAO_ROUPA = projecao_modelo(Roupa)
+
 @router.post("/", response_model=Roupa)
-async def criar_roupa(roupa: Roupa):
+async def criar_roupa(roupa: Roupa, prefer: Optional[str] = Header(None)):
     roupa_dict = roupa.dict(by_alias=True, exclude={"id"})
+    roupa_dict["busca"] = campos_busca("roupas", roupa_dict)
     nova_roupa = await db.roupas.insert_one(roupa_dict)
+    await invalidar("roupas")
 
-    roupa_criada = await db.roupas.find_one({"_id": nova_roupa.inserted_id})
-
-    if not roupa_criada:
-        raise HTTPException(status_code=400, detail="Erro ao criar roupa")
+    # a resposta sai do próprio payload validado: não é preciso ler o documento de volta
+    roupa_dict["_id"] = str(nova_roupa.inserted_id)
+    indice_roupas.atualizar(roupa_dict["_id"], roupa_dict["nome"])
 
-    roupa_criada["_id"] = str(roupa_criada["_id"])
+    if prefere_minimo(prefer):
+        return resposta_minima(201, f"/roupas/roupa/{roupa_dict['_id']}")
 
-    return roupa_criada
+    del roupa_dict["busca"]
+    return responder(roupa_dict)
 
 
 @router.get("/", response_model=dict)
-async def listar_roupas(skip: int = 0, limit: int = 10):
-    total_roupas = await db.roupas.count_documents({})
-    roupas = await db.roupas.find().skip(skip).limit(limit).to_list(100)
-
-    for roupa in roupas:
-        roupa["_id"] = str(roupa["_id"])
-
-    metadados = {
-        "total": total_roupas,
-        "skip": skip,
-        "limit": limit,
-        "page": (skip // limit) + 1 if limit else 0
-    }
-
-    return {"data": roupas, "metadados": metadados}
+@orcamento("crud")
+async def listar_roupas(skip: int = 0, limit: int = 10, paginacao: str = "offset", cursor: Optional[str] = None,
+                        contar_total: bool = True):
+    return responder(await listar_paginado(
+        db.roupas, skip, limit, paginacao=paginacao, cursor=cursor, contar_total=contar_total,
+        projecao=PROJECAO_ROUPA
+    ))
 
 @router.get("/roupa/{roupa_id}", response_model=Roupa)
-async def obter_roupa(roupa_id: str):
+async def obter_roupa(roupa_id: str, response: Response):
     if not ObjectId.is_valid(roupa_id):
         raise HTTPException(status_code=400, detail="ID inválido")
 
-    roupa = await db.roupas.find_one({"_id": ObjectId(roupa_id)})
+    roupa = await db.roupas.find_one({"_id": ObjectId(roupa_id)}, {**PROJECAO_ROUPA, CAMPO_VERSAO: 1})
 
     if not roupa:
         raise HTTPException(status_code=404, detail="Roupa não encontrada")
 
-    roupa["_id"] = str(roupa["_id"])
+    return responder(com_etag(roupa, response), response)
+
+@router.get("/{roupa_id}/relacionadas", response_model=dict)
+@orcamento("crud")
+async def listar_roupas_relacionadas(roupa_id: str, limit: int = 10, expandir: bool = False):
+    if not ObjectId.is_valid(roupa_id):
+        raise HTTPException(status_code=400, detail="ID inválido")
 
-    return roupa
+    # uma leitura por _id no índice pré-calculado; expandir=true acrescenta um $in nas roupas
+    vizinhos = await relacionadas(db, roupa_id, limit)
+
+    if expandir and vizinhos:
+        ids = [vizinho["roupa_id"] for vizinho in vizinhos if ObjectId.is_valid(vizinho["roupa_id"])]
+        roupas = await buscar_por_ids(db.roupas, ids, PROJECAO_ROUPA)
+        # roupas removidas desde a última reconstrução saem da resposta
+        vizinhos = [
+            {**vizinho, "roupa": roupas[vizinho["roupa_id"]]} for vizinho in vizinhos if vizinho["roupa_id"] in roupas
+        ]
+
+    return responder({"data": vizinhos})
+
+@router.get("/batch", response_model=dict)
+async def obter_roupas_em_lote(ids: List[str] = Query(...)):
+    return await _roupas_em_lote(ids)
+
+
+@router.post("/batch", response_model=dict)
+async def obter_roupas_em_lote_corpo(lote: IdsLote):
+    return await _roupas_em_lote(lote.ids)
+
+
+async def _roupas_em_lote(ids):
+    ids = validar_ids(ids)
+    encontrados = await buscar_por_ids(db.roupas, ids, PROJECAO_ROUPA)
+    return responder(resultado_lote(ids, encontrados))
 
 
 @router.put("/{roupa_id}", response_model=Roupa)
-async def atualizar_roupa(roupa_id: str, roupa: Roupa):
+async def atualizar_roupa(roupa_id: str, roupa: Roupa, response: Response,
+                          prefer: Optional[str] = Header(None), if_match: Optional[str] = Header(None)):
     if not ObjectId.is_valid(roupa_id):
         raise HTTPException(status_code=400, detail="ID inválido")
 
+    versao = versao_esperada(if_match)
     roupa_dict = roupa.dict(by_alias=True, exclude={"id"})
-    resultado = await db.roupas.update_one({"_id": ObjectId(roupa_id)}, {"$set": roupa_dict})
+    roupa_dict["busca"] = campos_busca("roupas", roupa_dict)
+
+    return await _gravar_roupa(roupa_id, {"$set": roupa_dict}, versao, response, prefer)
 
-    if resultado.matched_count == 0:
+
+@router.patch("/{roupa_id}", response_model=Roupa)
+async def atualizar_roupa_parcial(roupa_id: str, roupa: RoupaParcial, response: Response,
+                                  prefer: Optional[str] = Header(None), if_match: Optional[str] = Header(None)):
+    if not ObjectId.is_valid(roupa_id):
+        raise HTTPException(status_code=400, detail="ID inválido")
+
+    versao = versao_esperada(if_match)
+    campos = campos_enviados(roupa)
+
+    # só os campos enviados são gravados; a busca normalizada acompanha os campos alterados
+    alteracoes = caminhos(campos)
+    alteracoes.update(caminhos(campos_busca("roupas", campos), "busca."))
+
+    return await _gravar_roupa(roupa_id, {"$set": alteracoes}, versao, response, prefer)
+
+
+async def _gravar_roupa(roupa_id, atualizacao, versao, response, prefer):
+    projecao = {CAMPO_VERSAO: 1} if prefere_minimo(prefer) else {**PROJECAO_ROUPA, CAMPO_VERSAO: 1}
+    roupa_atualizada = await atualizar_versionado(
+        db.roupas, {"_id": ObjectId(roupa_id)}, atualizacao, versao, projection=projecao,
+        return_document=ReturnDocument.AFTER
+    )
+
+    if not roupa_atualizada:
         raise HTTPException(status_code=404, detail="Roupa não encontrada")
 
-    roupa_atualizada = await db.roupas.find_one({"_id": ObjectId(roupa_id)})
-    roupa_atualizada["_id"] = str(roupa_atualizada["_id"])
+    await invalidar("roupas")
+    if "nome" in atualizacao["$set"]:
+        indice_roupas.atualizar(roupa_id, atualizacao["$set"]["nome"])
+    com_etag(roupa_atualizada, response)
+
+    if prefere_minimo(prefer):
+        return resposta_minima(204, f"/roupas/roupa/{roupa_id}", response)
 
-    return roupa_atualizada
+    return responder(roupa_atualizada, response)
 
 
 @router.delete("/{roupa_id}")
@@ -79,27 +157,48 @@ async def deletar_roupa(roupa_id: str):
     if resultado.deleted_count == 0:
         raise HTTPException(status_code=404, detail="Roupa não encontrada")
 
+    await invalidar("roupas")
+    indice_roupas.descartar(roupa_id)
+
     return {"message": "Roupa deletada com sucesso"}
 
 @router.get("/count")
+@cache_resposta("roupas")
+@coalescer
+@orcamento("crud")
 async def contar_roupas():
     total_roupas = await db.roupas.count_documents({})
     return {"quantidade de entidades": total_roupas}
 
 @router.get("/filter", response_model=dict)
-async def filtrar_roupas(nome: str = None, tamanho: str = None, cor: str = None):
-    filtro = {}
+@orcamento("crud")
+async def filtrar_roupas(nome: str = None, tamanho: str = None, cor: str = None, modo: str = "prefixo"):
+    if modo not in MODOS_BUSCA:
+        raise HTTPException(status_code=400, detail="Modo de busca inválido")
+
+    filtro = filtro_busca("roupas", {"nome": nome, "cor": cor}, modo)
 
-    if nome:
-        filtro["nome"] = {"$regex": nome, "$options": "i"}
     if tamanho:
         filtro["tamanho"] = tamanho
-    if cor:
-        filtro["cor"] = {"$regex": cor, "$options": "i"}
 
-    roupas = await db.roupas.find(filtro).to_list(100)
+    roupas = await buscar(db.roupas, filtro, modo, projecao=PROJECAO_ROUPA)
+
+    return responder({"data": roupas})
+
+@router.post("/bulk", response_model=dict)
+async def criar_roupas_em_lote(request: Request, tamanho_lote: int = BULK_TAMANHO_LOTE, upsert: bool = True):
+    def preparar(roupa_dict):
+        roupa_dict["busca"] = campos_busca("roupas", roupa_dict)
+
+    async def apos_gravar(roupas):
+        for roupa in roupas:
+            indice_roupas.atualizar(str(roupa["_id"]), roupa["nome"])
+
+    resultado = await gravar_em_lote(db_lote.roupas, Roupa, request, tamanho_lote, upsert, preparar, apos_gravar)
+    await invalidar("roupas")
 
-    for roupa in roupas:
-        roupa["_id"] = str(roupa["_id"])
+    return resultado
 
-    return {"data": roupas}
\ No newline at end of file
+@router.get("/export")
+async def exportar_roupas(formato: str = "ndjson", campos: str = None, batch_size: int = BATCH_SIZE_PADRAO):
+    return exportar_colecao(db.roupas, Roupa, formato, campos, batch_size)
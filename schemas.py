@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import List, Optional
 from datetime import datetime
 
 class Roupa(BaseModel):
@@ -10,6 +10,13 @@ class Roupa(BaseModel):
     preco: float
     fornecedor_id: str  # 1:N - Referenciamento
 
+class RoupaParcial(BaseModel):
+    nome: Optional[str] = None
+    tamanho: Optional[str] = None
+    cor: Optional[str] = None
+    preco: Optional[float] = None
+    fornecedor_id: Optional[str] = None
+
 class Fornecedor(BaseModel):
     id: Optional[str] = Field(None, alias="_id")
     nome: str
@@ -18,6 +25,13 @@ class Fornecedor(BaseModel):
     cidade: str
     frete: float
 
+class FornecedorParcial(BaseModel):
+    nome: Optional[str] = None
+    telefone: Optional[str] = None
+    email: Optional[str] = None
+    cidade: Optional[str] = None
+    frete: Optional[float] = None
+
 class Endereco(BaseModel):
     rua: str
     numero: int
@@ -25,6 +39,13 @@ class Endereco(BaseModel):
     cidade: str
     estado: str    
 
+class EnderecoParcial(BaseModel):
+    rua: Optional[str] = None
+    numero: Optional[int] = None
+    cep: Optional[str] = None
+    cidade: Optional[str] = None
+    estado: Optional[str] = None
+
 class Cliente(BaseModel):
     id: Optional[str] = Field(None, alias="_id")
     nome: str
@@ -33,6 +54,13 @@ class Cliente(BaseModel):
     email: str
     endereco: Endereco # 1:1 embedded        
 
+class ClienteParcial(BaseModel): # PATCH: só os campos enviados são gravados
+    nome: Optional[str] = None
+    cpf: Optional[str] = None
+    telefone: Optional[str] = None
+    email: Optional[str] = None
+    endereco: Optional[EnderecoParcial] = None
+
 class Pedido(BaseModel):
     id: Optional[str] = Field(None, alias="_id")
     data: datetime
@@ -40,6 +68,12 @@ class Pedido(BaseModel):
     valor_total: float
     cliente_id : str # 1:N - referencia
 
+class PedidoParcial(BaseModel):
+    data: Optional[datetime] = None
+    status: Optional[str] = None
+    valor_total: Optional[float] = None
+    cliente_id: Optional[str] = None
+
 class ItensPedido(BaseModel): # N:N - Coleção extra 
     id: Optional[str] = Field(None, alias="_id")
     pedido_id: str
@@ -47,3 +81,33 @@ class ItensPedido(BaseModel): # N:N - Coleção extra
     quantidade: int
     preco_unitario: float
     subtotal: float
+
+class ItensPedidoParcial(BaseModel):
+    pedido_id: Optional[str] = None
+    roupa_id: Optional[str] = None
+    quantidade: Optional[int] = None
+    preco_unitario: Optional[float] = None
+    subtotal: Optional[float] = None
+
+class ItemPedidoCompleto(BaseModel): # preço e subtotal vêm da roupa, calculados no servidor
+    roupa_id: str
+    quantidade: int = Field(..., gt=0)
+
+class JobConsulta(BaseModel): # POST /consultas/jobs: consulta pesada executada fora da requisição
+    consulta: str
+    parametros: dict = {}
+
+class SemParametros(BaseModel):
+    pass
+
+class ParametrosPedidosPorAno(BaseModel):
+    ano: int = Field(..., ge=1, le=9998)
+
+class IdsLote(BaseModel): # POST /<entidade>/batch: corpo para listas longas demais para a query string
+    ids: List[str]
+
+class PedidoCompleto(BaseModel):
+    data: datetime
+    status: str
+    cliente_id: str
+    itens: List[ItemPedidoCompleto]
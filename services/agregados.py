@@ -0,0 +1,211 @@
+from datetime import datetime, timezone
+from bson import ObjectId
+from pymongo import UpdateOne
+from services.arquivo import ARQUIVO_ITENS, ARQUIVO_PEDIDOS
+
+# Coleções materializadas mantidas com $inc pelas rotas de escrita
+AGREGADO_STATUS = "agregado_pedidos_status"
+AGREGADO_CLIENTE = "agregado_pedidos_cliente"
+AGREGADO_ROUPA = "agregado_vendas_roupa"
+AGREGADO_DIA = "agregado_vendas_dia"  # um bucket por dia e status
+
+TAMANHO_LOTE = 1000
+
+
+def _dia(data):
+    # o dia é sempre o de UTC: é o que o Motor devolve e o que o $dateToString da reconstrução usa
+    if data.tzinfo:
+        data = data.astimezone(timezone.utc).replace(tzinfo=None)
+    return datetime(data.year, data.month, data.day)
+
+
+def _bucket_dia(data, status):
+    dia = _dia(data)
+    return f"{dia:%Y-%m-%d}|{status or ''}", {"dia": dia, "status": status}
+
+
+def _incrementos_pedido(pedido, sinal):
+    valor = pedido.get("valor_total", 0) * sinal
+    incrementos = [
+        (AGREGADO_STATUS, pedido.get("status"), {"total": sinal, "valor_total": valor}, {}),
+        (AGREGADO_CLIENTE, pedido.get("cliente_id"), {"quantidade_pedidos": sinal, "valor_total": valor}, {}),
+    ]
+
+    if isinstance(pedido.get("data"), datetime):
+        chave, ao_inserir = _bucket_dia(pedido["data"], pedido.get("status"))
+        incrementos.append((AGREGADO_DIA, chave, {
+            "quantidade_pedidos": sinal, "receita": valor, "itens_vendidos": pedido.get("quantidade_itens", 0) * sinal
+        }, ao_inserir))
+
+    return incrementos
+
+
+def _incrementos_item(item, sinal):
+    return [
+        (AGREGADO_ROUPA, item.get("roupa_id"),
+         {"quantidade_vendida": item.get("quantidade", 0) * sinal, "receita": item.get("subtotal", 0) * sinal}, {}),
+    ]
+
+
+async def _itens_por_pedido(db, itens_com_sinal, session=None):
+    # mantém pedidos.quantidade_itens e leva os itens vendidos ao bucket do dia/status do pedido
+    quantidades = {}
+    for item, sinal in itens_com_sinal:
+        pedido_id = str(item.get("pedido_id"))
+        if ObjectId.is_valid(pedido_id):
+            quantidades[pedido_id] = quantidades.get(pedido_id, 0) + item.get("quantidade", 0) * sinal
+
+    quantidades = {pedido_id: quantidade for pedido_id, quantidade in quantidades.items() if quantidade}
+    if not quantidades:
+        return []
+
+    await db.pedidos.bulk_write([
+        UpdateOne({"_id": ObjectId(pedido_id)}, {"$inc": {"quantidade_itens": quantidade}})
+        for pedido_id, quantidade in quantidades.items()
+    ], ordered=False, session=session)
+
+    incrementos = []
+    filtro = {"_id": {"$in": [ObjectId(pedido_id) for pedido_id in quantidades]}}
+    async for pedido in db.pedidos.find(filtro, {"data": 1, "status": 1}, session=session):
+        if isinstance(pedido.get("data"), datetime):
+            chave, ao_inserir = _bucket_dia(pedido["data"], pedido.get("status"))
+            incrementos.append((AGREGADO_DIA, chave, {"itens_vendidos": quantidades[str(pedido["_id"])]}, ao_inserir))
+
+    return incrementos
+
+
+async def _aplicar(db, incrementos, session=None):
+    # incrementos da mesma chave viram um único $inc
+    combinados = {}
+    for colecao, chave, inc, ao_inserir in incrementos:
+        atual = combinados.setdefault((colecao, chave), ({}, ao_inserir))[0]
+        for campo, valor in inc.items():
+            atual[campo] = atual.get(campo, 0) + valor
+
+    operacoes = {}
+    for (colecao, chave), (inc, ao_inserir) in combinados.items():
+        atualizacao = {"$inc": inc}
+        if ao_inserir:
+            atualizacao["$setOnInsert"] = ao_inserir
+        operacoes.setdefault(colecao, []).append(UpdateOne({"_id": chave}, atualizacao, upsert=True))
+
+    for colecao, lote in operacoes.items():
+        await db[colecao].bulk_write(lote, ordered=False, session=session)
+
+
+async def registrar_pedido(db, pedido, sinal=1, session=None):
+    await _aplicar(db, _incrementos_pedido(pedido, sinal), session)
+
+
+async def registrar_pedidos(db, pedidos, session=None):
+    await _aplicar(db, [inc for pedido in pedidos for inc in _incrementos_pedido(pedido, 1)], session)
+
+
+async def substituir_pedido(db, antigo, novo, session=None):
+    # o $set do PUT não toca em quantidade_itens: o pedido novo herda a do anterior
+    novo = {"quantidade_itens": antigo.get("quantidade_itens", 0), **novo}
+    await _aplicar(db, _incrementos_pedido(antigo, -1) + _incrementos_pedido(novo, 1), session)
+
+
+async def registrar_item(db, item, sinal=1, session=None):
+    incrementos = _incrementos_item(item, sinal) + await _itens_por_pedido(db, [(item, sinal)], session)
+    await _aplicar(db, incrementos, session)
+
+
+async def registrar_itens(db, itens, sinal=1, session=None):
+    incrementos = [inc for item in itens for inc in _incrementos_item(item, sinal)]
+    incrementos += await _itens_por_pedido(db, [(item, sinal) for item in itens], session)
+    await _aplicar(db, incrementos, session)
+
+
+async def substituir_item(db, antigo, novo, session=None):
+    incrementos = _incrementos_item(antigo, -1) + _incrementos_item(novo, 1)
+    incrementos += await _itens_por_pedido(db, [(antigo, -1), (novo, 1)], session)
+    await _aplicar(db, incrementos, session)
+
+
+async def _recalcular_quantidade_itens(db, modo_itens):
+    if modo_itens == "embutido":
+        await db.pedidos.update_many({}, [{"$set": {"quantidade_itens": {"$sum": "$itens.quantidade"}}}])
+        return
+
+    await db.pedidos.update_many({}, {"$set": {"quantidade_itens": 0}})
+
+    operacoes = []
+    async for grupo in db.itens_pedidos.aggregate([
+        {"$group": {"_id": "$pedido_id", "quantidade": {"$sum": "$quantidade"}}},
+    ], allowDiskUse=True):
+        pedido_id = str(grupo["_id"])
+        if ObjectId.is_valid(pedido_id):
+            operacoes.append(
+                UpdateOne({"_id": ObjectId(pedido_id)}, {"$set": {"quantidade_itens": grupo["quantidade"]}})
+            )
+        if len(operacoes) >= TAMANHO_LOTE:
+            await db.pedidos.bulk_write(operacoes, ordered=False)
+            operacoes = []
+
+    if operacoes:
+        await db.pedidos.bulk_write(operacoes, ordered=False)
+
+
+async def reconstruir_agregados(db, modo_itens="colecao"):
+    await _recalcular_quantidade_itens(db, modo_itens)
+
+    # pedidos arquivados continuam contando nos agregados
+    todos_pedidos = {"$unionWith": ARQUIVO_PEDIDOS}
+
+    await db.pedidos.aggregate([
+        todos_pedidos,
+        {"$group": {"_id": "$status", "total": {"$sum": 1}, "valor_total": {"$sum": "$valor_total"}}},
+        {"$out": AGREGADO_STATUS},
+    ], allowDiskUse=True).to_list(None)
+
+    await db.pedidos.aggregate([
+        todos_pedidos,
+        {"$group": {"_id": "$cliente_id", "quantidade_pedidos": {"$sum": 1}, "valor_total": {"$sum": "$valor_total"}}},
+        {"$out": AGREGADO_CLIENTE},
+    ], allowDiskUse=True).to_list(None)
+
+    await db.pedidos.aggregate([
+        todos_pedidos,
+        {"$match": {"data": {"$type": "date"}}},
+        {"$group": {
+            "_id": {"dia": {"$dateToString": {"format": "%Y-%m-%d", "date": "$data"}}, "status": "$status"},
+            "dia": {"$first": {"$dateFromParts": {
+                "year": {"$year": "$data"}, "month": {"$month": "$data"}, "day": {"$dayOfMonth": "$data"}
+            }}},
+            "quantidade_pedidos": {"$sum": 1},
+            "receita": {"$sum": "$valor_total"},
+            "itens_vendidos": {"$sum": {"$ifNull": ["$quantidade_itens", 0]}},
+        }},
+        {"$project": {
+            "_id": {"$concat": ["$_id.dia", "|", {"$ifNull": ["$_id.status", ""]}]},
+            "dia": 1,
+            "status": "$_id.status",
+            "quantidade_pedidos": 1,
+            "receita": 1,
+            "itens_vendidos": 1,
+        }},
+        {"$out": AGREGADO_DIA},
+    ], allowDiskUse=True).to_list(None)
+
+    vendas_por_roupa = [
+        {"$group": {"_id": "$roupa_id", "quantidade_vendida": {"$sum": "$quantidade"}, "receita": {"$sum": "$subtotal"}}},
+        {"$out": AGREGADO_ROUPA},
+    ]
+    if modo_itens == "embutido":
+        await db.pedidos.aggregate(
+            [todos_pedidos, {"$unwind": "$itens"}, {"$replaceRoot": {"newRoot": "$itens"}}] + vendas_por_roupa,
+            allowDiskUse=True
+        ).to_list(None)
+    else:
+        await db.itens_pedidos.aggregate(
+            [{"$unionWith": ARQUIVO_ITENS}] + vendas_por_roupa, allowDiskUse=True
+        ).to_list(None)
+
+
+if __name__ == "__main__":
+    import asyncio
+    from config import MODO_ITENS, db
+
+    asyncio.run(reconstruir_agregados(db, MODO_ITENS))
@@ -0,0 +1,179 @@
+from datetime import datetime, timedelta
+from bson import ObjectId
+from pymongo import DeleteOne, ReplaceOne
+from config import ARQUIVO_IDADE_DIAS, ARQUIVO_STATUS, MODO_ITENS
+from services.carregador import buscar_por_ids
+from services.concorrencia import CAMPO_VERSAO
+from services.itens import repositorio_itens
+from services.juncoes import ids_em_ambos_tipos, juntar_filhos
+from services.orcamento import opcoes_agregacao
+
+# pedidos antigos em status final ficam nestas coleções, com o mesmo formato das quentes e somente leitura
+ARQUIVO_PEDIDOS = "pedidos_arquivo"
+ARQUIVO_ITENS = "itens_pedidos_arquivo"
+CONTROLE = "arquivo_controle"
+ID_CONTROLE = "pedidos"
+
+_limites = {}
+
+
+async def limite_arquivo(db):
+    # maior "data" já arquivada: períodos posteriores a ela nunca precisam consultar o arquivo
+    controle = await db[CONTROLE].find_one({"_id": ID_CONTROLE}, {"data_maxima": 1})
+    limite = controle.get("data_maxima") if controle else None
+    if limite is not None:
+        _limites[db.name] = limite
+
+    return limite
+
+
+async def precisa_arquivo(db, inicio):
+    # o limite só cresce ($max): o valor já visto basta para confirmar; para negar, relê o controle,
+    # que pode ter avançado por um arquivamento feito em outro processo
+    conhecido = _limites.get(db.name)
+    if conhecido is not None and inicio <= conhecido:
+        return True
+
+    limite = await limite_arquivo(db)
+    return limite is not None and inicio <= limite
+
+
+def unir_arquivo(filtro, etapas=()):
+    return {"$unionWith": {"coll": ARQUIVO_PEDIDOS, "pipeline": [{"$match": filtro}, *etapas]}}
+
+
+def pedidos_com_arquivo(db, filtro, projecao, ordenacao=None, skip=0, limit=None, **opcoes):
+    # cada lado ordena e corta em skip+limit pelo próprio índice (data_id); a união só junta as duas pontas
+    por_lado = []
+    if ordenacao:
+        por_lado.append({"$sort": dict(ordenacao)})
+        if limit:
+            por_lado.append({"$limit": skip + limit})
+
+    etapas = [{"$match": filtro}, *por_lado, unir_arquivo(filtro, por_lado)]
+    if ordenacao:
+        etapas.append({"$sort": dict(ordenacao)})
+    if skip:
+        etapas.append({"$skip": skip})
+    if limit:
+        etapas.append({"$limit": limit})
+    etapas.append({"$project": projecao})
+    return db.pedidos.aggregate(etapas, **opcoes_agregacao(), **opcoes)
+
+
+async def pedido_arquivado(db, pedido_id, projecao):
+    return await db[ARQUIVO_PEDIDOS].find_one({"_id": pedido_id}, projecao)
+
+
+async def buscar_arquivados(db, ids, projecao):
+    return await buscar_por_ids(db[ARQUIVO_PEDIDOS], ids, projecao)
+
+
+async def juntar_itens_arquivados(db, pedidos, modo_itens=MODO_ITENS):
+    if modo_itens == "embutido":
+        return await repositorio_itens(db, modo_itens).juntar(pedidos)
+    return await juntar_filhos(pedidos, db[ARQUIVO_ITENS], "pedido_id", "itens")
+
+
+async def itens_arquivados(db, pedido_id, skip, limit, projecao, modo_itens=MODO_ITENS):
+    if modo_itens == "embutido":
+        pedido = await db[ARQUIVO_PEDIDOS].find_one({"_id": ObjectId(pedido_id)}, {"itens": {"$slice": [skip, limit]}})
+        if not pedido:
+            return []
+        await juntar_itens_arquivados(db, [pedido], modo_itens)
+        return pedido["itens"]
+
+    return await db[ARQUIVO_ITENS].find({"pedido_id": pedido_id}, projecao).skip(skip).limit(limit).to_list(100)
+
+
+async def _mover_itens(db, pedido_ids):
+    # copia e remove por versão: linha alterada ou incluída depois da cópia é copiada de novo na volta seguinte
+    filtro = {"pedido_id": {"$in": ids_em_ambos_tipos(pedido_ids)}}
+    while True:
+        itens = await db.itens_pedidos.find(filtro).to_list(None)
+        if not itens:
+            return
+
+        await db[ARQUIVO_ITENS].bulk_write(
+            [ReplaceOne({"_id": item["_id"]}, item, upsert=True) for item in itens], ordered=False
+        )
+        await db.itens_pedidos.bulk_write(
+            [DeleteOne({"_id": item["_id"], CAMPO_VERSAO: item.get(CAMPO_VERSAO)}) for item in itens], ordered=False
+        )
+
+
+async def _concluir_lote(db, ids, modo_itens=MODO_ITENS):
+    # o que ainda está na coleção quente mudou depois da cópia: continua quente e a cópia fria é descartada
+    restantes = set(await db.pedidos.distinct("_id", {"_id": {"$in": ids}}))
+    arquivados = [pedido_id for pedido_id in ids if pedido_id not in restantes]
+
+    if restantes:
+        await db[ARQUIVO_PEDIDOS].delete_many({"_id": {"$in": list(restantes)}})
+        await db[ARQUIVO_ITENS].delete_many({"pedido_id": {"$in": ids_em_ambos_tipos(restantes)}})
+
+    atualizacao = {"$unset": {"lote": ""}, "$inc": {"arquivados": len(arquivados)}}
+    if arquivados:
+        if modo_itens != "embutido":
+            await _mover_itens(db, arquivados)
+
+        mais_recente = await db[ARQUIVO_PEDIDOS].find(
+            {"_id": {"$in": arquivados}, "data": {"$type": "date"}}, {"data": 1}
+        ).sort("data", -1).to_list(1)
+        if mais_recente:
+            atualizacao["$max"] = {"data_maxima": mais_recente[0]["data"]}
+
+    await db[CONTROLE].update_one({"_id": ID_CONTROLE}, atualizacao, upsert=True)
+
+    return len(arquivados), len(restantes)
+
+
+async def _arquivar_lote(db, pedidos, modo_itens):
+    ids = [pedido["_id"] for pedido in pedidos]
+
+    # cópias com upsert: repetir um lote interrompido não duplica nada;
+    # as linhas só se movem em _concluir_lote, depois que o pedido saiu da coleção quente
+    await db[ARQUIVO_PEDIDOS].bulk_write(
+        [ReplaceOne({"_id": pedido["_id"]}, pedido, upsert=True) for pedido in pedidos], ordered=False
+    )
+
+    # diário do lote: se o processo cair daqui em diante, a próxima execução termina a remoção
+    await db[CONTROLE].update_one({"_id": ID_CONTROLE}, {"$set": {"lote": ids}}, upsert=True)
+
+    # só sai da coleção quente o pedido que não foi alterado desde a cópia
+    await db.pedidos.bulk_write(
+        [DeleteOne({"_id": pedido["_id"], CAMPO_VERSAO: pedido.get(CAMPO_VERSAO)}) for pedido in pedidos],
+        ordered=False
+    )
+
+    return await _concluir_lote(db, ids, modo_itens)
+
+
+async def arquivar_pedidos(db, idade_dias=ARQUIVO_IDADE_DIAS, status=ARQUIVO_STATUS, tamanho_lote=1000,
+                           modo_itens=MODO_ITENS):
+    arquivados = mantidos = 0
+
+    controle = await db[CONTROLE].find_one({"_id": ID_CONTROLE, "lote": {"$exists": True}})
+    if controle:
+        arquivados, mantidos = await _concluir_lote(db, controle["lote"], modo_itens)
+
+    corte = datetime.utcnow() - timedelta(days=idade_dias)
+    filtro = {"data": {"$lt": corte}, "status": {"$in": list(status)}}
+
+    while True:
+        pedidos = await db.pedidos.find(filtro).sort("_id", 1).limit(tamanho_lote).to_list(None)
+        if not pedidos:
+            break
+
+        movidos, alterados = await _arquivar_lote(db, pedidos, modo_itens)
+        arquivados += movidos
+        mantidos += alterados
+        filtro["_id"] = {"$gt": pedidos[-1]["_id"]}
+
+    return {"arquivados": arquivados, "mantidos": mantidos, "corte": corte}
+
+
+if __name__ == "__main__":
+    import asyncio
+    from config import BULK_TAMANHO_LOTE, db
+
+    print(asyncio.run(arquivar_pedidos(db, tamanho_lote=BULK_TAMANHO_LOTE)))
@@ -0,0 +1,177 @@
+import asyncio
+import re
+import unicodedata
+from collections import defaultdict
+from datetime import datetime
+from pymongo import UpdateOne
+
+# Campos de busca normalizados ficam em "busca.<campo>" em cada documento
+CAMPOS_BUSCA = {
+    "clientes": {"nome": "nome", "cpf": "cpf", "email": "email", "cidade": "endereco.cidade"},
+    "roupas": {"nome": "nome", "cor": "cor"},
+    "fornecedores": {"nome": "nome", "telefone": "telefone", "cidade": "cidade"},
+    "pedidos": {"status": "status"},
+}
+
+MODOS_BUSCA = ("prefixo", "texto")
+
+# campos cobertos pelo índice de texto de cada coleção (services/indices.py);
+# os demais usam prefixo mesmo no modo texto
+CAMPOS_TEXTO = {
+    "clientes": ("nome", "email"),
+    "roupas": ("nome", "cor"),
+    "fornecedores": ("nome", "cidade"),
+    "pedidos": (),
+}
+
+PROJECAO_PUBLICA = {"busca": 0, "versao": 0}
+
+TAMANHO_LOTE = 1000
+
+# migrações de uma vez só: o documento marca a conclusão e o startup não varre as coleções de novo
+MIGRACOES = "migracoes"
+ID_CAMPOS_BUSCA = "campos_busca"
+
+
+def normalizar(texto):
+    texto = unicodedata.normalize("NFKD", str(texto))
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return " ".join(texto.casefold().split())
+
+
+def _valor(documento, caminho):
+    for parte in caminho.split("."):
+        if not isinstance(documento, dict):
+            return None
+        documento = documento.get(parte)
+    return documento
+
+
+def campos_busca(colecao, documento):
+    campos = {}
+    for campo, caminho in CAMPOS_BUSCA[colecao].items():
+        valor = _valor(documento, caminho)
+        if valor is not None:
+            campos[campo] = normalizar(valor)
+    return campos
+
+
+def filtro_prefixo(campo, valor):
+    # regex ancorada e sem opções sobre o campo normalizado usa o índice
+    return {f"busca.{campo}": {"$regex": "^" + re.escape(normalizar(valor))}}
+
+
+def filtro_busca(colecao, valores, modo="prefixo"):
+    valores = {campo: valor for campo, valor in valores.items() if valor}
+
+    filtro = {}
+    if modo == "texto":
+        texto = [valor for campo, valor in valores.items() if campo in CAMPOS_TEXTO[colecao]]
+        if texto:
+            filtro["$text"] = {"$search": " ".join(texto)}
+        valores = {campo: valor for campo, valor in valores.items() if campo not in CAMPOS_TEXTO[colecao]}
+
+    for campo, valor in valores.items():
+        filtro.update(filtro_prefixo(campo, valor))
+    return filtro
+
+
+async def buscar(colecao, filtro, modo="prefixo", skip=0, limit=100, projecao=PROJECAO_PUBLICA):
+    # no modo texto, campos fora do índice de texto podem ter virado só filtros de prefixo
+    if modo == "texto" and "$text" in filtro:
+        projecao = {**projecao, "score": {"$meta": "textScore"}}
+        cursor = colecao.find(filtro, projecao).sort([("score", {"$meta": "textScore"})])
+    else:
+        cursor = colecao.find(filtro, projecao)
+
+    return await cursor.skip(skip).limit(limit).to_list(100)
+
+
+async def preencher_campos_busca(db, forcar=False):
+    # o filtro por "busca" ausente não tem índice: cada execução varre as coleções inteiras
+    if not forcar and await db[MIGRACOES].find_one({"_id": ID_CAMPOS_BUSCA}):
+        return False
+
+    for colecao, campos in CAMPOS_BUSCA.items():
+        projecao = {caminho: 1 for caminho in campos.values()}
+        cursor = db[colecao].find({"busca": {"$exists": False}}, projecao).batch_size(TAMANHO_LOTE)
+
+        operacoes = []
+        async for documento in cursor:
+            operacoes.append(UpdateOne({"_id": documento["_id"]}, {"$set": {"busca": campos_busca(colecao, documento)}}))
+            if len(operacoes) >= TAMANHO_LOTE:
+                await db[colecao].bulk_write(operacoes, ordered=False)
+                operacoes = []
+
+        if operacoes:
+            await db[colecao].bulk_write(operacoes, ordered=False)
+
+    await db[MIGRACOES].update_one(
+        {"_id": ID_CAMPOS_BUSCA}, {"$set": {"concluido_em": datetime.utcnow()}}, upsert=True
+    )
+    return True
+
+
+class IndiceNgram:
+    def __init__(self, n=3):
+        self.n = n
+        self.postagens = defaultdict(set)
+        self.ngrams = {}
+        self.carregado = False
+        self._trava = asyncio.Lock()
+
+    def _gerar(self, texto):
+        texto = f" {normalizar(texto)} "
+        if len(texto) < self.n:
+            return {texto}
+        return {texto[i:i + self.n] for i in range(len(texto) - self.n + 1)}
+
+    def adicionar(self, documento_id, texto):
+        self.remover(documento_id)
+        ngrams = self._gerar(texto)
+        self.ngrams[documento_id] = ngrams
+        for ngram in ngrams:
+            self.postagens[ngram].add(documento_id)
+
+    def remover(self, documento_id):
+        for ngram in self.ngrams.pop(documento_id, ()):
+            self.postagens[ngram].discard(documento_id)
+            if not self.postagens[ngram]:
+                del self.postagens[ngram]
+
+    def buscar(self, texto, minimo=0.4):
+        consulta = self._gerar(texto)
+        comuns = defaultdict(int)
+        for ngram in consulta:
+            for documento_id in self.postagens.get(ngram, ()):
+                comuns[documento_id] += 1
+
+        # fração dos n-gramas da consulta presentes no documento; empates pelo coeficiente de Dice
+        resultados = []
+        for documento_id, quantidade in comuns.items():
+            score = quantidade / len(consulta)
+            if score >= minimo:
+                dice = 2 * quantidade / (len(consulta) + len(self.ngrams[documento_id]))
+                resultados.append((documento_id, round(score, 4), dice))
+
+        resultados.sort(key=lambda resultado: (resultado[1], resultado[2]), reverse=True)
+        return [(documento_id, score) for documento_id, score, _ in resultados]
+
+    async def carregar(self, colecao, campo="nome"):
+        async with self._trava:
+            if self.carregado:
+                return
+            async for documento in colecao.find({}, {campo: 1}).batch_size(TAMANHO_LOTE):
+                self.adicionar(str(documento["_id"]), documento.get(campo, ""))
+            self.carregado = True
+
+    def atualizar(self, documento_id, texto):
+        if self.carregado:
+            self.adicionar(documento_id, texto)
+
+    def descartar(self, documento_id):
+        if self.carregado:
+            self.remover(documento_id)
+
+
+indice_roupas = IndiceNgram()
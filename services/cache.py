@@ -0,0 +1,137 @@
+import functools
+import hashlib
+import inspect
+import time
+from collections import OrderedDict
+from fastapi import Request, Response
+from config import CACHE_BACKEND, CACHE_CAPACIDADE, CACHE_TTL, REDIS_URL
+from services.serializacao import serializar
+
+
+class CacheMemoria:
+    def __init__(self, capacidade):
+        self.capacidade = capacidade
+        self.entradas = OrderedDict()
+        self.tags = {}
+
+    async def obter(self, chave):
+        entrada = self.entradas.get(chave)
+        if not entrada:
+            return None
+
+        expira_em, valor, _ = entrada
+        if expira_em < time.monotonic():
+            self._remover(chave)
+            return None
+
+        self.entradas.move_to_end(chave)
+        return valor
+
+    def _remover(self, chave):
+        _, _, tags = self.entradas.pop(chave)
+        for tag in tags:
+            self.tags.get(tag, set()).discard(chave)
+
+    async def gravar(self, chave, valor, ttl, tags):
+        if chave in self.entradas:
+            self._remover(chave)
+
+        self.entradas[chave] = (time.monotonic() + ttl, valor, tags)
+        for tag in tags:
+            self.tags.setdefault(tag, set()).add(chave)
+
+        while len(self.entradas) > self.capacidade:
+            self._remover(next(iter(self.entradas)))
+
+    async def invalidar(self, tag):
+        for chave in list(self.tags.pop(tag, ())):
+            if chave in self.entradas:
+                self._remover(chave)
+
+    async def fechar(self):
+        pass
+
+
+class CacheRedis:
+    def __init__(self, url):
+        import redis.asyncio as redis
+
+        self.redis = redis.from_url(url)
+
+    async def obter(self, chave):
+        return await self.redis.get(f"cache:{chave}")
+
+    async def gravar(self, chave, valor, ttl, tags):
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.set(f"cache:{chave}", valor, ex=ttl)
+            for tag in tags:
+                pipe.sadd(f"cache_tag:{tag}", chave)
+            await pipe.execute()
+
+    async def fechar(self):
+        await self.redis.aclose()
+
+    async def invalidar(self, tag):
+        chaves = await self.redis.smembers(f"cache_tag:{tag}")
+        if chaves:
+            await self.redis.delete(*[f"cache:{chave.decode()}" for chave in chaves])
+        await self.redis.delete(f"cache_tag:{tag}")
+
+
+def _criar_cache():
+    if CACHE_BACKEND == "redis":
+        return CacheRedis(REDIS_URL)
+    return CacheMemoria(CACHE_CAPACIDADE)
+
+
+cache = _criar_cache()
+
+
+async def invalidar(*tags):
+    for tag in tags:
+        await cache.invalidar(tag)
+
+
+def _chave(request):
+    parametros = "&".join(f"{nome}={valor}" for nome, valor in sorted(request.query_params.multi_items()))
+    return f"{request.method}:{request.url.path}?{parametros}"
+
+
+def _resposta(corpo, etag, request, origem):
+    cabecalhos = {"ETag": etag, "X-Cache": origem}
+
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=cabecalhos)
+
+    return Response(content=corpo, media_type="application/json", headers=cabecalhos)
+
+
+def cache_resposta(*tags, ttl=CACHE_TTL):
+    def decorador(funcao):
+        assinatura = inspect.signature(funcao)
+        parametros = list(assinatura.parameters.values())
+        parametros.append(inspect.Parameter("request_cache", inspect.Parameter.KEYWORD_ONLY, annotation=Request))
+
+        @functools.wraps(funcao)
+        async def envoltorio(*args, request_cache: Request, **kwargs):
+            chave = _chave(request_cache)
+
+            em_cache = await cache.obter(chave)
+            if em_cache:
+                etag, corpo = em_cache.split(b"\n", 1)
+                return _resposta(corpo, etag.decode(), request_cache, "HIT")
+
+            resultado = await funcao(*args, **kwargs)
+            if isinstance(resultado, Response):
+                return resultado
+
+            corpo = serializar(resultado)
+            etag = '"' + hashlib.sha1(corpo).hexdigest() + '"'
+            await cache.gravar(chave, etag.encode() + b"\n" + corpo, ttl, tags)
+
+            return _resposta(corpo, etag, request_cache, "MISS")
+
+        envoltorio.__signature__ = assinatura.replace(parameters=parametros)
+        return envoltorio
+
+    return decorador
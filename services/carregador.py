@@ -0,0 +1,90 @@
+import asyncio
+from bson import ObjectId
+from fastapi import HTTPException
+
+IDS_POR_LOTE_MAXIMO = 1000
+
+
+def validar_ids(ids):
+    # aceita ?ids=a,b e ?ids=a&ids=b; ids repetidos viram uma única chave
+    ids = list(dict.fromkeys(parte.strip() for valor in ids for parte in valor.split(",") if parte.strip()))
+
+    if not ids:
+        raise HTTPException(status_code=400, detail="Informe ao menos um id")
+    if len(ids) > IDS_POR_LOTE_MAXIMO:
+        raise HTTPException(status_code=400, detail=f"No máximo {IDS_POR_LOTE_MAXIMO} ids por requisição")
+
+    invalidos = [documento_id for documento_id in ids if not ObjectId.is_valid(documento_id)]
+    if invalidos:
+        raise HTTPException(status_code=400, detail={"mensagem": "IDs inválidos", "ids": invalidos})
+
+    return ids
+
+
+async def buscar_por_ids(colecao, ids, projecao):
+    encontrados = {}
+    async for documento in colecao.find({"_id": {"$in": [ObjectId(documento_id) for documento_id in ids]}}, projecao):
+        encontrados[str(documento["_id"])] = documento
+    return encontrados
+
+
+def resultado_lote(ids, encontrados):
+    # todo id pedido aparece na resposta: null marca o que não existe
+    return {
+        "data": {documento_id: encontrados.get(documento_id) for documento_id in ids},
+        "nao_encontrados": [documento_id for documento_id in ids if documento_id not in encontrados],
+    }
+
+
+class Carregador:
+    # chamadas a carregar() no mesmo ciclo do event loop viram um único $in
+    def __init__(self, buscar):
+        self.buscar = buscar
+        self.futuros = {}
+        self.pendentes = []
+
+    def carregar(self, documento_id):
+        chave = str(documento_id)
+        if chave in self.futuros:
+            return self.futuros[chave]
+
+        futuro = asyncio.get_running_loop().create_future()
+        self.futuros[chave] = futuro
+
+        if not ObjectId.is_valid(chave):
+            futuro.set_result(None)
+            return futuro
+
+        if not self.pendentes:
+            asyncio.get_running_loop().call_soon(lambda: asyncio.ensure_future(self._despachar()))
+        self.pendentes.append(chave)
+        return futuro
+
+    async def carregar_muitos(self, ids):
+        return await asyncio.gather(*(self.carregar(documento_id) for documento_id in ids))
+
+    async def _despachar(self):
+        chaves, self.pendentes = self.pendentes, []
+        try:
+            encontrados = await self.buscar(chaves)
+        except Exception as erro:
+            for chave in chaves:
+                self.futuros[chave].set_exception(erro)
+            return
+
+        for chave in chaves:
+            self.futuros[chave].set_result(encontrados.get(chave))
+
+
+class Carregadores:
+    # um conjunto por requisição: o cache dos carregadores não sobrevive a ela
+    def __init__(self, db, projecoes):
+        self.db = db
+        self.projecoes = projecoes
+        self.carregadores = {}
+
+    def __getitem__(self, colecao):
+        if colecao not in self.carregadores:
+            projecao = self.projecoes.get(colecao)
+            self.carregadores[colecao] = Carregador(lambda ids: buscar_por_ids(self.db[colecao], ids, projecao))
+        return self.carregadores[colecao]
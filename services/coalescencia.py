@@ -0,0 +1,38 @@
+import asyncio
+import functools
+from services.metricas import COALESCENCIA, COALESCENCIA_EM_VOO
+
+_em_voo = {}
+
+
+def coalescer(funcao):
+    # requisições idênticas simultâneas esperam a mesma execução em vez de repetir a consulta;
+    # fica abaixo do cache_resposta: só as misses chegam aqui
+    rota = funcao.__name__
+
+    @functools.wraps(funcao)
+    async def envoltorio(*args, **kwargs):
+        chave = (rota, repr(args), repr(sorted(kwargs.items())))
+
+        tarefa = _em_voo.get(chave)
+        if tarefa is not None:
+            COALESCENCIA.labels(rota, "compartilhada").inc()
+        else:
+            COALESCENCIA.labels(rota, "executada").inc()
+            tarefa = asyncio.ensure_future(funcao(*args, **kwargs))
+            _em_voo[chave] = tarefa
+            COALESCENCIA_EM_VOO.labels(rota).inc()
+            tarefa.add_done_callback(lambda _: _encerrar(chave, tarefa, rota))
+
+        # shield: um cliente que desconecta não cancela a consulta dos outros que esperam por ela
+        return await asyncio.shield(tarefa)
+
+    return envoltorio
+
+
+def _encerrar(chave, tarefa, rota):
+    if _em_voo.get(chave) is tarefa:
+        del _em_voo[chave]
+    COALESCENCIA_EM_VOO.labels(rota).dec()
+    if not tarefa.cancelled():
+        tarefa.exception()  # marca a exceção como lida quando todos os que esperavam já foram cancelados
@@ -0,0 +1,72 @@
+from fastapi import HTTPException
+
+# Cada escrita incrementa "versao"; o ETag das respostas é essa versão e o If-Match a condiciona
+CAMPO_VERSAO = "versao"
+
+CONFLITO = "O documento foi alterado por outra escrita"
+
+
+def etag(versao):
+    return f'"{versao or 0}"'
+
+
+def versao_esperada(if_match):
+    # If-Match: "3" (ou W/"3"); "*" ou ausente não condiciona a escrita
+    if not if_match or if_match.strip() == "*":
+        return None
+
+    valor = if_match.strip()
+    if valor.startswith("W/"):
+        valor = valor[2:]
+    valor = valor.strip('"')
+
+    if not valor.isdigit():
+        raise HTTPException(status_code=400, detail="If-Match deve ser o ETag retornado pela API")
+    return int(valor)
+
+
+def condicao_versao(versao, campo=CAMPO_VERSAO):
+    if versao is None:
+        return {}
+    # documentos gravados antes do controle de versão contam como versão 0
+    return {campo: versao if versao else {"$in": [0, None]}}
+
+
+def caminhos(campos, prefixo=""):
+    # só os campos enviados vão para o $set; objetos embutidos viram caminhos ("endereco.cidade")
+    resultado = {}
+    for campo, valor in campos.items():
+        if isinstance(valor, dict):
+            if not valor:
+                # um $set de {} apagaria o objeto inteiro em vez de não alterar nada
+                raise HTTPException(status_code=400, detail=f"Campo '{prefixo}{campo}' não pode ser um objeto vazio")
+            resultado.update(caminhos(valor, f"{prefixo}{campo}."))
+        elif valor is None:
+            raise HTTPException(status_code=400, detail=f"Campo '{prefixo}{campo}' não pode ser nulo")
+        else:
+            resultado[f"{prefixo}{campo}"] = valor
+    return resultado
+
+
+def campos_enviados(parcial):
+    campos = parcial.dict(by_alias=True, exclude_unset=True)
+    if not campos:
+        raise HTTPException(status_code=400, detail="Nenhum campo para atualizar")
+    return campos
+
+
+async def atualizar_versionado(colecao, filtro, atualizacao, versao, **opcoes):
+    # o $inc da versão vai na mesma escrita: quem leu uma versão anterior recebe 412, não perde a atualização
+    atualizacao = {**atualizacao, "$inc": {CAMPO_VERSAO: 1}}
+    documento = await colecao.find_one_and_update({**filtro, **condicao_versao(versao)}, atualizacao, **opcoes)
+
+    if documento is None and versao is not None and await colecao.count_documents(filtro, limit=1):
+        raise HTTPException(status_code=412, detail=CONFLITO)
+
+    return documento
+
+
+def com_etag(documento, response):
+    # a versão sai do corpo e vai para o cabeçalho ETag
+    response.headers["ETag"] = etag(documento.pop(CAMPO_VERSAO, 0))
+    return documento
@@ -0,0 +1,12 @@
+from fastapi import Response
+
+
+def prefere_minimo(prefer):
+    # RFC 7240: "Prefer: return=minimal" dispensa o corpo da resposta
+    return bool(prefer) and "return=minimal" in prefer.replace(" ", "").split(",")
+
+
+def resposta_minima(status_code, localizacao, response=None):
+    cabecalhos = dict(response.headers) if response is not None else {}
+    cabecalhos.update({"Location": localizacao, "Preference-Applied": "return=minimal"})
+    return Response(status_code=status_code, headers=cabecalhos)
@@ -0,0 +1,116 @@
+import asyncio
+import logging
+from pymongo.errors import OperationFailure
+from config import EVENTOS_FILA_MAXIMA, MODO_ITENS
+from services.cache import invalidar
+from services.metricas import EVENTOS_MUDANCA
+from services.serializacao import serializar
+
+logger = logging.getLogger("gestao_roupas.eventos")
+
+COLECOES_EVENTOS = ("pedidos", "itens_pedidos")
+OPERACOES = ("insert", "update", "replace", "delete")
+
+# InvalidResumeToken, ChangeStreamFatalError, ChangeStreamHistoryLost: o token não serve mais
+TOKEN_INVALIDO = (260, 280, 286)
+SEM_REPLICA_SET = 40573
+
+
+def _pipeline(colecoes):
+    return [
+        {"$match": {"ns.coll": {"$in": list(colecoes)}, "operationType": {"$in": list(OPERACOES)}}},
+        {"$project": {"fullDocument.busca": 0}},
+    ]
+
+
+def observar(db, token=None, colecoes=COLECOES_EVENTOS):
+    # um change stream no banco inteiro cobre as duas coleções com um único cursor
+    opcoes = {"full_document": "updateLookup"}
+    if token:
+        opcoes["resume_after"] = {"_data": token}
+    return db.watch(_pipeline(colecoes), **opcoes)
+
+
+def evento(mudanca):
+    descricao = mudanca.get("updateDescription") or {}
+    return {
+        "id": mudanca["_id"]["_data"],
+        "colecao": mudanca["ns"]["coll"],
+        "operacao": mudanca["operationType"],
+        "documento_id": mudanca["documentKey"]["_id"],
+        "documento": mudanca.get("fullDocument"),
+        "campos_alterados": sorted(descricao.get("updatedFields", {})),
+        "campos_removidos": descricao.get("removedFields", []),
+    }
+
+
+def formatar_sse(evento):
+    return b"id: %s\nevent: %s\ndata: %s\n\n" % (evento["id"].encode(), evento["operacao"].encode(), serializar(evento))
+
+
+def _tags(evento):
+    if evento["colecao"] == "pedidos" and MODO_ITENS == "embutido":
+        return ("pedidos", "itens_pedidos")
+    return (evento["colecao"],)
+
+
+class CanalEventos:
+    def __init__(self, tamanho_fila):
+        self.tamanho_fila = tamanho_fila
+        self.assinantes = set()
+        self.ativo = False
+
+    def assinar(self):
+        fila = asyncio.Queue(self.tamanho_fila)
+        self.assinantes.add(fila)
+        return fila
+
+    def cancelar(self, fila):
+        self.assinantes.discard(fila)
+
+    def publicar(self, evento):
+        for fila in list(self.assinantes):
+            try:
+                fila.put_nowait(evento)
+            except asyncio.QueueFull:
+                # assinante lento é desligado; o cliente reconecta com Last-Event-ID e retoma de onde parou
+                self.assinantes.discard(fila)
+                while not fila.empty():
+                    fila.get_nowait()
+                fila.put_nowait(None)
+
+
+canal = CanalEventos(EVENTOS_FILA_MAXIMA)
+
+
+async def consumir(db):
+    token = None
+    while True:
+        try:
+            async with observar(db, token) as fluxo:
+                canal.ativo = True
+                async for mudanca in fluxo:
+                    atual = evento(mudanca)
+                    EVENTOS_MUDANCA.labels(atual["colecao"], atual["operacao"]).inc()
+
+                    # escritas feitas por outros processos também derrubam o cache deste
+                    await invalidar(*_tags(atual))
+                    canal.publicar(atual)
+                    # o token só avança depois de processado: se algo falhar, o evento é reentregue
+                    token = atual["id"]
+        except OperationFailure as erro:
+            canal.ativo = False
+            if erro.code == SEM_REPLICA_SET:
+                logger.error("change streams exigem replica set: feed de eventos desativado")
+                return
+            if erro.code in TOKEN_INVALIDO:
+                logger.warning("resume token expirado: o consumidor recomeça do momento atual")
+                token = None
+                continue
+            logger.exception("falha no change stream")
+            await asyncio.sleep(1)
+        except Exception:
+            # erro do driver ou ao processar o evento (ex.: Redis do cache fora): retoma do último token
+            canal.ativo = False
+            logger.exception("falha no change stream")
+            await asyncio.sleep(1)
@@ -0,0 +1,96 @@
+import csv
+import io
+import json
+from datetime import datetime
+from bson import ObjectId
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+
+FORMATOS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+BATCH_SIZE_PADRAO = 1000
+BATCH_SIZE_MAXIMO = 10000
+
+
+def _converter(valor):
+    if isinstance(valor, ObjectId):
+        return str(valor)
+    if isinstance(valor, datetime):
+        return valor.isoformat()
+    raise TypeError(f"Tipo não serializável: {type(valor).__name__}")
+
+
+def _valor_csv(documento, caminho):
+    for parte in caminho.split("."):
+        if not isinstance(documento, dict):
+            return ""
+        documento = documento.get(parte)
+
+    if documento is None:
+        return ""
+    if isinstance(documento, (dict, list)):
+        return json.dumps(documento, default=_converter, ensure_ascii=False)
+    return _converter(documento) if isinstance(documento, (ObjectId, datetime)) else documento
+
+
+def colunas(campos, modelo=None):
+    if campos:
+        return [campo.strip() for campo in campos.split(",") if campo.strip()]
+    if modelo:
+        return ["_id"] + [campo for campo in modelo.__fields__ if campo != "id"]
+    return None
+
+
+def projecao(colunas_exportadas):
+    if not colunas_exportadas:
+        return {"busca": 0, "versao": 0}
+    return {coluna: 1 for coluna in colunas_exportadas}
+
+
+async def _ndjson(cursor):
+    async for documento in cursor:
+        yield json.dumps(documento, default=_converter, ensure_ascii=False).encode() + b"\n"
+
+
+async def _csv(cursor, colunas_exportadas):
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+
+    escritor.writerow(colunas_exportadas)
+    async for documento in cursor:
+        escritor.writerow([_valor_csv(documento, coluna) for coluna in colunas_exportadas])
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def validar_exportacao(formato, batch_size, colunas_exportadas):
+    if formato not in FORMATOS:
+        raise HTTPException(status_code=400, detail="Formato deve ser 'ndjson' ou 'csv'")
+    if not 1 <= batch_size <= BATCH_SIZE_MAXIMO:
+        raise HTTPException(status_code=400, detail=f"batch_size deve estar entre 1 e {BATCH_SIZE_MAXIMO}")
+    if formato == "csv" and not colunas_exportadas:
+        raise HTTPException(status_code=400, detail="Informe os campos para exportar em CSV")
+
+
+def exportar(cursor, formato, colunas_exportadas, nome):
+    # o cursor do Motor é consumido aos poucos: a memória não cresce com o tamanho do resultado
+    corpo = _csv(cursor, colunas_exportadas) if formato == "csv" else _ndjson(cursor)
+
+    return StreamingResponse(
+        corpo,
+        media_type=FORMATOS[formato],
+        headers={"Content-Disposition": f'attachment; filename="{nome}.{formato}"'},
+    )
+
+
+def exportar_colecao(colecao, modelo, formato, campos, batch_size):
+    colunas_exportadas = colunas(campos, modelo)
+    validar_exportacao(formato, batch_size, colunas_exportadas)
+
+    cursor = colecao.find({}, projecao(colunas_exportadas), batch_size=batch_size)
+
+    return exportar(cursor, formato, colunas_exportadas, colecao.name)
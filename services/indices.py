@@ -0,0 +1,156 @@
+from datetime import datetime
+from pymongo import ASCENDING, DESCENDING, TEXT, IndexModel
+
+INDICES = {
+    "clientes": [
+        IndexModel([("cpf", ASCENDING)], name="cpf"),
+        IndexModel([("email", ASCENDING)], name="email"),
+        IndexModel([("busca.nome", ASCENDING)], name="busca_nome"),
+        IndexModel([("busca.cpf", ASCENDING)], name="busca_cpf"),
+        IndexModel([("busca.email", ASCENDING)], name="busca_email"),
+        IndexModel([("busca.cidade", ASCENDING)], name="busca_cidade"),
+        IndexModel([("nome", TEXT), ("email", TEXT)], name="texto", default_language="portuguese"),
+    ],
+    "roupas": [
+        IndexModel([("fornecedor_id", ASCENDING)], name="fornecedor_id"),
+        IndexModel([("preco", ASCENDING)], name="preco"),
+        IndexModel([("busca.nome", ASCENDING)], name="busca_nome"),
+        IndexModel([("busca.cor", ASCENDING)], name="busca_cor"),
+        IndexModel([("nome", TEXT), ("cor", TEXT)], name="texto", default_language="portuguese"),
+    ],
+    "fornecedores": [
+        IndexModel([("busca.nome", ASCENDING)], name="busca_nome"),
+        IndexModel([("busca.telefone", ASCENDING)], name="busca_telefone"),
+        IndexModel([("busca.cidade", ASCENDING)], name="busca_cidade"),
+        IndexModel([("nome", TEXT), ("cidade", TEXT)], name="texto", default_language="portuguese"),
+    ],
+    "pedidos": [
+        IndexModel([("cliente_id", ASCENDING)], name="cliente_id"),
+        IndexModel([("status", ASCENDING)], name="status"),
+        IndexModel([("status", ASCENDING), ("data", ASCENDING)], name="status_data"),  # vendas/serie com status
+        IndexModel([("busca.status", ASCENDING)], name="busca_status"),
+        IndexModel([("data", DESCENDING), ("_id", DESCENDING)], name="data_id"),  # pedidosPorAno e paginação por cursor
+        IndexModel([("itens._id", ASCENDING)], name="itens_id", sparse=True),  # MODO_ITENS=embutido
+        IndexModel([("itens.roupa_id", ASCENDING)], name="itens_roupa_id", sparse=True),
+    ],
+    "itens_pedidos": [
+        IndexModel([("pedido_id", ASCENDING)], name="pedido_id"),  # $lookup de pedidos -> itens
+        IndexModel([("roupa_id", ASCENDING)], name="roupa_id"),
+    ],
+    "agregado_vendas_dia": [
+        IndexModel([("dia", ASCENDING), ("status", ASCENDING)], name="dia_status"),  # o $out mantém os índices
+    ],
+    "pedidos_arquivo": [
+        IndexModel([("data", DESCENDING), ("_id", DESCENDING)], name="data_id"),  # anos antigos de pedidosPorAno
+        IndexModel([("status", ASCENDING), ("data", ASCENDING)], name="status_data"),
+    ],
+    "itens_pedidos_arquivo": [
+        IndexModel([("pedido_id", ASCENDING)], name="pedido_id"),
+    ],
+    "consultas_jobs": [
+        IndexModel([("chave", ASCENDING), ("criado_em", DESCENDING)], name="chave_criado_em"),  # reuso de jobs
+        IndexModel([("status", ASCENDING), ("criado_em", ASCENDING)], name="status_criado_em"),  # fila dos workers
+        IndexModel([("expira_em", ASCENDING)], name="expira_em", expireAfterSeconds=0),
+    ],
+    "consultas_resultados": [
+        IndexModel([("job_id", ASCENDING), ("tentativa", ASCENDING), ("indice", ASCENDING)],
+                   name="job_tentativa_indice", unique=True),
+        IndexModel([("expira_em", ASCENDING)], name="expira_em", expireAfterSeconds=0),
+    ],
+    "clientes_metricas": [
+        # rankings paginados de /clientes/metricas/top: desempate por _id mantém as páginas estáveis
+        IndexModel([("ltv", DESCENDING), ("_id", ASCENDING)], name="ltv_id"),
+        IndexModel([("monetario", DESCENDING), ("_id", ASCENDING)], name="monetario_id"),
+        IndexModel([("frequencia", DESCENDING), ("_id", ASCENDING)], name="frequencia_id"),
+        IndexModel([("recencia_dias", ASCENDING), ("_id", ASCENDING)], name="recencia_dias_id"),
+        IndexModel([("segmento", ASCENDING), ("ltv", DESCENDING), ("_id", ASCENDING)], name="segmento_ltv_id"),
+    ],
+}
+
+# Formatos de consulta usados pelas rotas, verificados com explain()
+CONSULTAS_MONITORADAS = [
+    {"rota": "itens_por_pedido", "colecao": "itens_pedidos", "filtro": {"pedido_id": ""}},
+    {"rota": "filtrar_itens_pedidos", "colecao": "itens_pedidos", "filtro": {"roupa_id": ""}},
+    {"rota": "pedidos_por_ano", "colecao": "pedidos",
+     "filtro": {"data": {"$gte": datetime(2024, 1, 1), "$lt": datetime(2025, 1, 1)}}},
+    {"rota": "listar_pedidos", "colecao": "pedidos", "filtro": {}, "ordenacao": {"data": -1, "_id": -1}},
+    {"rota": "filtrar_pedidos", "colecao": "pedidos", "filtro": {"busca.status": {"$regex": "^"}}},
+    {"rota": "pedidos_por_cliente", "colecao": "pedidos", "filtro": {"cliente_id": ""}},
+    {"rota": "serie_vendas (pedidos)", "colecao": "pedidos",
+     "filtro": {"status": {"$in": [""]}, "data": {"$gte": datetime(2024, 1, 1), "$lt": datetime(2025, 1, 1)}}},
+    {"rota": "serie_vendas (agregado)", "colecao": "agregado_vendas_dia",
+     "filtro": {"dia": {"$gte": datetime(2024, 1, 1), "$lt": datetime(2025, 1, 1)}}},
+    {"rota": "obter_item_pedido (embutido)", "colecao": "pedidos", "filtro": {"itens._id": ""}},
+    {"rota": "listar_roupas_ordenadas", "colecao": "roupas", "filtro": {}, "ordenacao": {"preco": 1}},
+    {"rota": "listar_roupas_por_fornecedor", "colecao": "roupas", "filtro": {"fornecedor_id": ""}},
+    {"rota": "filtrar_clientes", "colecao": "clientes", "filtro": {"busca.cpf": {"$regex": "^"}}},
+    {"rota": "filtrar_clientes", "colecao": "clientes", "filtro": {"busca.nome": {"$regex": "^"}}},
+    {"rota": "filtrar_roupas", "colecao": "roupas", "filtro": {"busca.nome": {"$regex": "^"}}},
+    {"rota": "filtrar_fornecedores", "colecao": "fornecedores", "filtro": {"busca.nome": {"$regex": "^"}}},
+]
+
+
+async def criar_indices(db):
+    # create_indexes é idempotente para índices com a mesma definição
+    criados = {}
+    for colecao, indices in INDICES.items():
+        criados[colecao] = await db[colecao].create_indexes(indices)
+    return criados
+
+
+async def uso_indices(db):
+    uso = {}
+    for colecao in INDICES:
+        estatisticas = await db[colecao].aggregate([{"$indexStats": {}}]).to_list(None)
+        uso[colecao] = [
+            {
+                "nome": estatistica["name"],
+                "chave": estatistica["key"],
+                "acessos": estatistica["accesses"]["ops"],
+                "desde": estatistica["accesses"]["since"],
+            }
+            for estatistica in estatisticas
+        ]
+    return uso
+
+
+def _estagios(plano):
+    yield plano.get("stage")
+    if "inputStage" in plano:
+        yield from _estagios(plano["inputStage"])
+    for entrada in plano.get("inputStages", []):
+        yield from _estagios(entrada)
+
+
+async def explicar_consultas(db):
+    relatorio = []
+    for consulta in CONSULTAS_MONITORADAS:
+        comando = {"find": consulta["colecao"], "filter": consulta["filtro"]}
+        if consulta.get("ordenacao"):
+            comando["sort"] = consulta["ordenacao"]
+
+        explicacao = await db.command({"explain": comando, "verbosity": "queryPlanner"})
+        plano = explicacao["queryPlanner"]["winningPlan"]
+        plano = plano.get("queryPlan", plano)  # formato do planner SBE
+        estagios = [estagio for estagio in _estagios(plano) if estagio]
+
+        relatorio.append({
+            "rota": consulta["rota"],
+            "colecao": consulta["colecao"],
+            "estagios": estagios,
+            "collscan": "COLLSCAN" in estagios,
+        })
+    return relatorio
+
+
+if __name__ == "__main__":
+    import asyncio
+    from config import db
+
+    async def _main():
+        await criar_indices(db)
+        for item in await explicar_consultas(db):
+            marca = "COLLSCAN" if item["collscan"] else "ok"
+            print(f"{marca:9} {item['colecao']:15} {item['rota']:30} {' <- '.join(item['estagios'])}")
+
+    asyncio.run(_main())
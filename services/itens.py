@@ -0,0 +1,376 @@
+from bson import ObjectId
+from fastapi import HTTPException
+from pymongo import UpdateOne
+from config import ITENS_POR_PEDIDO_MAXIMO, MODO_ITENS
+from schemas import ItensPedido
+from services.concorrencia import CAMPO_VERSAO, CONFLITO, atualizar_versionado, condicao_versao
+from services.juncoes import em_lotes_com_filhos, juntar_filhos
+from services.carregador import buscar_por_ids
+from services.lote import gravar_em_lote
+from services.orcamento import opcoes_agregacao
+from services.paginacao import codificar_cursor, decodificar_cursor, filtro_apos_cursor, listar_paginado
+
+# "colecao": itens na coleção itens_pedidos (N:N)
+# "embutido": itens dentro de pedidos.itens, com snapshot do nome da roupa; /itensPedidos vira uma visão
+MODOS_ITENS = ("colecao", "embutido")
+
+ORDENACAO_VISAO = (("pedido", 1), ("posicao", 1))
+
+# no modo embutido uma escrita de item altera o documento do pedido
+TAGS_ITENS = ("itens_pedidos", "pedidos") if MODO_ITENS == "embutido" else ("itens_pedidos",)
+
+
+def linha_embutida(item, nome, item_id=None):
+    return {
+        "_id": item_id or item.get("_id") or ObjectId(),
+        "roupa_id": item["roupa_id"],
+        "nome": nome,
+        "quantidade": item["quantidade"],
+        "preco_unitario": item["preco_unitario"],
+        "subtotal": item["subtotal"],
+    }
+
+
+def _visao(pedido_id, linha):
+    return {
+        "_id": linha["_id"],
+        "pedido_id": str(pedido_id),
+        "roupa_id": linha["roupa_id"],
+        "quantidade": linha["quantidade"],
+        "preco_unitario": linha["preco_unitario"],
+        "subtotal": linha["subtotal"],
+    }
+
+
+def _pipeline_visao(filtro=None):
+    filtro = filtro or {}
+    filtro_pedidos = {"itens.0": {"$exists": True}}
+
+    if "pedido_id" in filtro:
+        pedido_id = filtro["pedido_id"]
+        filtro_pedidos["_id"] = ObjectId(pedido_id) if ObjectId.is_valid(pedido_id) else None
+    if "roupa_id" in filtro:
+        filtro_pedidos["itens.roupa_id"] = filtro["roupa_id"]
+
+    etapas = [
+        {"$match": filtro_pedidos},
+        {"$sort": {"_id": 1}},
+        {"$unwind": {"path": "$itens", "includeArrayIndex": "posicao"}},
+        {"$replaceRoot": {"newRoot": {
+            "_id": "$itens._id",
+            "pedido_id": {"$toString": "$_id"},
+            "roupa_id": "$itens.roupa_id",
+            "quantidade": "$itens.quantidade",
+            "preco_unitario": "$itens.preco_unitario",
+            "subtotal": "$itens.subtotal",
+            "pedido": "$_id",
+            "posicao": "$posicao",
+        }}},
+    ]
+
+    if "roupa_id" in filtro:
+        etapas.append({"$match": {"roupa_id": filtro["roupa_id"]}})
+
+    return etapas
+
+
+def _visao_versionada(pedido):
+    linha = pedido["itens"][0]
+    return {**_visao(pedido["_id"], linha), CAMPO_VERSAO: linha.get(CAMPO_VERSAO, 0)}
+
+
+async def nomes_roupas(db, roupa_ids):
+    ids = [ObjectId(roupa_id) for roupa_id in set(roupa_ids) if ObjectId.is_valid(roupa_id)]
+    return {str(roupa["_id"]): roupa.get("nome") async for roupa in db.roupas.find({"_id": {"$in": ids}}, {"nome": 1})}
+
+
+class ItensColecao:
+    def __init__(self, db):
+        self.db = db
+        self.colecao = db.itens_pedidos
+
+    async def criar(self, item):
+        resultado = await self.colecao.insert_one(item)
+        return resultado.inserted_id
+
+    async def obter(self, item_id, projecao):
+        return await self.colecao.find_one({"_id": ObjectId(item_id)}, projecao)
+
+    async def por_ids(self, ids, projecao):
+        return await buscar_por_ids(self.colecao, ids, projecao)
+
+    async def atualizar(self, item_id, campos, versao=None):
+        return await atualizar_versionado(self.colecao, {"_id": ObjectId(item_id)}, {"$set": campos}, versao)
+
+    async def remover(self, item_id):
+        return await self.colecao.find_one_and_delete({"_id": ObjectId(item_id)})
+
+    async def listar(self, skip, limit, paginacao, cursor, contar_total, projecao):
+        return await listar_paginado(
+            self.colecao, skip, limit, paginacao=paginacao, cursor=cursor, contar_total=contar_total, projecao=projecao
+        )
+
+    async def contar(self):
+        return await self.colecao.count_documents({})
+
+    async def filtrar(self, filtro, projecao, limit=100):
+        return await self.colecao.find(filtro, projecao).to_list(limit)
+
+    async def por_pedido(self, pedido_id, skip, limit, projecao):
+        return await self.colecao.find({"pedido_id": pedido_id}, projecao).skip(skip).limit(limit).to_list(100)
+
+    async def juntar(self, pedidos):
+        return await juntar_filhos(pedidos, self.colecao, "pedido_id", "itens")
+
+    def em_lotes(self, cursor_pedidos, tamanho_lote):
+        return em_lotes_com_filhos(cursor_pedidos, tamanho_lote, self.colecao, "pedido_id", "itens")
+
+    def cursor(self, projecao, batch_size):
+        return self.colecao.find({}, projecao, batch_size=batch_size)
+
+    async def gravar_em_lote(self, request, tamanho_lote, apos_gravar):
+        return await gravar_em_lote(self.colecao, ItensPedido, request, tamanho_lote, False, apos_gravar=apos_gravar)
+
+
+class ItensEmbutidos:
+    def __init__(self, db):
+        self.db = db
+        self.pedidos = db.pedidos
+
+    def _com_espaco(self, pedido_id, quantidade=1):
+        # o limite do array fica no próprio filtro do $push: o documento do pedido não cresce sem limite
+        if quantidade > ITENS_POR_PEDIDO_MAXIMO:
+            return {"_id": None}
+        return {"_id": ObjectId(pedido_id), f"itens.{ITENS_POR_PEDIDO_MAXIMO - quantidade}": {"$exists": False}}
+
+    async def _sem_espaco(self, pedido_id):
+        if await self.pedidos.count_documents({"_id": ObjectId(pedido_id)}, limit=1):
+            raise HTTPException(status_code=409, detail=f"Pedido já tem {ITENS_POR_PEDIDO_MAXIMO} itens")
+        raise HTTPException(status_code=404, detail="Pedido não encontrado")
+
+    async def criar(self, item):
+        if not ObjectId.is_valid(item["pedido_id"]):
+            raise HTTPException(status_code=400, detail="ID de pedido inválido")
+
+        nomes = await nomes_roupas(self.db, [item["roupa_id"]])
+        linha = linha_embutida(item, nomes.get(item["roupa_id"]))
+
+        resultado = await self.pedidos.update_one(self._com_espaco(item["pedido_id"]), {"$push": {"itens": linha}})
+        if not resultado.matched_count:
+            await self._sem_espaco(item["pedido_id"])
+
+        return linha["_id"]
+
+    async def obter(self, item_id, projecao=None):
+        item_oid = ObjectId(item_id)
+        pedido = await self.pedidos.find_one({"itens._id": item_oid}, {"itens": {"$elemMatch": {"_id": item_oid}}})
+        return _visao_versionada(pedido) if pedido else None
+
+    async def por_ids(self, ids, projecao=None):
+        ids = set(ids)
+        filtro = {"itens._id": {"$in": [ObjectId(item_id) for item_id in ids]}}
+
+        encontrados = {}
+        async for pedido in self.pedidos.find(filtro, {"itens": 1}):
+            for linha in pedido["itens"]:
+                if str(linha["_id"]) in ids:
+                    encontrados[str(linha["_id"])] = _visao(pedido["_id"], linha)
+        return encontrados
+
+    async def atualizar(self, item_id, campos, versao=None):
+        # cada linha tem a própria versão: escritas em linhas diferentes do mesmo pedido não conflitam
+        item_oid = ObjectId(item_id)
+        filtro = {"itens": {"$elemMatch": {"_id": item_oid, **condicao_versao(versao)}}}
+        if ObjectId.is_valid(campos.get("pedido_id", "")):
+            filtro["_id"] = ObjectId(campos["pedido_id"])
+
+        alteracoes = {f"itens.$.{campo}": valor for campo, valor in campos.items() if campo != "pedido_id"}
+        if "roupa_id" in campos:
+            nomes = await nomes_roupas(self.db, [campos["roupa_id"]])
+            alteracoes["itens.$.nome"] = nomes.get(campos["roupa_id"])
+
+        atualizacao = {"$inc": {f"itens.$.{CAMPO_VERSAO}": 1}}
+        if alteracoes:
+            atualizacao["$set"] = alteracoes
+
+        pedido = await self.pedidos.find_one_and_update(
+            filtro, atualizacao, projection={"itens": {"$elemMatch": {"_id": item_oid}}}
+        )
+
+        if pedido:
+            return _visao_versionada(pedido)
+        if not await self.pedidos.count_documents({"itens._id": item_oid}, limit=1):
+            return None
+        if "_id" in filtro and not await self.pedidos.count_documents({"_id": filtro["_id"], "itens._id": item_oid}):
+            raise HTTPException(status_code=400, detail="No modo embutido o item não pode mudar de pedido")
+        raise HTTPException(status_code=412, detail=CONFLITO)
+
+    async def remover(self, item_id):
+        item_oid = ObjectId(item_id)
+        pedido = await self.pedidos.find_one_and_update(
+            {"itens._id": item_oid}, {"$pull": {"itens": {"_id": item_oid}}},
+            projection={"itens": {"$elemMatch": {"_id": item_oid}}}
+        )
+        return _visao(pedido["_id"], pedido["itens"][0]) if pedido else None
+
+    async def listar(self, skip, limit, paginacao, cursor, contar_total, projecao=None):
+        if paginacao not in ("offset", "cursor"):
+            raise HTTPException(status_code=400, detail="Paginação deve ser 'offset' ou 'cursor'")
+
+        etapas = _pipeline_visao()
+        total = await self.contar() if contar_total else None
+
+        if paginacao == "offset":
+            documentos = await self.pedidos.aggregate(
+                etapas + [{"$skip": skip}, {"$limit": limit}], **opcoes_agregacao()
+            ).to_list(None)
+            metadados = {"total": total, "skip": skip, "limit": limit, "page": (skip // limit) + 1 if limit else 0}
+        else:
+            ordenacao = list(ORDENACAO_VISAO)
+            if cursor:
+                valores = decodificar_cursor(cursor, ordenacao)
+                etapas[0]["$match"]["_id"] = {"$gte": valores["pedido"]}
+                etapas.append({"$match": filtro_apos_cursor(valores, ordenacao)})
+
+            documentos = await self.pedidos.aggregate(etapas + [{"$limit": limit}], **opcoes_agregacao()).to_list(None)
+            proximo_cursor = None
+            if limit and len(documentos) == limit:
+                proximo_cursor = codificar_cursor(documentos[-1], ordenacao)
+            metadados = {"total": total, "total_estimado": False, "limit": limit, "next_cursor": proximo_cursor}
+
+        for documento in documentos:
+            del documento["pedido"], documento["posicao"]
+
+        return {"data": documentos, "metadados": metadados}
+
+    async def contar(self):
+        resultado = await self.pedidos.aggregate([
+            {"$match": {"itens.0": {"$exists": True}}},
+            {"$group": {"_id": None, "total": {"$sum": {"$size": "$itens"}}}},
+        ], **opcoes_agregacao()).to_list(1)
+        return resultado[0]["total"] if resultado else 0
+
+    async def filtrar(self, filtro, projecao=None, limit=100):
+        etapas = _pipeline_visao(filtro) + [{"$limit": limit}, {"$project": {"pedido": 0, "posicao": 0}}]
+        return await self.pedidos.aggregate(etapas, **opcoes_agregacao()).to_list(None)
+
+    async def por_pedido(self, pedido_id, skip, limit, projecao=None):
+        # uma única leitura do pedido: o $slice pagina o array no servidor
+        pedido = await self.pedidos.find_one({"_id": ObjectId(pedido_id)}, {"itens": {"$slice": [skip, limit]}})
+        if not pedido:
+            return []
+        return [_visao(pedido["_id"], linha) for linha in pedido.get("itens", [])]
+
+    async def juntar(self, pedidos):
+        # os itens já vieram no próprio documento do pedido
+        for pedido in pedidos:
+            pedido["itens"] = [_visao(pedido["_id"], linha) for linha in pedido.get("itens", [])]
+        return pedidos
+
+    async def em_lotes(self, cursor_pedidos, tamanho_lote):
+        async for pedido in cursor_pedidos:
+            pedido["itens"] = [_visao(pedido["_id"], linha) for linha in pedido.get("itens", [])]
+            yield pedido
+
+    def cursor(self, projecao, batch_size):
+        etapas = _pipeline_visao() + [{"$project": {"pedido": 0, "posicao": 0}}, {"$project": projecao}]
+        return self.pedidos.aggregate(etapas, batchSize=batch_size)
+
+    async def _gravar(self, colecao, lote, upsert):
+        resultados, erros, por_pedido = [], [], {}
+        for indice, documento, documento_id in lote:
+            if not ObjectId.is_valid(documento["pedido_id"]):
+                erros.append({"indice": indice, "erro": "ID de pedido inválido"})
+                continue
+            documento["_id"] = ObjectId(documento_id) if documento_id else ObjectId()
+            por_pedido.setdefault(documento["pedido_id"], []).append((indice, documento))
+
+        nomes = await nomes_roupas(self.db, [documento["roupa_id"] for _, documento, _ in lote])
+        operacoes = [
+            UpdateOne(self._com_espaco(pedido_id, len(itens)), {"$push": {"itens": {"$each": [
+                linha_embutida(documento, nomes.get(documento["roupa_id"])) for _, documento in itens
+            ]}}})
+            for pedido_id, itens in por_pedido.items()
+        ]
+
+        gravados_ids = set()
+        if operacoes:
+            resultado = await colecao.bulk_write(operacoes)
+            todos = [documento["_id"] for itens in por_pedido.values() for _, documento in itens]
+            if resultado.matched_count == len(operacoes):
+                gravados_ids = set(todos)
+            else:
+                # algum pedido não existe ou estourou o limite: confere quais itens entraram
+                filtro = {"itens._id": {"$in": todos}}
+                async for pedido in colecao.find(filtro, {"itens._id": 1}):
+                    gravados_ids.update(linha["_id"] for linha in pedido["itens"])
+
+        gravados = []
+        for itens in por_pedido.values():
+            for indice, documento in itens:
+                if documento["_id"] not in gravados_ids:
+                    erros.append({"indice": indice, "erro": "Pedido não encontrado ou limite de itens atingido"})
+                    continue
+                resultados.append({"indice": indice, "_id": str(documento["_id"]), "status": "inserido"})
+                gravados.append(documento)
+
+        return resultados, erros, gravados
+
+    async def gravar_em_lote(self, request, tamanho_lote, apos_gravar):
+        return await gravar_em_lote(
+            self.pedidos, ItensPedido, request, tamanho_lote, False, apos_gravar=apos_gravar, gravar=self._gravar
+        )
+
+
+def repositorio_itens(db, modo=MODO_ITENS):
+    if modo == "embutido":
+        return ItensEmbutidos(db)
+    return ItensColecao(db)
+
+
+async def migrar_para_embutido(db, tamanho_lote=1000):
+    # idempotente: o filtro "$ne" pula itens já copiados, então a migração pode ser repetida ou retomada
+    migrados = ignorados = 0
+    lote = []
+
+    async def descarregar():
+        nonlocal migrados, ignorados
+        nomes = await nomes_roupas(db, [item["roupa_id"] for item in lote])
+        operacoes = [
+            UpdateOne(
+                {
+                    "_id": ObjectId(item["pedido_id"]),
+                    "itens._id": {"$ne": item["_id"]},
+                    f"itens.{ITENS_POR_PEDIDO_MAXIMO - 1}": {"$exists": False},
+                },
+                {"$push": {"itens": linha_embutida(item, nomes.get(item["roupa_id"]))}},
+            )
+            for item in lote if ObjectId.is_valid(str(item.get("pedido_id")))
+        ]
+        modificados = 0
+        if operacoes:
+            # ordenado para os itens de um mesmo pedido entrarem na ordem do cursor
+            resultado = await db.pedidos.bulk_write(operacoes, ordered=True)
+            modificados = resultado.modified_count
+        migrados += modificados
+        ignorados += len(lote) - modificados
+        lote.clear()
+
+    cursor = db.itens_pedidos.find({}).sort("pedido_id", 1).batch_size(tamanho_lote)
+    async for item in cursor:
+        item["pedido_id"] = str(item["pedido_id"])
+        lote.append(item)
+        if len(lote) >= tamanho_lote:
+            await descarregar()
+
+    if lote:
+        await descarregar()
+
+    return {"migrados": migrados, "ignorados": ignorados}
+
+
+if __name__ == "__main__":
+    import asyncio
+    from config import BULK_TAMANHO_LOTE, db
+
+    print(asyncio.run(migrar_para_embutido(db, BULK_TAMANHO_LOTE)))
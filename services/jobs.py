@@ -0,0 +1,315 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import socket
+import time
+from datetime import datetime, timedelta
+from bson import ObjectId
+from fastapi import HTTPException
+from pydantic import ValidationError
+from pymongo import ReturnDocument
+from pymongo.errors import PyMongoError
+from config import JOBS_JANELA_REUSO_S, JOBS_LEASE_S, JOBS_TAMANHO_BLOCO, JOBS_TTL_S
+from schemas import ParametrosPedidosPorAno, Pedido, SemParametros
+from services.agregados import AGREGADO_ROUPA
+from services.arquivo import ARQUIVO_PEDIDOS, pedidos_com_arquivo, precisa_arquivo
+from services.itens import repositorio_itens
+from services.juncoes import resolver_referencias
+from services.metricas import JOBS_CONSULTAS, JOBS_DURACAO
+from services.serializacao import projecao_modelo
+
+logger = logging.getLogger("gestao_roupas.jobs")
+
+COLECAO_JOBS = "consultas_jobs"
+COLECAO_RESULTADOS = "consultas_resultados"
+
+TENTATIVAS_MAXIMAS = 3
+INTERVALO_BUSCA_S = 5  # rede de segurança: jobs enfileirados por outros processos não acordam este
+RESULTADOS_POR_PAGINA_MAXIMO = 1000
+
+PROJECAO_PEDIDO = projecao_modelo(Pedido)
+PROJECAO_JOB = {"chave": 0, "trabalhador": 0, "lease_ate": 0}
+
+_novo_job = asyncio.Event()
+
+
+async def _pedidos_por_ano(db, ano):
+    filtro = {"data": {"$gte": datetime(ano, 1, 1), "$lt": datetime(ano + 1, 1, 1)}}
+    ordenacao = [("data", -1), ("_id", -1)]
+    total = await db.pedidos.count_documents(filtro)
+
+    if await precisa_arquivo(db, filtro["data"]["$gte"]):
+        total += await db[ARQUIVO_PEDIDOS].count_documents(filtro)
+        return total, pedidos_com_arquivo(db, filtro, PROJECAO_PEDIDO, ordenacao, allowDiskUse=True)
+
+    return total, db.pedidos.find(filtro, PROJECAO_PEDIDO).sort(ordenacao)
+
+
+async def _pedidos_com_itens(db):
+    total = await db.pedidos.estimated_document_count()
+    cursor = db.pedidos.find({}, {**PROJECAO_PEDIDO, "itens": 1}).sort("_id", 1)
+    return total, repositorio_itens(db).em_lotes(cursor, JOBS_TAMANHO_BLOCO)
+
+
+async def _vendidos_com_roupa(db, cursor):
+    lote = await cursor.to_list(JOBS_TAMANHO_BLOCO)
+    while lote:
+        await resolver_referencias(lote, db.roupas, "_id", "roupa")
+        for resultado in lote:
+            if resultado["roupa"]:
+                yield resultado
+        lote = await cursor.to_list(JOBS_TAMANHO_BLOCO)
+
+
+async def _itens_vendidos_por_roupa(db):
+    filtro = {"quantidade_vendida": {"$gt": 0}}
+    total = await db[AGREGADO_ROUPA].count_documents(filtro)
+    return total, _vendidos_com_roupa(db, db[AGREGADO_ROUPA].find(filtro, {"quantidade_vendida": 1}))
+
+
+# consulta -> (modelo dos parâmetros, função que devolve (total estimado, iterável assíncrono de documentos))
+CONSULTAS = {
+    "pedidos_por_ano": (ParametrosPedidosPorAno, _pedidos_por_ano),
+    "pedidos_com_itens": (SemParametros, _pedidos_com_itens),
+    "itens_vendidos_por_roupa": (SemParametros, _itens_vendidos_por_roupa),
+}
+
+
+def _validar(consulta, parametros):
+    if consulta not in CONSULTAS:
+        raise HTTPException(
+            status_code=400, detail=f"Consulta desconhecida; disponíveis: {', '.join(sorted(CONSULTAS))}"
+        )
+
+    modelo, _ = CONSULTAS[consulta]
+    try:
+        return modelo(**parametros).dict()
+    except ValidationError as erro:
+        raise HTTPException(status_code=400, detail={
+            "mensagem": "Parâmetros inválidos",
+            "erros": [{"campo": ".".join(map(str, e["loc"])), "erro": e["msg"]} for e in erro.errors()],
+        })
+
+
+def _chave(consulta, parametros):
+    return hashlib.sha256(json.dumps([consulta, parametros], sort_keys=True, default=str).encode()).hexdigest()
+
+
+def resumo(job, reutilizado=None):
+    progresso = job.get("progresso", {})
+    total, processados = progresso.get("total"), progresso.get("processados", 0)
+    resposta = {
+        "id": str(job["_id"]),
+        "consulta": job["consulta"],
+        "parametros": job["parametros"],
+        "status": job["status"],
+        "progresso": {
+            "processados": processados,
+            "total": total,
+            "percentual": round(min(processados / total, 1) * 100, 1) if total else None,
+        },
+        "criado_em": job["criado_em"],
+        "iniciado_em": job.get("iniciado_em"),
+        "concluido_em": job.get("concluido_em"),
+        "expira_em": job["expira_em"],
+        "erro": job.get("erro"),
+    }
+    if reutilizado is not None:
+        resposta["reutilizado"] = reutilizado
+    return resposta
+
+
+async def enfileirar(db, consulta, parametros):
+    parametros = _validar(consulta, parametros)
+    chave = _chave(consulta, parametros)
+    agora = datetime.utcnow()
+
+    # o mesmo pedido dentro da janela reaproveita o job, em andamento ou já concluído
+    existente = await db[COLECAO_JOBS].find_one(
+        {"chave": chave, "status": {"$ne": "falhou"},
+         "criado_em": {"$gte": agora - timedelta(seconds=JOBS_JANELA_REUSO_S)}},
+        sort=[("criado_em", -1)]
+    )
+    if existente:
+        JOBS_CONSULTAS.labels(consulta, "reutilizado").inc()
+        return existente, True
+
+    job = {
+        "consulta": consulta,
+        "parametros": parametros,
+        "chave": chave,
+        "status": "pendente",
+        "progresso": {"processados": 0, "total": None},
+        "tamanho_bloco": JOBS_TAMANHO_BLOCO,
+        "tentativas": 0,
+        "criado_em": agora,
+        "expira_em": agora + timedelta(seconds=JOBS_TTL_S),
+    }
+    job["_id"] = (await db[COLECAO_JOBS].insert_one(job)).inserted_id
+
+    JOBS_CONSULTAS.labels(consulta, "enfileirado").inc()
+    _novo_job.set()
+    return job, False
+
+
+async def obter(db, job_id, skip, limit):
+    if not ObjectId.is_valid(job_id):
+        raise HTTPException(status_code=400, detail="ID inválido")
+    if skip < 0 or not 1 <= limit <= RESULTADOS_POR_PAGINA_MAXIMO:
+        raise HTTPException(
+            status_code=400, detail=f"skip deve ser >= 0 e limit entre 1 e {RESULTADOS_POR_PAGINA_MAXIMO}"
+        )
+
+    job = await db[COLECAO_JOBS].find_one({"_id": ObjectId(job_id)}, PROJECAO_JOB)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job não encontrado")
+
+    resposta = resumo(job)
+    if job["status"] == "concluido":
+        resposta["data"] = await _pagina(db, job, skip, limit)
+        resposta["metadados"] = {"total": job["total_resultados"], "skip": skip, "limit": limit}
+    return resposta
+
+
+async def _pagina(db, job, skip, limit):
+    # os blocos têm tamanho fixo: só os que cobrem [skip, skip + limit) são lidos
+    tamanho = job["tamanho_bloco"]
+    primeiro, ultimo = skip // tamanho, (skip + limit - 1) // tamanho
+
+    blocos = await db[COLECAO_RESULTADOS].find(
+        {"job_id": job["_id"], "tentativa": job["tentativas"], "indice": {"$gte": primeiro, "$lte": ultimo}},
+        {"documentos": 1}
+    ).sort("indice", 1).to_list(None)
+
+    documentos = [documento for bloco in blocos for documento in bloco["documentos"]]
+    inicio = skip - primeiro * tamanho
+    return documentos[inicio:inicio + limit]
+
+
+async def _reivindicar(db, trabalhador):
+    agora = datetime.utcnow()
+    # um job "executando" com lease vencido é de um worker que morreu: volta a ser executado
+    return await db[COLECAO_JOBS].find_one_and_update(
+        {"$or": [{"status": "pendente"}, {"status": "executando", "lease_ate": {"$lt": agora}}]},
+        {
+            "$set": {"status": "executando", "trabalhador": trabalhador, "iniciado_em": agora,
+                     "lease_ate": agora + timedelta(seconds=JOBS_LEASE_S)},
+            "$inc": {"tentativas": 1},
+        },
+        sort=[("criado_em", 1)],
+        return_document=ReturnDocument.AFTER
+    )
+
+
+class _LeasePerdido(Exception):
+    pass
+
+
+async def _executar(db, db_leitura, job):
+    jobs, resultados = db[COLECAO_JOBS], db[COLECAO_RESULTADOS]
+    dono = {"_id": job["_id"], "trabalhador": job["trabalhador"], "tentativas": job["tentativas"]}
+
+    async def renovar(atualizacao):
+        lease = datetime.utcnow() + timedelta(seconds=JOBS_LEASE_S)
+        expira_em = lease + timedelta(seconds=JOBS_TTL_S)
+        atualizacao["$set"].update({"lease_ate": lease, "expira_em": expira_em})
+        if not (await jobs.update_one(dono, atualizacao)).matched_count:
+            raise _LeasePerdido()
+        return expira_em
+
+    async def manter_lease():
+        # renova o lease enquanto o job roda, também durante um count ou sort longo que não grava blocos
+        filtro = {**dono, "status": "executando"}
+        while True:
+            await asyncio.sleep(JOBS_LEASE_S / 3)
+            lease = datetime.utcnow() + timedelta(seconds=JOBS_LEASE_S)
+            try:
+                renovado = await jobs.update_one(filtro, {"$set": {
+                    "lease_ate": lease, "expira_em": lease + timedelta(seconds=JOBS_TTL_S),
+                }})
+            except PyMongoError:
+                logger.warning("falha ao renovar o lease do job %s", job["_id"])
+                continue
+            if not renovado.matched_count:
+                return  # concluído, falhou ou reassumido: a próxima escrita do job percebe
+
+    async def gravar_bloco(indice, documentos, processados):
+        expira_em = await renovar({"$set": {"progresso.processados": processados}})
+        await resultados.insert_one({
+            "job_id": job["_id"], "tentativa": job["tentativas"], "indice": indice,
+            "documentos": documentos, "expira_em": expira_em,
+        })
+
+    inicio = time.perf_counter()
+    batimento = asyncio.ensure_future(manter_lease())
+    try:
+        if job["tentativas"] > TENTATIVAS_MAXIMAS:
+            raise RuntimeError(f"Job interrompido {TENTATIVAS_MAXIMAS} vezes")
+
+        _, funcao = CONSULTAS[job["consulta"]]
+        total, documentos = await funcao(db_leitura, **job["parametros"])
+        await renovar({"$set": {"progresso.total": total}})
+
+        bloco, indice, processados = [], 0, 0
+        async for documento in documentos:
+            bloco.append(documento)
+            processados += 1
+            if len(bloco) >= job["tamanho_bloco"]:
+                await gravar_bloco(indice, bloco, processados)
+                bloco, indice = [], indice + 1
+        if bloco:
+            await gravar_bloco(indice, bloco, processados)
+
+        agora = datetime.utcnow()
+        expira_em = agora + timedelta(seconds=JOBS_TTL_S)
+        concluido = await jobs.update_one(dono, {"$set": {
+            "status": "concluido", "concluido_em": agora, "total_resultados": processados,
+            "progresso.processados": processados, "expira_em": expira_em,
+        }})
+        if not concluido.matched_count:
+            raise _LeasePerdido()
+        await resultados.update_many({"job_id": job["_id"], "tentativa": job["tentativas"]},
+                                     {"$set": {"expira_em": expira_em}})
+        # blocos de tentativas interrompidas não são mais lidos
+        await resultados.delete_many({"job_id": job["_id"], "tentativa": {"$ne": job["tentativas"]}})
+        JOBS_CONSULTAS.labels(job["consulta"], "concluido").inc()
+    except _LeasePerdido:
+        logger.warning("job %s foi reassumido por outro worker", job["_id"])
+    except Exception as erro:
+        logger.exception("job %s falhou", job["_id"])
+        JOBS_CONSULTAS.labels(job["consulta"], "falhou").inc()
+        await jobs.update_one(dono, {"$set": {
+            "status": "falhou", "erro": str(erro), "concluido_em": datetime.utcnow(),
+            "expira_em": datetime.utcnow() + timedelta(seconds=JOBS_TTL_S),
+        }})
+    finally:
+        batimento.cancel()
+        JOBS_DURACAO.labels(job["consulta"]).observe(time.perf_counter() - inicio)
+
+
+async def trabalhar(db, db_leitura, numero):
+    trabalhador = f"{socket.gethostname()}:{os.getpid()}:{numero}"
+    while True:
+        _novo_job.clear()
+        try:
+            job = await _reivindicar(db, trabalhador)
+        except PyMongoError:
+            logger.exception("falha ao buscar jobs")
+            await asyncio.sleep(1)
+            continue
+
+        if job is None:
+            try:
+                await asyncio.wait_for(_novo_job.wait(), INTERVALO_BUSCA_S)
+            except asyncio.TimeoutError:
+                pass
+            continue
+
+        try:
+            await _executar(db, db_leitura, job)
+        except Exception:
+            # nem a falha conseguiu ser gravada (ex.: failover): o lease expira e o job é reassumido
+            logger.exception("falha ao registrar o status do job %s", job["_id"])
+            await asyncio.sleep(1)
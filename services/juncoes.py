@@ -0,0 +1,59 @@
+from collections import defaultdict
+from bson import ObjectId
+from services.busca import PROJECAO_PUBLICA
+
+# Referências são gravadas como str (ItensPedido.pedido_id, Roupa.fornecedor_id, ...), mas
+# documentos antigos podem ter ObjectId: o $in consulta as duas formas e as chaves são comparadas como str.
+
+
+def ids_em_ambos_tipos(ids):
+    ids = {str(documento_id) for documento_id in ids if documento_id is not None}
+    return list(ids) + [ObjectId(documento_id) for documento_id in ids if ObjectId.is_valid(documento_id)]
+
+
+async def juntar_filhos(pais, colecao_filha, chave_estrangeira, campo, projecao=PROJECAO_PUBLICA):
+    if not pais:
+        return pais
+
+    filtro = {chave_estrangeira: {"$in": ids_em_ambos_tipos(pai["_id"] for pai in pais)}}
+    filhos = defaultdict(list)
+
+    async for filho in colecao_filha.find(filtro, projecao):
+        filhos[str(filho[chave_estrangeira])].append(filho)
+
+    for pai in pais:
+        pai[campo] = filhos.get(str(pai["_id"]), [])
+
+    return pais
+
+
+async def resolver_referencias(documentos, colecao, chave_local, campo, projecao=PROJECAO_PUBLICA):
+    if not documentos:
+        return documentos
+
+    ids = {str(documento[chave_local]) for documento in documentos if documento.get(chave_local) is not None}
+    filtro = {"_id": {"$in": [ObjectId(documento_id) for documento_id in ids if ObjectId.is_valid(documento_id)]}}
+
+    referenciados = {}
+    async for referenciado in colecao.find(filtro, projecao):
+        referenciados[str(referenciado["_id"])] = referenciado
+
+    for documento in documentos:
+        documento[campo] = referenciados.get(str(documento.get(chave_local)))
+
+    return documentos
+
+
+async def em_lotes_com_filhos(cursor_pais, tamanho_lote, colecao_filha, chave_estrangeira, campo,
+                              projecao=PROJECAO_PUBLICA):
+    # uma consulta $in indexada por lote de pais, em vez de um $lookup por documento
+    lote = []
+    async for pai in cursor_pais:
+        lote.append(pai)
+        if len(lote) >= tamanho_lote:
+            for documento in await juntar_filhos(lote, colecao_filha, chave_estrangeira, campo, projecao):
+                yield documento
+            lote = []
+
+    for documento in await juntar_filhos(lote, colecao_filha, chave_estrangeira, campo, projecao):
+        yield documento
@@ -0,0 +1,149 @@
+import json
+from bson import ObjectId
+from fastapi import HTTPException
+from pydantic import ValidationError
+from pymongo import InsertOne, UpdateOne
+from pymongo.errors import BulkWriteError
+from services.concorrencia import CAMPO_VERSAO
+
+TAMANHO_LOTE_MAXIMO = 10000
+
+TIPOS_NDJSON = ("application/x-ndjson", "application/ndjson", "application/jsonlines")
+
+
+class _JsonInvalido:
+    def __init__(self, linha):
+        self.linha = linha
+
+
+async def _ler_ndjson(request):
+    # indice conta só as linhas com conteúdo; numero é a linha física, para as mensagens de erro
+    indice = numero = 0
+    restante = b""
+
+    async for pedaco in request.stream():
+        restante += pedaco
+        *linhas, restante = restante.split(b"\n")
+        for linha in linhas:
+            numero += 1
+            if linha.strip():
+                yield indice, numero, linha
+                indice += 1
+
+    if restante.strip():
+        yield indice, numero + 1, restante
+
+
+async def ler_itens(request):
+    tipo = request.headers.get("content-type", "").split(";")[0].strip()
+
+    if tipo in TIPOS_NDJSON:
+        async for indice, numero, linha in _ler_ndjson(request):
+            try:
+                yield indice, json.loads(linha)
+            except ValueError:
+                yield indice, _JsonInvalido(numero)
+        return
+
+    try:
+        itens = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Corpo deve ser uma lista JSON ou NDJSON")
+
+    if not isinstance(itens, list):
+        raise HTTPException(status_code=400, detail="Corpo deve ser uma lista JSON ou NDJSON")
+
+    for indice, item in enumerate(itens):
+        yield indice, item
+
+
+def _validar(modelo, indice, item):
+    if isinstance(item, _JsonInvalido):
+        return None, None, {"indice": indice, "linha": item.linha, "erro": f"JSON inválido na linha {item.linha}"}
+
+    if not isinstance(item, dict):
+        return None, None, {"indice": indice, "erro": "Item não é um objeto JSON"}
+
+    try:
+        objeto = modelo(**item)
+    except ValidationError as erro:
+        return None, None, {"indice": indice, "erro": json.loads(erro.json())}
+
+    documento_id = objeto.id
+    if documento_id is not None and not ObjectId.is_valid(documento_id):
+        return None, None, {"indice": indice, "erro": "ID inválido"}
+
+    return objeto.dict(by_alias=True, exclude={"id"}), documento_id, None
+
+
+async def _gravar(colecao, lote, upsert):
+    operacoes = []
+    for _, documento, documento_id in lote:
+        if documento_id is not None and upsert:
+            # $set em vez de substituir: preserva a versão (e o If-Match continua valendo) e os campos não enviados
+            campos = dict(documento)
+            documento["_id"] = ObjectId(documento_id)
+            operacoes.append(UpdateOne(
+                {"_id": documento["_id"]}, {"$set": campos, "$inc": {CAMPO_VERSAO: 1}}, upsert=True
+            ))
+        else:
+            # o id é gerado aqui para não precisar ler os documentos de volta
+            documento["_id"] = ObjectId(documento_id) if documento_id else ObjectId()
+            operacoes.append(InsertOne(documento))
+
+    falhas = {}
+    try:
+        await colecao.bulk_write(operacoes, ordered=False)
+    except BulkWriteError as erro:
+        falhas = {falha["index"]: falha.get("errmsg", "Erro de escrita") for falha in erro.details["writeErrors"]}
+
+    resultados, erros, gravados = [], [], []
+    for posicao, (indice, documento, _) in enumerate(lote):
+        if posicao in falhas:
+            erros.append({"indice": indice, "erro": falhas[posicao]})
+            continue
+        status = "gravado" if isinstance(operacoes[posicao], UpdateOne) else "inserido"
+        resultados.append({"indice": indice, "_id": str(documento["_id"]), "status": status})
+        gravados.append(documento)
+
+    return resultados, erros, gravados
+
+
+async def gravar_em_lote(colecao, modelo, request, tamanho_lote, upsert=True, preparar=None, apos_gravar=None,
+                         gravar=None):
+    if not 1 <= tamanho_lote <= TAMANHO_LOTE_MAXIMO:
+        raise HTTPException(status_code=400, detail=f"tamanho_lote deve estar entre 1 e {TAMANHO_LOTE_MAXIMO}")
+
+    resultados, erros, lote = [], [], []
+    gravar = gravar or _gravar
+
+    async def descarregar():
+        gravados_lote, erros_lote, gravados = await gravar(colecao, lote, upsert)
+        resultados.extend(gravados_lote)
+        erros.extend(erros_lote)
+        if apos_gravar and gravados:
+            await apos_gravar(gravados)
+        lote.clear()
+
+    async for indice, item in ler_itens(request):
+        documento, documento_id, erro = _validar(modelo, indice, item)
+        if erro:
+            erros.append(erro)
+            continue
+
+        if preparar:
+            preparar(documento)
+        lote.append((indice, documento, documento_id))
+
+        if len(lote) >= tamanho_lote:
+            await descarregar()
+
+    if lote:
+        await descarregar()
+
+    return {
+        "gravados": len(resultados),
+        "com_erro": len(erros),
+        "data": resultados,
+        "erros": sorted(erros, key=lambda erro: erro["indice"]),
+    }
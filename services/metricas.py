@@ -0,0 +1,149 @@
+import logging
+import time
+from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+from pymongo import monitoring
+
+logger = logging.getLogger("gestao_roupas.mongodb")
+
+REQUISICOES = Histogram(
+    "http_requisicao_segundos", "Latência das requisições HTTP por rota", ["metodo", "rota", "status"]
+)
+COMANDOS = Histogram(
+    "mongodb_comando_segundos", "Duração dos comandos MongoDB por coleção e operação", ["colecao", "operacao"]
+)
+FALHAS_COMANDOS = Counter(
+    "mongodb_comando_falhas_total", "Comandos MongoDB que falharam", ["colecao", "operacao"]
+)
+ESPERA_POOL = Histogram(
+    "mongodb_pool_espera_segundos", "Tempo de espera para obter uma conexão do pool",
+    buckets=(.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5)
+)
+CONSULTAS_LENTAS = Counter(
+    "mongodb_consultas_lentas_total", "Comandos acima do limiar de consulta lenta", ["colecao", "operacao"]
+)
+EVENTOS_MUDANCA = Counter(
+    "mongodb_eventos_mudanca_total", "Eventos de change stream consumidos", ["colecao", "operacao"]
+)
+ORCAMENTO_REJEICOES = Counter(
+    "orcamento_rejeicoes_total", "Requisições recusadas pelo orçamento de consulta", ["rota", "motivo"]
+)
+ORCAMENTO_EM_EXECUCAO = Gauge(
+    "orcamento_em_execucao", "Requisições em execução por política de orçamento", ["politica"]
+)
+JOBS_CONSULTAS = Counter(
+    "jobs_consultas_total", "Jobs de consultas por resultado", ["consulta", "resultado"]
+)
+JOBS_DURACAO = Histogram(
+    "jobs_consultas_segundos", "Duração da execução dos jobs de consultas", ["consulta"],
+    buckets=(.1, .5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+)
+COALESCENCIA = Counter(
+    "coalescencia_requisicoes_total",
+    "Chamadas por rota que executaram a consulta ou compartilharam uma já em andamento", ["rota", "resultado"]
+)
+COALESCENCIA_EM_VOO = Gauge(
+    "coalescencia_em_voo", "Consultas coalescidas em andamento por rota", ["rota"]
+)
+
+COMANDOS_IGNORADOS = {"hello", "ismaster", "isMaster", "ping", "saslStart", "saslContinue", "endSessions"}
+
+
+def forma_filtro(valor):
+    # troca valores por "?" para logar o formato da consulta sem dados do usuário
+    if isinstance(valor, dict):
+        return {chave: forma_filtro(item) for chave, item in valor.items()}
+    if isinstance(valor, list):
+        return [forma_filtro(item) for item in valor[:3]]
+    return "?"
+
+
+def _filtro_do_comando(nome, comando):
+    if nome == "find":
+        return {"filter": comando.get("filter"), "sort": comando.get("sort")}
+    if nome == "aggregate":
+        return comando.get("pipeline")
+    if nome in ("count", "countDocuments", "findAndModify", "distinct"):
+        return comando.get("query")
+    if nome == "update":
+        return [atualizacao.get("q") for atualizacao in comando.get("updates", [])[:1]]
+    if nome == "delete":
+        return [remocao.get("q") for remocao in comando.get("deletes", [])[:1]]
+    return None
+
+
+def _colecao_do_comando(nome, comando):
+    if nome == "getMore":
+        return comando.get("collection", "")
+    colecao = comando.get(nome)
+    return colecao if isinstance(colecao, str) else ""
+
+
+class OuvinteComandos(monitoring.CommandListener):
+    def __init__(self, limiar_lento_ms):
+        self.limiar_lento_ms = limiar_lento_ms
+        self.em_andamento = {}
+
+    def started(self, event):
+        if event.command_name in COMANDOS_IGNORADOS:
+            return
+        colecao = _colecao_do_comando(event.command_name, event.command)
+        filtro = _filtro_do_comando(event.command_name, event.command)
+        self.em_andamento[(event.connection_id, event.request_id)] = (colecao, filtro)
+
+    def _finalizar(self, event):
+        return self.em_andamento.pop((event.connection_id, event.request_id), None)
+
+    def succeeded(self, event):
+        iniciado = self._finalizar(event)
+        if iniciado is None:
+            return
+
+        colecao, filtro = iniciado
+        duracao = event.duration_micros / 1_000_000
+        COMANDOS.labels(colecao, event.command_name).observe(duracao)
+
+        if duracao * 1000 >= self.limiar_lento_ms:
+            CONSULTAS_LENTAS.labels(colecao, event.command_name).inc()
+            logger.warning(
+                "consulta lenta: %s.%s %.1fms formato=%s",
+                colecao, event.command_name, duracao * 1000, forma_filtro(filtro)
+            )
+
+    def failed(self, event):
+        iniciado = self._finalizar(event)
+        if iniciado is None:
+            return
+        FALHAS_COMANDOS.labels(iniciado[0], event.command_name).inc()
+
+
+class OuvintePool(monitoring.ConnectionPoolListener):
+    def connection_checked_out(self, event):
+        # "duration" existe a partir do PyMongo 4.7 e mede a espera desde o pedido de conexão
+        duracao = getattr(event, "duration", None)
+        if duracao is not None:
+            ESPERA_POOL.observe(duracao)
+
+    def _ignorar(self, event):
+        pass
+
+    pool_created = pool_ready = pool_cleared = pool_closed = _ignorar
+    connection_created = connection_ready = connection_closed = _ignorar
+    connection_check_out_started = connection_check_out_failed = connection_checked_in = _ignorar
+
+
+async def medir_requisicao(request, call_next):
+    inicio = time.perf_counter()
+    status = 500
+    try:
+        resposta = await call_next(request)
+        status = resposta.status_code
+        return resposta
+    finally:
+        rota = request.scope.get("route")
+        # o template da rota (/pedidos/pedido/{pedido_id}) mantém a cardinalidade baixa
+        caminho = rota.path if rota else "nao_encontrada"
+        REQUISICOES.labels(request.method, caminho, str(status)).observe(time.perf_counter() - inicio)
+
+
+def exportar_metricas():
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,94 @@
+import asyncio
+import contextvars
+import functools
+import pymongo
+from fastapi import HTTPException
+from pymongo.errors import PyMongoError
+from config import (
+    CONSULTAS_CONCORRENTES, CONSULTAS_ESPERA_S, ORCAMENTO_CONSULTA_MS, ORCAMENTO_CRUD_MS, ORCAMENTO_LIMIT_MAXIMO,
+    ORCAMENTO_SKIP_MAXIMO
+)
+from services.metricas import ORCAMENTO_EM_EXECUCAO, ORCAMENTO_REJEICOES
+
+
+class Politica:
+    def __init__(self, nome, max_time_ms, limit_maximo=ORCAMENTO_LIMIT_MAXIMO, skip_maximo=ORCAMENTO_SKIP_MAXIMO,
+                 allow_disk_use=False, concorrencia=None, espera_s=CONSULTAS_ESPERA_S):
+        self.nome = nome
+        self.max_time_ms = max_time_ms
+        self.limit_maximo = limit_maximo
+        self.skip_maximo = skip_maximo
+        self.allow_disk_use = allow_disk_use
+        self.semaforo = asyncio.Semaphore(concorrencia) if concorrencia else None
+        self.espera_s = espera_s
+
+
+POLITICAS = {
+    "crud": Politica("crud", ORCAMENTO_CRUD_MS),
+    # consultas analíticas: mais tempo e disco para $group/$sort grandes, mas poucas de cada vez
+    "consulta": Politica("consulta", ORCAMENTO_CONSULTA_MS, allow_disk_use=True, concorrencia=CONSULTAS_CONCORRENTES),
+}
+
+_politica_atual = contextvars.ContextVar("politica_atual", default=None)
+
+
+def opcoes_agregacao():
+    # usado nos aggregate() das rotas: a política da requisição decide se o $group/$sort pode ir para o disco
+    politica = _politica_atual.get()
+    return {"allowDiskUse": True} if politica and politica.allow_disk_use else {}
+
+
+def _validar_paginacao(kwargs, politica, rota):
+    limit, skip = kwargs.get("limit"), kwargs.get("skip")
+
+    if limit is not None and not 1 <= limit <= politica.limit_maximo:
+        ORCAMENTO_REJEICOES.labels(rota, "limite").inc()
+        raise HTTPException(status_code=400, detail=f"limit deve estar entre 1 e {politica.limit_maximo}")
+    if skip is not None and not 0 <= skip <= politica.skip_maximo:
+        ORCAMENTO_REJEICOES.labels(rota, "limite").inc()
+        raise HTTPException(
+            status_code=400, detail=f"skip deve estar entre 0 e {politica.skip_maximo}; use paginação por cursor"
+        )
+
+
+async def _entrar(politica, rota):
+    if politica.semaforo is None:
+        return
+    try:
+        await asyncio.wait_for(politica.semaforo.acquire(), politica.espera_s)
+    except asyncio.TimeoutError:
+        ORCAMENTO_REJEICOES.labels(rota, "concorrencia").inc()
+        raise HTTPException(status_code=429, detail="Muitas consultas em andamento", headers={"Retry-After": "1"})
+
+
+def orcamento(nome):
+    politica = POLITICAS[nome]
+
+    def decorador(funcao):
+        rota = funcao.__name__
+
+        @functools.wraps(funcao)
+        async def envoltorio(*args, **kwargs):
+            _validar_paginacao(kwargs, politica, rota)
+            await _entrar(politica, rota)
+
+            token = _politica_atual.set(politica)
+            ORCAMENTO_EM_EXECUCAO.labels(politica.nome).inc()
+            try:
+                # pymongo.timeout envia maxTimeMS em cada operação e corta a requisição inteira no prazo
+                with pymongo.timeout(politica.max_time_ms / 1000):
+                    return await funcao(*args, **kwargs)
+            except PyMongoError as erro:
+                if not erro.timeout:
+                    raise
+                ORCAMENTO_REJEICOES.labels(rota, "tempo").inc()
+                raise HTTPException(status_code=503, detail="A consulta excedeu o tempo permitido")
+            finally:
+                ORCAMENTO_EM_EXECUCAO.labels(politica.nome).dec()
+                _politica_atual.reset(token)
+                if politica.semaforo is not None:
+                    politica.semaforo.release()
+
+        return envoltorio
+
+    return decorador
@@ -0,0 +1,92 @@
+import base64
+import binascii
+import time
+from decimal import InvalidOperation
+from bson import json_util
+from bson.errors import BSONError
+from fastapi import HTTPException
+from services.busca import PROJECAO_PUBLICA
+
+TTL_CONTAGEM_ESTIMADA = 30  # segundos
+
+_contagens_estimadas = {}
+
+
+def codificar_cursor(documento, ordenacao):
+    valores = {campo: documento[campo] for campo, _ in ordenacao}
+    return base64.urlsafe_b64encode(json_util.dumps(valores).encode()).decode()
+
+
+def decodificar_cursor(cursor, ordenacao):
+    try:
+        valores = json_util.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except (binascii.Error, UnicodeDecodeError, ValueError, IndexError, InvalidOperation, BSONError):
+        # além de base64/JSON quebrados, o JSON estendido malformado ($oid, $date, $numberDecimal) também cai aqui
+        raise HTTPException(status_code=400, detail="Cursor inválido") from None
+
+    if not isinstance(valores, dict) or any(campo not in valores for campo, _ in ordenacao):
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+    return valores
+
+
+def filtro_apos_cursor(valores, ordenacao):
+    # (a, b) > (x, y)  =>  a > x  OU  (a == x E b > y)
+    condicoes = []
+    for i, (campo, direcao) in enumerate(ordenacao):
+        condicao = {anterior: valores[anterior] for anterior, _ in ordenacao[:i]}
+        condicao[campo] = {"$gt" if direcao == 1 else "$lt": valores[campo]}
+        condicoes.append(condicao)
+
+    if len(condicoes) == 1:
+        return condicoes[0]
+    return {"$or": condicoes}
+
+
+async def contagem_estimada(colecao):
+    agora = time.monotonic()
+    em_cache = _contagens_estimadas.get(colecao.name)
+
+    if em_cache and em_cache[0] > agora:
+        return em_cache[1]
+
+    total = await colecao.estimated_document_count()
+    _contagens_estimadas[colecao.name] = (agora + TTL_CONTAGEM_ESTIMADA, total)
+
+    return total
+
+
+async def listar_paginado(colecao, skip, limit, paginacao="offset", cursor=None, contar_total=True,
+                          ordenacao=(("_id", 1),), projecao=PROJECAO_PUBLICA):
+    if paginacao not in ("offset", "cursor"):
+        raise HTTPException(status_code=400, detail="Paginação deve ser 'offset' ou 'cursor'")
+
+    if paginacao == "offset":
+        total = await colecao.count_documents({}) if contar_total else None
+        documentos = await colecao.find({}, projecao).skip(skip).limit(limit).to_list(100)
+
+        metadados = {
+            "total": total,
+            "skip": skip,
+            "limit": limit,
+            "page": (skip // limit) + 1 if limit else 0
+        }
+
+        return {"data": documentos, "metadados": metadados}
+
+    ordenacao = list(ordenacao)
+    filtro = filtro_apos_cursor(decodificar_cursor(cursor, ordenacao), ordenacao) if cursor else {}
+    documentos = await colecao.find(filtro, projecao).sort(ordenacao).limit(limit).to_list(limit)
+
+    proximo_cursor = None
+    if limit and len(documentos) == limit:
+        proximo_cursor = codificar_cursor(documentos[-1], ordenacao)
+
+    metadados = {
+        "total": await contagem_estimada(colecao) if contar_total else None,
+        "total_estimado": True,
+        "limit": limit,
+        "next_cursor": proximo_cursor
+    }
+
+    return {"data": documentos, "metadados": metadados}
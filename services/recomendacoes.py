@@ -0,0 +1,146 @@
+from datetime import datetime
+from bson import ObjectId
+from pymongo import ReplaceOne, UpdateOne
+from config import MODO_ITENS, RELACIONADAS_TOP_K
+from services.arquivo import ARQUIVO_ITENS, ARQUIVO_PEDIDOS
+
+# um documento por roupa: {_id: roupa_id, vizinhos: [{roupa_id, pedidos}]} com as K roupas mais compradas junto
+RELACIONADAS = "roupas_relacionadas"
+
+TAMANHO_LOTE = 1000
+
+
+async def relacionadas(db, roupa_id, limit):
+    documento = await db[RELACIONADAS].find_one({"_id": roupa_id}, {"vizinhos": 1})
+    if not documento:
+        return []
+    # os $inc incrementais não reordenam o array: a ordem final sai aqui
+    vizinhos = sorted(documento["vizinhos"], key=lambda vizinho: vizinho["pedidos"], reverse=True)
+    return vizinhos[:limit]
+
+
+async def _pares_pedido_roupa(db, modo_itens):
+    # pedidos arquivados também contam: o histórico antigo é a maior parte do sinal
+    if modo_itens == "embutido":
+        for colecao in (db.pedidos, db[ARQUIVO_PEDIDOS]):
+            async for pedido in colecao.find({"itens.0": {"$exists": True}}, {"itens.roupa_id": 1}):
+                for linha in pedido["itens"]:
+                    yield str(pedido["_id"]), linha.get("roupa_id")
+        return
+
+    for colecao in (db.itens_pedidos, db[ARQUIVO_ITENS]):
+        async for item in colecao.find({}, {"pedido_id": 1, "roupa_id": 1}, batch_size=TAMANHO_LOTE):
+            yield str(item.get("pedido_id")), item.get("roupa_id")
+
+
+async def reconstruir_relacionadas(db, top_k=RELACIONADAS_TOP_K, modo_itens=MODO_ITENS):
+    # numpy/scipy só são exigidos por esta reconstrução em lote
+    import numpy as np
+    from scipy import sparse
+
+    pedidos, roupas = {}, {}
+    linhas, colunas = [], []
+    async for pedido_id, roupa_id in _pares_pedido_roupa(db, modo_itens):
+        if not roupa_id:
+            continue
+        linhas.append(pedidos.setdefault(pedido_id, len(pedidos)))
+        colunas.append(roupas.setdefault(str(roupa_id), len(roupas)))
+
+    gerado_em = datetime.utcnow()
+    if roupas:
+        # matriz pedido x roupa binária: a mesma roupa duas vezes no pedido conta uma vez
+        compras = sparse.csr_matrix(
+            (np.ones(len(linhas), dtype=np.int32), (np.array(linhas), np.array(colunas))),
+            shape=(len(pedidos), len(roupas))
+        )
+        compras.data[:] = 1
+
+        # (roupas x pedidos) @ (pedidos x roupas): cada célula é o número de pedidos com as duas roupas
+        coocorrencias = (compras.T @ compras).tocsr()
+        coocorrencias.setdiag(0)
+        coocorrencias.eliminate_zeros()
+
+        ids = list(roupas)
+        operacoes = []
+        for indice, roupa_id in enumerate(ids):
+            inicio, fim = coocorrencias.indptr[indice], coocorrencias.indptr[indice + 1]
+            vizinhos, contagens = coocorrencias.indices[inicio:fim], coocorrencias.data[inicio:fim]
+            if len(contagens) > top_k:
+                melhores = np.argpartition(-contagens, top_k)[:top_k]
+                vizinhos, contagens = vizinhos[melhores], contagens[melhores]
+            ordem = np.argsort(-contagens, kind="stable")
+
+            operacoes.append(ReplaceOne({"_id": roupa_id}, {
+                "vizinhos": [
+                    {"roupa_id": ids[int(vizinho)], "pedidos": int(contagem)}
+                    for vizinho, contagem in zip(vizinhos[ordem], contagens[ordem])
+                ],
+                "gerado_em": gerado_em,
+            }, upsert=True))
+            if len(operacoes) >= TAMANHO_LOTE:
+                await db[RELACIONADAS].bulk_write(operacoes, ordered=False)
+                operacoes = []
+
+        if operacoes:
+            await db[RELACIONADAS].bulk_write(operacoes, ordered=False)
+
+    # roupas que não aparecem mais em nenhum pedido ficam de fora da nova geração
+    removidas = await db[RELACIONADAS].delete_many({"gerado_em": {"$lt": gerado_em}})
+
+    return {"roupas": len(roupas), "pedidos": len(pedidos), "removidas": removidas.deleted_count}
+
+
+def _incrementar(roupa_id, vizinho, top_k):
+    # ordenado: se o vizinho já está no top-K só o $inc casa; senão só o $push, que reordena e corta em K
+    return [
+        UpdateOne({"_id": roupa_id, "vizinhos.roupa_id": vizinho}, {"$inc": {"vizinhos.$.pedidos": 1}}),
+        UpdateOne({"_id": roupa_id, "vizinhos.roupa_id": {"$ne": vizinho}}, {"$push": {"vizinhos": {
+            "$each": [{"roupa_id": vizinho, "pedidos": 1}], "$sort": {"pedidos": -1}, "$slice": top_k,
+        }}}),
+    ]
+
+
+async def registrar_coocorrencias(db, novas, existentes=(), top_k=RELACIONADAS_TOP_K):
+    # novas: roupas que acabaram de entrar no pedido; existentes: as que o pedido já tinha.
+    # Entre reconstruções as contagens são aproximadas: um par que estava fora do top-K recomeça em 1.
+    existentes = {str(roupa_id) for roupa_id in existentes if roupa_id}
+    novas = sorted({str(roupa_id) for roupa_id in novas if roupa_id} - existentes)
+
+    pares = [(nova, existente) for nova in novas for existente in existentes]
+    pares += [(nova, outra) for i, nova in enumerate(novas) for outra in novas[i + 1:]]
+    if not pares:
+        return
+
+    envolvidas = set(novas) | existentes
+    operacoes = [
+        UpdateOne({"_id": roupa_id}, {"$setOnInsert": {"vizinhos": [], "gerado_em": datetime.utcnow()}}, upsert=True)
+        for roupa_id in envolvidas
+    ]
+    for roupa_id, vizinho in pares:
+        operacoes += _incrementar(roupa_id, vizinho, top_k) + _incrementar(vizinho, roupa_id, top_k)
+
+    await db[RELACIONADAS].bulk_write(operacoes, ordered=True)
+
+
+async def registrar_coocorrencias_item(db, item, modo_itens=MODO_ITENS):
+    # chamado depois da gravação: a roupa do item já aparece entre as do pedido
+    existentes = await _roupas_do_pedido(db, item["pedido_id"], modo_itens)
+    if item["roupa_id"] in existentes:
+        existentes.remove(item["roupa_id"])
+    await registrar_coocorrencias(db, [item["roupa_id"]], existentes)
+
+
+async def _roupas_do_pedido(db, pedido_id, modo_itens):
+    if modo_itens == "embutido":
+        if not ObjectId.is_valid(pedido_id):
+            return []
+        pedido = await db.pedidos.find_one({"_id": ObjectId(pedido_id)}, {"itens.roupa_id": 1})
+        return [linha.get("roupa_id") for linha in pedido.get("itens", [])] if pedido else []
+    return [item.get("roupa_id") async for item in db.itens_pedidos.find({"pedido_id": pedido_id}, {"roupa_id": 1})]
+
+
+if __name__ == "__main__":
+    import asyncio
+    from config import db
+
+    print(asyncio.run(reconstruir_relacionadas(db)))
@@ -0,0 +1,164 @@
+from datetime import datetime
+from fastapi import HTTPException
+from pymongo import ReplaceOne
+from config import RFM_HORIZONTE_ANOS, RFM_TAMANHO_LOTE
+from services.arquivo import ARQUIVO_PEDIDOS
+
+# uma linha por cliente com recência/frequência/valor, notas RFM de 1 a 5, segmento e LTV
+CLIENTES_METRICAS = "clientes_metricas"
+
+ORDENACOES = ("ltv", "monetario", "frequencia", "recencia_dias")
+TAMANHO_GRAVACAO = 1000
+DIA_S = 86400
+
+FILTRO_PEDIDOS = {"cliente_id": {"$type": "string"}, "data": {"$type": "date"}}
+PROJECAO_PEDIDOS = {"_id": 0, "cliente_id": 1, "data": 1, "valor_total": 1}
+
+
+class _Acumulador:
+    # somas por cliente que crescem com o número de clientes, nunca com o de pedidos
+    def __init__(self, np):
+        self.np = np
+        self.indices = {}
+        self.frequencia = np.zeros(0, dtype=np.int64)
+        self.monetario = np.zeros(0, dtype=np.float64)
+        self.primeira = np.zeros(0, dtype=np.int64)
+        self.ultima = np.zeros(0, dtype=np.int64)
+
+    def _crescer(self):
+        np, tamanho = self.np, len(self.indices)
+        faltam = tamanho - len(self.frequencia)
+        if faltam <= 0:
+            return
+        faltam = max(faltam, len(self.frequencia))  # dobra a capacidade: cópias amortizadas
+        self.frequencia = np.concatenate([self.frequencia, np.zeros(faltam, dtype=np.int64)])
+        self.monetario = np.concatenate([self.monetario, np.zeros(faltam, dtype=np.float64)])
+        self.primeira = np.concatenate([self.primeira, np.full(faltam, np.iinfo(np.int64).max)])
+        self.ultima = np.concatenate([self.ultima, np.full(faltam, np.iinfo(np.int64).min)])
+
+    def somar(self, pedidos):
+        np = self.np
+        codigos = np.fromiter(
+            (self.indices.setdefault(pedido["cliente_id"], len(self.indices)) for pedido in pedidos),
+            dtype=np.int64, count=len(pedidos)
+        )
+        datas = np.array([pedido["data"] for pedido in pedidos], dtype="datetime64[s]").astype(np.int64)
+        valores = np.fromiter(
+            (pedido.get("valor_total") or 0 for pedido in pedidos), dtype=np.float64, count=len(pedidos)
+        )
+        self._crescer()
+
+        tamanho = len(self.frequencia)
+        self.frequencia += np.bincount(codigos, minlength=tamanho)
+        self.monetario += np.bincount(codigos, weights=valores, minlength=tamanho)
+        np.minimum.at(self.primeira, codigos, datas)
+        np.maximum.at(self.ultima, codigos, datas)
+
+    def colunas(self):
+        tamanho = len(self.indices)
+        return (
+            list(self.indices), self.frequencia[:tamanho], self.monetario[:tamanho],
+            self.primeira[:tamanho], self.ultima[:tamanho],
+        )
+
+
+def _notas(np, valores, crescente=True):
+    # quintis: nota 1 a 5; na recência o menor valor (compra mais recente) é o melhor
+    limites = np.quantile(valores, [0.2, 0.4, 0.6, 0.8])
+    notas = np.searchsorted(limites, valores, side="right") + 1
+    return notas if crescente else 6 - notas
+
+
+def _segmentos(np, r, f):
+    return np.select(
+        [(r >= 4) & (f >= 4), (r >= 4) & (f == 1), (r <= 2) & (f >= 3), r == 1, f >= 4],
+        ["campeao", "novo", "em_risco", "perdido", "leal"],
+        default="regular"
+    )
+
+
+async def calcular_metricas(db, horizonte_anos=RFM_HORIZONTE_ANOS, tamanho_lote=RFM_TAMANHO_LOTE):
+    # numpy só é exigido por este cálculo em lote
+    import numpy as np
+
+    acumulador = _Acumulador(np)
+    pedidos_lidos = 0
+    for colecao in (db.pedidos, db[ARQUIVO_PEDIDOS]):
+        cursor = colecao.find(FILTRO_PEDIDOS, PROJECAO_PEDIDOS, batch_size=tamanho_lote)
+        lote = await cursor.to_list(tamanho_lote)
+        while lote:
+            acumulador.somar(lote)
+            pedidos_lidos += len(lote)
+            lote = await cursor.to_list(tamanho_lote)
+
+    calculado_em = datetime.utcnow()
+    clientes, frequencia, monetario, primeira, ultima = acumulador.colunas()
+
+    if clientes:
+        agora = np.datetime64(calculado_em, "s").astype(np.int64)
+        recencia_dias = (agora - ultima) / DIA_S
+        ticket_medio = monetario / frequencia
+        # clientes com menos de um mês de histórico não projetam uma frequência anual absurda
+        anos_como_cliente = np.maximum((agora - primeira) / DIA_S, 30) / 365
+        ltv = ticket_medio * (frequencia / anos_como_cliente) * horizonte_anos
+
+        r = _notas(np, recencia_dias, crescente=False)
+        f = _notas(np, frequencia)
+        m = _notas(np, monetario)
+        segmentos = _segmentos(np, r, f)
+        primeira_compra = primeira.astype("datetime64[s]").astype(datetime)
+        ultima_compra = ultima.astype("datetime64[s]").astype(datetime)
+
+        operacoes = []
+        for i, cliente_id in enumerate(clientes):
+            operacoes.append(ReplaceOne({"_id": cliente_id}, {
+                "frequencia": int(frequencia[i]),
+                "monetario": round(float(monetario[i]), 2),
+                "ticket_medio": round(float(ticket_medio[i]), 2),
+                "recencia_dias": round(float(recencia_dias[i]), 1),
+                "primeira_compra": primeira_compra[i],
+                "ultima_compra": ultima_compra[i],
+                "r": int(r[i]), "f": int(f[i]), "m": int(m[i]),
+                "rfm": f"{r[i]}{f[i]}{m[i]}",
+                "segmento": str(segmentos[i]),
+                "ltv": round(float(ltv[i]), 2),
+                "calculado_em": calculado_em,
+            }, upsert=True))
+            if len(operacoes) >= TAMANHO_GRAVACAO:
+                await db[CLIENTES_METRICAS].bulk_write(operacoes, ordered=False)
+                operacoes = []
+
+        if operacoes:
+            await db[CLIENTES_METRICAS].bulk_write(operacoes, ordered=False)
+
+    # clientes sem pedidos desde o último cálculo saem da tabela
+    removidos = await db[CLIENTES_METRICAS].delete_many({"calculado_em": {"$lt": calculado_em}})
+
+    return {"clientes": len(clientes), "pedidos": pedidos_lidos, "removidos": removidos.deleted_count}
+
+
+async def metricas_cliente(db, cliente_id):
+    metricas = await db[CLIENTES_METRICAS].find_one({"_id": cliente_id})
+    if not metricas:
+        raise HTTPException(status_code=404, detail="Métricas não calculadas para este cliente")
+    return metricas
+
+
+async def ranking(db, ordenar, segmento, skip, limit):
+    if ordenar not in ORDENACOES:
+        raise HTTPException(status_code=400, detail=f"ordenar aceita {', '.join(ORDENACOES)}")
+
+    filtro = {"segmento": segmento} if segmento else {}
+    # recência: quanto menor, melhor; os demais critérios, quanto maior
+    direcao = 1 if ordenar == "recencia_dias" else -1
+
+    return await db[CLIENTES_METRICAS].find(filtro).sort(
+        [(ordenar, direcao), ("_id", 1)]
+    ).skip(skip).limit(limit).to_list(limit)
+
+
+if __name__ == "__main__":
+    import asyncio
+    from config import db
+
+    print(asyncio.run(calcular_metricas(db)))
@@ -0,0 +1,58 @@
+import json
+from bson import Decimal128, ObjectId
+from fastapi.responses import JSONResponse
+from config import VALIDAR_RESPOSTAS
+
+try:
+    import orjson
+except ImportError:  # sem orjson cai no json da biblioteca padrão, mais lento
+    orjson = None
+
+
+def _converter(valor):
+    if isinstance(valor, ObjectId):
+        return str(valor)
+    if isinstance(valor, Decimal128):
+        return float(valor.to_decimal())
+    if orjson is None and hasattr(valor, "isoformat"):
+        return valor.isoformat()
+    raise TypeError(f"Tipo não serializável: {type(valor).__name__}")
+
+
+def serializar(conteudo):
+    # ObjectId e datetime são convertidos durante a própria serialização, sem percorrer os documentos antes
+    if orjson is not None:
+        return orjson.dumps(conteudo, default=_converter)
+    return json.dumps(conteudo, default=_converter, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+class RespostaBSON(JSONResponse):
+    def render(self, content):
+        return serializar(content)
+
+
+def projecao_modelo(modelo):
+    # só os campos do schema saem do banco: "busca" e campos legados não chegam à resposta
+    return {campo.alias or nome: 1 for nome, campo in modelo.__fields__.items() if nome != "id"}
+
+
+def _ids_para_str(valor):
+    if isinstance(valor, ObjectId):
+        return str(valor)
+    if isinstance(valor, dict):
+        return {chave: _ids_para_str(item) for chave, item in valor.items()}
+    if isinstance(valor, list):
+        return [_ids_para_str(item) for item in valor]
+    return valor
+
+
+def responder(conteudo, response=None):
+    # documentos vindos do banco já respeitam o schema: a revalidação pelo response_model é opcional
+    if VALIDAR_RESPOSTAS:
+        return _ids_para_str(conteudo)
+
+    resposta = RespostaBSON(conteudo)
+    if response is not None:
+        # cabeçalhos definidos na rota (ETag) não são copiados pelo FastAPI quando a rota devolve uma Response
+        resposta.headers.update(response.headers)
+    return resposta
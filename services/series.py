@@ -0,0 +1,107 @@
+from datetime import datetime, timedelta, timezone
+from fastapi import HTTPException
+from services.agregados import AGREGADO_DIA
+from services.arquivo import unir_arquivo
+from services.orcamento import opcoes_agregacao
+
+GRANULARIDADES = {"dia": "day", "semana": "week", "mes": "month"}
+FONTES = ("auto", "agregado", "pedidos")
+
+PERIODO_PADRAO_DIAS = 30
+INTERVALO_MAXIMO_DIAS = 3660
+
+CAMPOS = ("quantidade_pedidos", "receita", "itens_vendidos")
+
+
+def _inicio_periodo(data, granularidade):
+    dia = datetime(data.year, data.month, data.day)
+    if granularidade == "semana":
+        return dia - timedelta(days=dia.weekday())  # semanas começam na segunda, como o startOfWeek do $dateTrunc
+    if granularidade == "mes":
+        return dia.replace(day=1)
+    return dia
+
+
+def _alinhado_ao_dia(data):
+    return data == datetime(data.year, data.month, data.day)
+
+
+def intervalo(inicio, fim, granularidade):
+    if granularidade not in GRANULARIDADES:
+        raise HTTPException(status_code=400, detail="Granularidade deve ser 'dia', 'semana' ou 'mes'")
+
+    if fim is None:
+        hoje = datetime.utcnow()
+        fim = datetime(hoje.year, hoje.month, hoje.day) + timedelta(days=1)
+    if inicio is None:
+        inicio = fim - timedelta(days=PERIODO_PADRAO_DIAS)
+
+    # datas com fuso viram UTC ingênuo, como o Motor devolve os campos de data
+    inicio, fim = (
+        data.astimezone(timezone.utc).replace(tzinfo=None) if data.tzinfo else data for data in (inicio, fim)
+    )
+
+    if inicio >= fim:
+        raise HTTPException(status_code=400, detail="inicio deve ser anterior a fim")
+    if (fim - inicio).days > INTERVALO_MAXIMO_DIAS:
+        raise HTTPException(status_code=400, detail=f"Intervalo maior que {INTERVALO_MAXIMO_DIAS} dias")
+
+    return inicio, fim
+
+
+def lista_status(status):
+    if not status:
+        return None
+    return [valor.strip() for valor in status.split(",") if valor.strip()] or None
+
+
+def escolher_fonte(fonte, inicio, fim):
+    if fonte not in FONTES:
+        raise HTTPException(status_code=400, detail="Fonte deve ser 'auto', 'agregado' ou 'pedidos'")
+    if fonte != "auto":
+        return fonte
+    # os buckets são diários: só respondem exatamente intervalos em dias inteiros
+    return "agregado" if _alinhado_ao_dia(inicio) and _alinhado_ao_dia(fim) else "pedidos"
+
+
+async def serie_por_agregado(db, inicio, fim, granularidade, status=None):
+    filtro = {"dia": {"$gte": _inicio_periodo(inicio, "dia"), "$lt": fim}}
+    if status:
+        filtro["status"] = {"$in": status}
+
+    periodos = {}
+    async for bucket in db[AGREGADO_DIA].find(filtro, {"_id": 0, "dia": 1, **{campo: 1 for campo in CAMPOS}}):
+        periodo = periodos.setdefault(
+            _inicio_periodo(bucket["dia"], granularidade), dict.fromkeys(CAMPOS, 0)
+        )
+        for campo in CAMPOS:
+            periodo[campo] += bucket.get(campo, 0)
+
+    return [
+        {"periodo": periodo, **valores}
+        for periodo, valores in sorted(periodos.items())
+        if valores["quantidade_pedidos"] or valores["itens_vendidos"]
+    ]
+
+
+async def serie_por_pedidos(db, inicio, fim, granularidade, status=None, arquivo=False):
+    filtro = {"data": {"$gte": inicio, "$lt": fim}}
+    if status:
+        filtro["status"] = {"$in": status}
+
+    truncar = {"date": "$data", "unit": GRANULARIDADES[granularidade]}
+    if granularidade == "semana":
+        truncar["startOfWeek"] = "monday"
+
+    etapas = [{"$match": filtro}, unir_arquivo(filtro)] if arquivo else [{"$match": filtro}]
+
+    return await db.pedidos.aggregate(etapas + [
+        {"$group": {
+            "_id": {"$dateTrunc": truncar},
+            "quantidade_pedidos": {"$sum": 1},
+            "receita": {"$sum": "$valor_total"},
+            "itens_vendidos": {"$sum": {"$ifNull": ["$quantidade_itens", 0]}},
+        }},
+        {"$sort": {"_id": 1}},
+        {"$project": {"_id": 0, "periodo": "$_id", **{campo: 1 for campo in CAMPOS}}},
+    ], **opcoes_agregacao()).to_list(None)
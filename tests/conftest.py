@@ -0,0 +1,70 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+mongomock_motor = pytest.importorskip("mongomock_motor")
+httpx = pytest.importorskip("httpx")
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# precisa acontecer antes de importar as rotas, que fazem "from config import db"
+import config  # noqa: E402
+
+config.client = mongomock_motor.AsyncMongoMockClient()
+config.db = config.db_consultas = config.db_lote = config.client[config.NOME_BANCO]
+
+import main  # noqa: E402
+from services import arquivo, paginacao  # noqa: E402
+from services.cache import cache  # noqa: E402
+
+so_colecao = pytest.mark.skipif(config.MODO_ITENS == "embutido", reason="lê e grava a coleção itens_pedidos")
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+def db():
+    return config.db
+
+
+@pytest.fixture(autouse=True)
+async def base_limpa(db):
+    # cada teste começa com a base vazia e sem estado de processo (cache, limites do arquivo, contagens)
+    for colecao in await db.list_collection_names():
+        await db.drop_collection(colecao)
+    cache.entradas.clear()
+    cache.tags.clear()
+    arquivo._limites.clear()
+    paginacao._contagens_estimadas.clear()
+    yield
+
+
+@pytest.fixture
+async def api():
+    # sem o lifespan: nem workers de jobs nem change streams, que o mongomock não suporta
+    transporte = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transporte, base_url="http://teste") as cliente:
+        yield cliente
+
+
+def novo_cliente(nome="Ana Souza", cidade="Recife", **campos):
+    return {
+        "nome": nome, "cpf": "12345678900", "telefone": "81999990000", "email": "ana@exemplo.com",
+        "endereco": {"rua": "Rua A", "numero": 10, "cep": "50000-000", "cidade": cidade, "estado": "PE"},
+        **campos,
+    }
+
+
+def novo_pedido(cliente_id="c1", status="pendente", valor_total=100.0, data="2024-03-05T10:00:00", **campos):
+    return {"data": data, "status": status, "valor_total": valor_total, "cliente_id": cliente_id, **campos}
+
+
+def novo_item(pedido_id, roupa_id="r1", quantidade=2, preco_unitario=50.0, **campos):
+    return {
+        "pedido_id": pedido_id, "roupa_id": roupa_id, "quantidade": quantidade,
+        "preco_unitario": preco_unitario, "subtotal": quantidade * preco_unitario, **campos,
+    }
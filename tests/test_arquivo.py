@@ -0,0 +1,86 @@
+from datetime import datetime
+
+import pytest
+from bson import ObjectId
+
+from conftest import novo_item, novo_pedido, so_colecao
+from services.arquivo import ARQUIVO_ITENS, ARQUIVO_PEDIDOS, _arquivar_lote, precisa_arquivo
+
+pytestmark = pytest.mark.anyio
+
+
+async def _pedido_com_item(api, status, data):
+    pedido_id = (await api.post("/pedidos/", json=novo_pedido(status=status, data=data))).json()["_id"]
+    await api.post("/itensPedidos/", json=novo_item(pedido_id))
+    return pedido_id
+
+
+@so_colecao
+async def test_arquivamento_move_so_pedidos_antigos_em_status_final(api, db):
+    antigo = await _pedido_com_item(api, "entregue", "2020-03-01T10:00:00")
+    antigo_aberto = await _pedido_com_item(api, "pendente", "2020-03-01T10:00:00")
+    recente = await _pedido_com_item(api, "entregue", f"{datetime.utcnow().year}-01-01T10:00:00")
+
+    resposta = await api.post("/admin/pedidos/arquivar")
+    assert resposta.json()["data"]["arquivados"] == 1
+
+    assert set(await db.pedidos.distinct("_id")) == {ObjectId(antigo_aberto), ObjectId(recente)}
+    assert await db[ARQUIVO_PEDIDOS].distinct("_id") == [ObjectId(antigo)]
+    assert await db.itens_pedidos.count_documents({"pedido_id": antigo}) == 0
+    assert await db[ARQUIVO_ITENS].count_documents({"pedido_id": antigo}) == 1
+
+    assert await precisa_arquivo(db, datetime(2020, 1, 1))
+    assert not await precisa_arquivo(db, datetime(2021, 1, 1))
+
+
+async def test_leitura_por_id_cai_no_arquivo(api):
+    pedido_id = await _pedido_com_item(api, "entregue", "2020-03-01T10:00:00")
+    await api.post("/admin/pedidos/arquivar")
+
+    resposta = await api.get(f"/pedidos/pedido/{pedido_id}", params={"incluir_itens": True})
+    assert resposta.status_code == 200
+    assert resposta.json()["status"] == "entregue"
+    assert [item["roupa_id"] for item in resposta.json()["itens"]] == ["r1"]
+
+    lote = (await api.get("/pedidos/batch", params={"ids": [pedido_id]})).json()
+    assert lote["nao_encontrados"] == []
+
+    itens = (await api.get(f"/consultas/itensPedidoPorPedido/{pedido_id}")).json()["data"]
+    assert [item["quantidade"] for item in itens] == [2]
+
+
+async def test_pedido_arquivado_e_somente_leitura(api):
+    pedido_id = await _pedido_com_item(api, "entregue", "2020-03-01T10:00:00")
+    await api.post("/admin/pedidos/arquivar")
+
+    resposta = await api.put(f"/pedidos/{pedido_id}", json=novo_pedido(status="cancelado", data="2020-03-01T10:00:00"))
+
+    assert resposta.status_code == 404
+
+
+@so_colecao
+async def test_pedido_alterado_depois_da_copia_continua_quente(api, db):
+    pedido_id = await _pedido_com_item(api, "entregue", "2020-03-01T10:00:00")
+    copia = await db.pedidos.find({}).to_list(None)
+
+    # escrita concorrente entre a leitura do lote e a remoção
+    await api.patch(f"/pedidos/{pedido_id}", json={"valor_total": 1.0})
+    movidos, mantidos = await _arquivar_lote(db, copia, "colecao")
+
+    assert (movidos, mantidos) == (0, 1)
+    assert await db.pedidos.count_documents({}) == 1
+    assert await db[ARQUIVO_PEDIDOS].count_documents({}) == 0
+    assert await db.itens_pedidos.count_documents({"pedido_id": pedido_id}) == 1
+
+
+@so_colecao
+async def test_item_incluido_depois_da_copia_vai_para_o_arquivo(api, db):
+    pedido_id = await _pedido_com_item(api, "entregue", "2020-03-01T10:00:00")
+    copia = await db.pedidos.find({}).to_list(None)
+
+    await api.post("/itensPedidos/", json=novo_item(pedido_id, roupa_id="r2"))
+    movidos, _ = await _arquivar_lote(db, copia, "colecao")
+
+    assert movidos == 1
+    assert await db.itens_pedidos.count_documents({}) == 0
+    assert sorted(await db[ARQUIVO_ITENS].distinct("roupa_id")) == ["r1", "r2"]
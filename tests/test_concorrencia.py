@@ -0,0 +1,82 @@
+import pytest
+
+from conftest import novo_cliente
+
+pytestmark = pytest.mark.anyio
+
+
+async def _criar_cliente(api):
+    return (await api.post("/clientes/", json=novo_cliente())).json()["_id"]
+
+
+async def test_if_match_com_versao_antiga_retorna_412(api):
+    cliente_id = await _criar_cliente(api)
+    etag = (await api.get(f"/clientes/cliente/{cliente_id}")).headers["ETag"]
+    assert etag == '"0"'
+
+    resposta = await api.patch(f"/clientes/{cliente_id}", json={"telefone": "1"}, headers={"If-Match": etag})
+    assert resposta.status_code == 200
+    assert resposta.headers["ETag"] == '"1"'
+
+    # quem ainda tem o ETag "0" não sobrescreve a escrita anterior
+    resposta = await api.patch(f"/clientes/{cliente_id}", json={"telefone": "2"}, headers={"If-Match": etag})
+    assert resposta.status_code == 412
+
+    cliente = await api.get(f"/clientes/cliente/{cliente_id}")
+    assert cliente.json()["telefone"] == "1"
+    assert cliente.headers["ETag"] == '"1"'
+
+
+async def test_if_match_vale_para_put(api):
+    cliente_id = await _criar_cliente(api)
+    await api.patch(f"/clientes/{cliente_id}", json={"telefone": "1"})
+
+    resposta = await api.put(f"/clientes/{cliente_id}", json=novo_cliente(nome="Outra"), headers={"If-Match": '"0"'})
+    assert resposta.status_code == 412
+
+    resposta = await api.put(f"/clientes/{cliente_id}", json=novo_cliente(nome="Outra"), headers={"If-Match": '"1"'})
+    assert resposta.status_code == 200
+
+
+async def test_if_match_invalido_retorna_400(api):
+    cliente_id = await _criar_cliente(api)
+
+    resposta = await api.patch(f"/clientes/{cliente_id}", json={"telefone": "1"}, headers={"If-Match": "abc"})
+
+    assert resposta.status_code == 400
+
+
+async def test_patch_com_objeto_vazio_nao_apaga_o_embutido(api):
+    cliente_id = await _criar_cliente(api)
+
+    resposta = await api.patch(f"/clientes/{cliente_id}", json={"endereco": {}})
+    assert resposta.status_code == 400
+
+    cliente = (await api.get(f"/clientes/cliente/{cliente_id}")).json()
+    assert cliente["endereco"]["cidade"] == "Recife"
+
+
+async def test_patch_de_embutido_altera_so_os_campos_enviados(api):
+    cliente_id = await _criar_cliente(api)
+
+    resposta = await api.patch(f"/clientes/{cliente_id}", json={"endereco": {"cidade": "Olinda"}})
+    assert resposta.status_code == 200
+
+    endereco = (await api.get(f"/clientes/cliente/{cliente_id}")).json()["endereco"]
+    assert endereco["cidade"] == "Olinda"
+    assert endereco["rua"] == "Rua A"
+
+
+async def test_upsert_em_lote_preserva_a_versao(api):
+    cliente_id = await _criar_cliente(api)
+    await api.patch(f"/clientes/{cliente_id}", json={"telefone": "1"})
+
+    resposta = await api.post("/clientes/bulk", json=[{**novo_cliente(nome="Lote"), "_id": cliente_id}])
+    assert resposta.json()["gravados"] == 1
+
+    cliente = await api.get(f"/clientes/cliente/{cliente_id}")
+    assert cliente.json()["nome"] == "Lote"
+    assert cliente.headers["ETag"] == '"2"'
+
+    resposta = await api.patch(f"/clientes/{cliente_id}", json={"telefone": "3"}, headers={"If-Match": '"1"'})
+    assert resposta.status_code == 412
@@ -0,0 +1,68 @@
+import json
+
+import pytest
+
+from conftest import novo_cliente
+
+pytestmark = pytest.mark.anyio
+
+NDJSON = {"Content-Type": "application/x-ndjson"}
+
+
+async def test_erros_por_linha_nao_impedem_os_validos(api, db):
+    valido = novo_cliente()
+    sem_nome = {campo: valor for campo, valor in novo_cliente().items() if campo != "nome"}
+    corpo = "\n".join([
+        json.dumps(valido),
+        "",
+        '{"nome": ',
+        "[1, 2]",
+        json.dumps(sem_nome),
+        json.dumps({**novo_cliente(nome="Outro"), "_id": "id-ruim"}),
+        json.dumps(novo_cliente(nome="Beto")),
+    ])
+
+    resposta = await api.post("/clientes/bulk", content=corpo, headers=NDJSON)
+    assert resposta.status_code == 200
+
+    resultado = resposta.json()
+    assert resultado["gravados"] == 2
+    assert [linha["indice"] for linha in resultado["data"]] == [0, 5]
+    assert await db.clientes.count_documents({}) == 2
+
+    erros = {erro["indice"]: erro for erro in resultado["erros"]}
+    assert sorted(erros) == [1, 2, 3, 4]
+    # a linha em branco não conta como item, mas conta na numeração das linhas
+    assert erros[1] == {"indice": 1, "linha": 3, "erro": "JSON inválido na linha 3"}
+    assert erros[2]["erro"] == "Item não é um objeto JSON"
+    assert erros[3]["erro"][0]["loc"] == ["nome"]
+    assert erros[4]["erro"] == "ID inválido"
+
+
+async def test_lista_json_reporta_erros_por_indice(api):
+    resposta = await api.post("/clientes/bulk", json=[novo_cliente(), "texto", novo_cliente(nome="Beto")])
+
+    resultado = resposta.json()
+    assert resultado["gravados"] == 2
+    assert resultado["erros"] == [{"indice": 1, "erro": "Item não é um objeto JSON"}]
+
+
+async def test_corpo_que_nao_e_lista_retorna_400(api):
+    resposta = await api.post("/clientes/bulk", json=novo_cliente())
+
+    assert resposta.status_code == 400
+
+
+async def test_tamanho_lote_fora_do_limite_retorna_400(api):
+    resposta = await api.post("/clientes/bulk", params={"tamanho_lote": 0}, json=[novo_cliente()])
+
+    assert resposta.status_code == 400
+
+
+async def test_lotes_pequenos_gravam_tudo(api, db):
+    corpo = "\n".join(json.dumps(novo_cliente(nome=f"Cliente {i}")) for i in range(7))
+
+    resposta = await api.post("/clientes/bulk", params={"tamanho_lote": 3}, content=corpo, headers=NDJSON)
+
+    assert resposta.json()["gravados"] == 7
+    assert await db.clientes.count_documents({}) == 7
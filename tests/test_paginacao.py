@@ -0,0 +1,60 @@
+import base64
+
+import pytest
+
+from conftest import novo_cliente
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_cursor_percorre_todos_os_documentos_sem_repetir(api):
+    ids = [(await api.post("/clientes/", json=novo_cliente(nome=f"Cliente {i}"))).json()["_id"] for i in range(23)]
+
+    vistos, cursor, paginas = [], None, 0
+    while True:
+        params = {"paginacao": "cursor", "limit": 10, "contar_total": False}
+        if cursor:
+            params["cursor"] = cursor
+        resposta = await api.get("/clientes/", params=params)
+        assert resposta.status_code == 200
+
+        corpo = resposta.json()
+        vistos += [cliente["_id"] for cliente in corpo["data"]]
+        paginas += 1
+        cursor = corpo["metadados"]["next_cursor"]
+        if not cursor:
+            break
+
+    assert vistos == sorted(ids)
+    assert paginas == 3
+
+
+async def test_cursor_igual_ao_offset(api):
+    for i in range(5):
+        await api.post("/clientes/", json=novo_cliente(nome=f"Cliente {i}"))
+
+    offset = (await api.get("/clientes/", params={"limit": 3})).json()["data"]
+    pagina = (await api.get("/clientes/", params={"paginacao": "cursor", "limit": 3})).json()
+
+    assert [cliente["_id"] for cliente in pagina["data"]] == [cliente["_id"] for cliente in offset]
+    assert pagina["metadados"]["next_cursor"]
+
+
+@pytest.mark.parametrize("cursor", [
+    "!!!nao-e-base64",
+    base64.urlsafe_b64encode(b"\xff\xfe").decode(),
+    base64.urlsafe_b64encode(b"[1, 2]").decode(),
+    base64.urlsafe_b64encode(b'{"outro": 1}').decode(),
+    base64.urlsafe_b64encode(b'{"_id": {"$oid": "zz"}}').decode(),
+])
+async def test_cursor_invalido_retorna_400(api, cursor):
+    resposta = await api.get("/clientes/", params={"paginacao": "cursor", "cursor": cursor})
+
+    assert resposta.status_code == 400
+    assert resposta.json()["detail"] == "Cursor inválido"
+
+
+async def test_paginacao_desconhecida_retorna_400(api):
+    resposta = await api.get("/clientes/", params={"paginacao": "pagina"})
+
+    assert resposta.status_code == 400